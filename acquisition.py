@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Background acquisition of Kinect frames.
+Polls a KinectRuntime at sensor rate on its own thread and publishes frames
+into a bounded ring buffer with latest-wins semantics.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import numpy
+import threading
+import time
+
+from recording import BODY_COUNT
+
+
+# KinectFrame class
+class KinectFrame(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, worker=None):
+        # sequence number, host timestamp and time.perf_counter time at which
+        # the shown frame was captured
+        self.index = -1
+        self.timestamp = 0.0
+        self.captureTime = 0.0
+        
+        # preview image and joint coordinates of tracked bodies; bodies is a
+        # view of a buffer preallocated for the most bodies the sensor tracks
+        self.image = None
+        self.bodies = numpy.zeros((0, 0))
+        self._bodyRows = None
+        
+        # publish sequence number and the worker which refills this frame
+        self.seq = -1
+        self._worker = worker
+        
+        return
+    
+    # ~~~~~~~~ frame not reused since it was read ~~~~~~~~
+    def valid(self):
+        # check after consuming the arrays; readers get a copy of the frame
+        # (see FrameRingBuffer) so seq is the one read, and a False result
+        # means the worker started refilling the arrays meanwhile
+        if self.seq < 0:
+            return False
+        
+        return self._worker is None or self._worker.frameValid(self.seq)
+
+
+# FrameRingBuffer class
+class FrameRingBuffer(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, capacity=8):
+        self._capacity = capacity
+        self._slots = [None] * capacity
+        self._count = 0
+        self._condition = threading.Condition(threading.Lock())
+        
+        return
+    
+    # ~~~~~~~~ number of published frames ~~~~~~~~
+    def count(self):
+        with self._condition:
+            return self._count
+    
+    # ~~~~~~~~ publish frame ~~~~~~~~
+    def publish(self, frame):
+        with self._condition:
+            self._slots[self._count % self._capacity] = frame
+            self._count += 1
+            self._condition.notify_all()
+        
+        return
+    
+    # ~~~~~~~~ newest frame ~~~~~~~~
+    def latest(self):
+        # frames are shallow copies which share the arrays but keep the
+        # sequence number they were published with
+        with self._condition:
+            if self._count == 0:
+                return None
+            return copy.copy(self._slots[(self._count - 1) % self._capacity])
+    
+    # ~~~~~~~~ read every frame since cursor ~~~~~~~~
+    def read(self, cursor, timeout=None):
+        # returns frames published since cursor, the new cursor and the number
+        # of frames overwritten before they could be read
+        with self._condition:
+            if self._count <= cursor and timeout != 0:
+                self._condition.wait_for(lambda: self._count > cursor, timeout)
+            first = max(cursor, self._count - self._capacity)
+            dropped = first - cursor
+            frames = [copy.copy(self._slots[i % self._capacity]) for i in range(first, self._count)]
+            return frames, self._count, dropped
+
+
+# AcquisitionWorker class
+class AcquisitionWorker(threading.Thread):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, runtime, capacity=8):
+        super(AcquisitionWorker, self).__init__()
+        self.daemon = True
+        
+        # kinect runtime and output buffer
+        self.runtime = runtime
+        self.buffer = FrameRingBuffer(capacity)
+        
+        # preallocated frames reused in ring order; one spare frame is filled
+        # while the ring holds the others so a published frame stays valid
+        # until capacity newer frames have been published
+        self._frames = [KinectFrame(self) for _ in range(capacity + 1)]
+        self._filling = -1
+        self._stopEvent = threading.Event()
+        
+        return
+    
+    # ~~~~~~~~ acquisition loop ~~~~~~~~
+    def run(self):
+        lastIndex = self.runtime.frameIndex()
+        count = 0
+        while not self._stopEvent.is_set():
+            image = self.runtime.getFrame()
+            index = self.runtime.frameIndex()
+            if index == lastIndex:
+                continue
+            lastIndex = index
+            frame = self._frames[count % len(self._frames)]
+            self._filling = count
+            if image is None:
+                frame.image = None
+            else:
+                if frame.image is None or frame.image.shape != image.shape:
+                    frame.image = numpy.empty_like(image)
+                numpy.copyto(frame.image, image)
+            bodies = self.runtime.bodyData()
+            if frame._bodyRows is None or frame._bodyRows.shape[1:] != bodies.shape[1:] or len(frame._bodyRows) < len(bodies):
+                frame._bodyRows = numpy.empty((max(len(bodies), BODY_COUNT),) + bodies.shape[1:], dtype=bodies.dtype)
+            frame.bodies = frame._bodyRows[:len(bodies)]
+            numpy.copyto(frame.bodies, bodies)
+            frame.seq = count
+            frame.index = index
+            frame.timestamp = time.time()
+            frame.captureTime = self.runtime.captureTime()
+            self.buffer.publish(frame)
+            count += 1
+        
+        return
+    
+    # ~~~~~~~~ frame of a sequence number not refilled yet ~~~~~~~~
+    def frameValid(self, seq):
+        # the frame object of seq is refilled with frame seq + len(frames)
+        return self._filling < seq + len(self._frames)
+    
+    # ~~~~~~~~ stop acquisition ~~~~~~~~
+    def stop(self, timeout=None):
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join(timeout)
+        
+        return
@@ -12,9 +12,8 @@ GitHub: https://github.com/prasunroy/kinect-toolbox
 from __future__ import division
 from __future__ import print_function
 
-import numpy
+import argparse
 import os
-import pandas
 import random
 import sys
 import webbrowser
@@ -24,21 +23,32 @@ from PyQt5.QtGui import QIcon, QImage, QMovie, QPixmap
 from PyQt5.QtWidgets import QApplication, QFrame, QWidget
 from PyQt5.QtWidgets import QGridLayout, QHBoxLayout, QVBoxLayout
 from PyQt5.QtWidgets import QDesktopWidget, QLabel, QLineEdit, QPushButton
-from PyQt5.QtWidgets import QFileDialog
-from matplotlib import pyplot
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
+from PyQt5.QtWidgets import QComboBox, QFileDialog, QMessageBox, QSlider
 
-from kinect import KinectRuntime
-from qtplot import QtPlot
+from instrumentation import Instrumentation
+from recording import BINARY_EXTENSION
+
+# matplotlib, pandas, pygame and PyKinect2 are imported on first use so that
+# the window is usable as soon as possible
 
 
 # MainGUI class
 class MainGUI(QWidget):
     
     # ~~~~~~~~ constructor ~~~~~~~~
-    def __init__(self):
+    def __init__(self, sources=None, rgbd=None, playback=None, realtime=True, profile=False, profileLog=None, overlay=True, processes=False,
+                 jointFilter=None, previewSource=None):
         super().__init__()
+        self.profile = Instrumentation(enabled=profile or profileLog is not None)
+        self.profileLog = profileLog
+        self.sources = sources
+        self.rgbd = rgbd
+        self.playback = playback
+        self.realtime = realtime
+        self.overlay = overlay
+        self.processes = processes
+        self.jointFilter = jointFilter
+        self.previewSource = previewSource
         self.init_UI()
         
         return
@@ -59,6 +69,12 @@ class MainGUI(QWidget):
         self.btn_conn_style_1 = 'QPushButton {background-color: #ff6464; border: none; color: #ffffff; font-family: ubuntu, arial; font-size: 16px;}'
         self.btn_conn.setStyleSheet(self.btn_conn_style_0)
         
+        # -- camera feed source (shown while connected to several sources) --
+        self.feed = QComboBox()
+        self.feed.setMinimumHeight(40)
+        self.feed.setToolTip('Camera feed')
+        self.feed.setVisible(False)
+        
         # -- select directory textbox --
         self.filepath = QLineEdit()
         self.filepath.setMinimumSize(250, 30)
@@ -107,21 +123,41 @@ class MainGUI(QWidget):
         self.cam_feed.setFrameStyle(QFrame.StyledPanel)
         self.cam_feed.setStyleSheet('QLabel {background-color: #000000;}')
         
-        # -- plot area --
-        self.figure = pyplot.figure()
-        self.figure.set_facecolor('#f5f5f5')
-        self.canvas = FigureCanvasQTAgg(self.figure)
-        self.canvas.setMinimumSize(640, 360)
-        self.toolbar = NavigationToolbar2QT(self.canvas, self)
-        
-        # -- animation --
-        self.movie = QMovie('assets/anim.gif')
+        # -- instrumentation overlay --
+        self.stats = QLabel(self.cam_feed)
+        self.stats.move(8, 8)
+        self.stats.setStyleSheet('QLabel {background-color: rgba(0, 0, 0, 160); color: #64ff64; font-family: monospace; font-size: 11px; padding: 4px;}')
+        self.stats.setVisible(self.profile.enabled)
+        
+        # -- plot area (figure, canvas and toolbar are created on first plot) --
+        self.plot_area = QFrame()
+        self.plot_area.setMinimumSize(640, 360)
+        self.plot_area.setStyleSheet('QFrame {background-color: #f5f5f5;}')
+        self.figure = None
+        self.canvas = None
+        self.toolbar = None
+        
+        # -- playback controls --
+        self.btn_play = QPushButton('Pause')
+        self.btn_play.setFixedSize(80, 24)
+        self.btn_play.setStyleSheet('QPushButton {background-color: #64a0ff; border: none; color: #ffffff; font-family: ubuntu, arial; font-size: 12px;}')
+        self.scrubber = QSlider(Qt.Horizontal)
+        self.scrubber.setRange(0, 0)
+        self.speed = QComboBox()
+        self.speed.addItems(['0.25x', '0.5x', '1x', '2x', '4x', '8x', '16x'])
+        self.speed.setCurrentText('1x')
+        self.speed.setToolTip('Playback speed')
+        self.bodies = QComboBox()
+        self.bodies.setToolTip('Tracked body')
+        self.bodies.setVisible(False)
+        self.setPlaybackEnabled(False)
+        
+        # -- animation (loaded once the window is shown) --
+        self.movie = None
         self.animation = QLabel()
         self.animation.setMinimumWidth(500)
         self.animation.setAlignment(Qt.AlignCenter)
         self.animation.setStyleSheet('QLabel {background-color: #ffffff;}')
-        self.animation.setMovie(self.movie)
-        self.movie.start()
         
         # -- control animation button --
         self.btn_anim = QPushButton()
@@ -148,6 +184,7 @@ class MainGUI(QWidget):
         # create layouts
         h_box1 = QHBoxLayout()
         h_box1.addWidget(self.btn_conn)
+        h_box1.addWidget(self.feed)
         
         h_box2 = QHBoxLayout()
         h_box2.addWidget(self.filepath)
@@ -180,8 +217,14 @@ class MainGUI(QWidget):
         
         v_box2 = QVBoxLayout()
         v_box2.addWidget(self.cam_feed)
-        v_box2.addWidget(self.toolbar)
-        v_box2.addWidget(self.canvas)
+        v_box2.addWidget(self.plot_area)
+        
+        h_box7 = QHBoxLayout()
+        h_box7.addWidget(self.btn_play)
+        h_box7.addWidget(self.scrubber)
+        h_box7.addWidget(self.speed)
+        h_box7.addWidget(self.bodies)
+        v_box2.addLayout(h_box7)
         
         g_box0 = QGridLayout()
         g_box0.addLayout(v_box1, 0, 0, -1, 2)
@@ -189,8 +232,20 @@ class MainGUI(QWidget):
         
         self.setLayout(g_box0)
         
-        # create Plot
-        self.qtplot = QtPlot(self.figure, self.canvas)
+        # plot is created on first use
+        self.qtplot = None
+        self.scrubbing = False
+        
+        # background import of text recordings
+        self.importer = None
+        self.import_timer = QTimer()
+        self.import_timer.timeout.connect(self.updateImport)
+        
+        # refresh instrumentation overlay and log
+        if self.profile.enabled:
+            self.stats_timer = QTimer()
+            self.stats_timer.timeout.connect(self.updateStats)
+            self.stats_timer.start(1000)
         
         # set slots for signals
         self.flg_conn = False
@@ -202,9 +257,55 @@ class MainGUI(QWidget):
         self.btn_path.clicked.connect(self.selectDirectory)
         self.btn_recd.clicked.connect(self.record)
         self.btn_plot.clicked.connect(self.plot)
+        self.btn_play.clicked.connect(self.togglePlayback)
+        self.scrubber.sliderPressed.connect(self.startScrubbing)
+        self.scrubber.sliderMoved.connect(self.seekPlot)
+        self.scrubber.sliderReleased.connect(self.stopScrubbing)
+        self.speed.currentTextChanged.connect(self.setPlaybackSpeed)
+        self.bodies.currentIndexChanged.connect(self.selectPlotBody)
+        self.feed.currentIndexChanged.connect(self.selectFeed)
         self.btn_anim.clicked.connect(self.toggleAnimation)
         self.btn_repo.clicked.connect(self.openRepository)
         
+        # deferred resources are loaded after the first paint
+        QTimer.singleShot(0, self.initAnimation)
+        
+        return
+    
+    # ~~~~~~~~ initialize animation ~~~~~~~~
+    def initAnimation(self):
+        if self.movie is None:
+            self.movie = QMovie('assets/anim.gif')
+        if self.flg_anim:
+            self.animation.setMovie(self.movie)
+            self.movie.start()
+        
+        return
+    
+    # ~~~~~~~~ initialize plot area ~~~~~~~~
+    def initPlot(self):
+        if self.qtplot is not None:
+            return
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+        from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
+        from matplotlib.figure import Figure
+        from qtplot import QtPlot
+        self.figure = Figure()
+        self.figure.set_facecolor('#f5f5f5')
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.canvas.setMinimumSize(640, 360)
+        self.toolbar = NavigationToolbar2QT(self.canvas, self)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.toolbar)
+        layout.addWidget(self.canvas)
+        self.plot_area.setLayout(layout)
+        self.qtplot = QtPlot(self.figure, self.canvas, self.profile)
+        if self.jointFilter:
+            from filters import createFilter
+            self.qtplot.jointFilter = createFilter(self.jointFilter)
+        self.qtplot.frameChanged = self.updateScrubber
+        
         return
     
     # ~~~~~~~~ window centering ~~~~~~~~
@@ -224,26 +325,99 @@ class MainGUI(QWidget):
         if self.flg_conn:
             self.btn_conn.setStyleSheet(self.btn_conn_style_1)
             self.btn_conn.setText('Disconnect Device')
-            self.device = KinectRuntime()
+            from kinect import previewSources
+            sources = previewSources(self.sources)
+            options = dict(preview=True, sources=self.sources, overlay=self.overlay)
+            if self.previewSource in sources:
+                options.update(previewSource=self.previewSource)
+            if self.jointFilter:
+                from filters import createFilter
+                options.update(jointFilter=createFilter(self.jointFilter))
+            if self.playback:
+                from playback import PlaybackRuntime as runtimeClass
+                options.update(path=self.playback, realtime=self.realtime)
+            else:
+                from kinect import KinectRuntime as runtimeClass
+            if self.processes:
+                # capture runs in its own process and publishes into shared memory
+                from sharedcapture import CaptureProcess
+                self.device = CaptureProcess(runtimeClass, options)
+                self.device.setFrameSize((None, self.cam_feed.height()))
+                self.device.start()
+                self.frames = self.device
+                self.worker = None
+            else:
+                from acquisition import AcquisitionWorker
+                self.device = runtimeClass(profile=self.profile, **options)
+                self.device.setFrameSize((None, self.cam_feed.height()))
+                self.worker = AcquisitionWorker(self.device)
+                self.worker.start()
+                self.frames = self.worker.buffer
             self.timer = QTimer()
             self.timer.timeout.connect(self.update)
             self.timer.start(50)
+            
+            # color and infrared feeds of the open sources
+            labels = {'color': 'Color', 'infrared': 'Infrared', 'longexposureinfrared': 'Long Exposure IR'}
+            self.feed.blockSignals(True)
+            self.feed.clear()
+            for source in sources:
+                self.feed.addItem(labels[source], source)
+            self.feed.setCurrentIndex(max(self.feed.findData(options.get('previewSource')), 0))
+            self.feed.blockSignals(False)
+            self.feed.setVisible(len(sources) > 1)
         else:
             self.btn_conn.setStyleSheet(self.btn_conn_style_0)
             self.btn_conn.setText('Connect Device')
+            self.feed.setVisible(False)
             self.cam_feed.clear()
             self.timer.stop()
+            if self.worker is not None:
+                self.worker.stop()
             self.device.clear()
         
         return
     
     # ~~~~~~~~ update ~~~~~~~~
     def update(self):
+        t = self.profile.start()
+        if self.worker is None and not self.device.is_alive():
+            # a crashed capture process only takes the camera feed down
+            exitcode = self.device.exitcode()
+            self.connect()
+            QMessageBox.warning(self, 'Connect Device', 'Capture process exited with code {}'.format(exitcode))
+            return
         self.device.setFrameSize((None, self.cam_feed.height()))
-        frame = self.device.getFrame()
-        frame = numpy.transpose(frame, (1, 0, 2)).copy()
-        frame = QImage(frame, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_RGB888)
-        self.cam_feed.setPixmap(QPixmap.fromImage(frame))
+        frame = self.frames.latest()
+        if frame is None or frame.image is None:
+            return
+        image = QImage(frame.image.data, frame.image.shape[1], frame.image.shape[0], frame.image.strides[0], QImage.Format_RGB32)
+        pixmap = QPixmap.fromImage(image)
+        if not frame.valid():
+            return
+        self.cam_feed.setPixmap(pixmap)
+        self.profile.stamp('update', t)
+        # capture to display latency of the shown frame
+        self.profile.latency('latency', frame.captureTime)
+        
+        return
+    
+    # ~~~~~~~~ select camera feed ~~~~~~~~
+    def selectFeed(self, i):
+        if not self.flg_conn or i < 0:
+            return
+        self.previewSource = self.feed.itemData(i)
+        self.device.setPreviewSource(self.previewSource)
+        
+        return
+    
+    # ~~~~~~~~ update instrumentation overlay ~~~~~~~~
+    def updateStats(self):
+        self.stats.setText(self.profile.text() or 'waiting for frames...')
+        self.stats.adjustSize()
+        self.stats.raise_()
+        if self.profileLog:
+            self.profile.export(self.profileLog)
         
         return
     
@@ -261,12 +435,11 @@ class MainGUI(QWidget):
             return
         
         self.flg_recd = not self.flg_recd
-        self.device._kinectDump = self.flg_recd
         
         if self.flg_recd:
             if not self.filename.text():
                 self.filename.setText('temp.txt')
-            elif os.path.splitext(self.filename.text())[-1] != '.txt':
+            elif os.path.splitext(self.filename.text())[-1] not in ('.txt', '.kbin'):
                 self.filename.setText(''.join([self.filename.text(), '.txt']))
             
             fname, fextn = os.path.splitext(self.filename.text())
@@ -277,10 +450,15 @@ class MainGUI(QWidget):
                 name = ''.join(['_'.join([fname, hex8]), fextn])
                 absolutePath = os.path.join(self.filepath.text(), name)
             
-            self.device._kinectFile = absolutePath
+            if self.processes:
+                # skeletons are recorded by a recorder process attached to the shared ring
+                self.device.startRecording(absolutePath)
+            else:
+                self.device.startRecording(absolutePath, rgbd=self.rgbd)
             self.btn_recd.setStyleSheet(self.btn_recd_style_1)
             self.btn_recd.setText('Stop Recording')
         else:
+            self.device.stopRecording()
             self.btn_recd.setStyleSheet(self.btn_recd_style_0)
             self.btn_recd.setText('Start Recording')
         
@@ -290,24 +468,169 @@ class MainGUI(QWidget):
     def plot(self):
         self.flg_plot = not self.flg_plot
         if self.flg_plot:
-            path = QFileDialog.getOpenFileName(self, 'Import Kinect Data', os.getenv('HOME'), 'Kinect Data (*.txt *.csv)')[0]
+            path = QFileDialog.getOpenFileName(self, 'Import Kinect Data', os.getenv('HOME'), 'Kinect Data (*.txt *.csv *.kbin)')[0]
             if not path:
                 self.flg_plot = not self.flg_plot
                 return
-            extn = os.path.splitext(path)[-1]
-            if extn == '.txt':
-                data = pandas.read_csv(path, sep=' ', header=None).values
-            elif extn == '.csv':
-                data = pandas.read_csv(path, sep=',', header=None).values
             self.plotfile.setText(os.path.normpath(path))
             self.btn_plot.setStyleSheet(self.btn_plot_style_1)
-            self.btn_plot.setText('Clear Plot')
-            self.qtplot.plot(data)
+            if os.path.splitext(path)[-1].lower() == BINARY_EXTENSION:
+                from recording import loadBinary
+                try:
+                    records = loadBinary(path)
+                except (IOError, ValueError) as error:
+                    QMessageBox.warning(self, 'Import Kinect Data', str(error))
+                    self.plot()
+                    return
+                self.btn_plot.setText('Clear Plot')
+                self.startPlot(records)
+                return
+            # text recordings are parsed in the background and played while importing
+            from importer import TextImporter
+            try:
+                self.importer = TextImporter(path)
+            except (IOError, ValueError) as error:
+                QMessageBox.warning(self, 'Import Kinect Data', str(error))
+                self.plot()
+                return
+            self.importer.start()
+            self.import_timer.start(100)
+            self.btn_plot.setText('Cancel Import')
         else:
+            if self.importer is not None:
+                self.import_timer.stop()
+                self.importer.cancel()
+                self.importer = None
             self.btn_plot.setStyleSheet(self.btn_plot_style_0)
             self.btn_plot.setText('Import Kinect Data')
             self.plotfile.clear()
-            self.qtplot.clear()
+            if self.qtplot is not None:
+                self.qtplot.clear()
+            self.bodies.setVisible(False)
+            self.scrubber.setRange(0, 0)
+            self.setPlaybackEnabled(False)
+        
+        return
+    
+    # ~~~~~~~~ start plot playback ~~~~~~~~
+    def startPlot(self, data, timestamps=None):
+        # data are joint rows or binary records of which one body is plotted
+        self.initPlot()
+        self.setPlaybackSpeed(self.speed.currentText())
+        self.qtplot.plot(data, timestamps)
+        if self.qtplot.data is None:
+            QMessageBox.warning(self, 'Import Kinect Data', 'The recording contains no tracked body joints.')
+            self.plot()
+            return
+        self.scrubber.setRange(0, self.qtplot.dataTail)
+        self.btn_play.setText('Pause')
+        self.setPlaybackEnabled(True)
+        
+        # body selector for recordings of several bodies
+        bodies = self.qtplot.bodies()
+        self.bodies.blockSignals(True)
+        self.bodies.clear()
+        for i, body in enumerate(bodies):
+            self.bodies.addItem('Body {}'.format(i + 1), body)
+        self.bodies.blockSignals(False)
+        self.bodies.setVisible(len(bodies) > 1)
+        
+        return
+    
+    # ~~~~~~~~ plot the selected body ~~~~~~~~
+    def selectPlotBody(self, i):
+        if self.qtplot is None or i < 0:
+            return
+        self.qtplot.selectBody(self.bodies.itemData(i))
+        self.scrubber.setRange(0, self.qtplot.dataTail)
+        self.btn_play.setText('Pause')
+        
+        return
+    
+    # ~~~~~~~~ follow background import ~~~~~~~~
+    def updateImport(self):
+        importer = self.importer
+        if importer is None:
+            return
+        if importer.error is not None:
+            self.import_timer.stop()
+            QMessageBox.warning(self, 'Import Kinect Data', str(importer.error))
+            self.plot()
+            return
+        data = importer.available()
+        if (len(data) or importer.done) and (self.qtplot is None or self.qtplot.data is None):
+            # an import which finishes without rows is reported and cleared
+            self.startPlot(data)
+            if self.qtplot.data is None:
+                return
+        elif len(data):
+            self.qtplot.extend(data)
+            self.scrubber.setRange(0, len(data) - 1)
+        path = os.path.normpath(importer.path)
+        if importer.done:
+            self.import_timer.stop()
+            self.importer = None
+            self.plotfile.setText(path)
+            self.btn_plot.setText('Clear Plot')
+        else:
+            self.plotfile.setText('{} ({:.0f}%)'.format(path, 100 * importer.progress()))
+        
+        return
+    
+    # ~~~~~~~~ enable playback controls ~~~~~~~~
+    def setPlaybackEnabled(self, enabled):
+        self.btn_play.setEnabled(enabled)
+        self.scrubber.setEnabled(enabled)
+        self.speed.setEnabled(enabled)
+        
+        return
+    
+    # ~~~~~~~~ toggle playback ~~~~~~~~
+    def togglePlayback(self):
+        if self.qtplot.playing:
+            self.qtplot.pause()
+            self.btn_play.setText('Play')
+        else:
+            self.qtplot.play()
+            self.btn_play.setText('Pause')
+        
+        return
+    
+    # ~~~~~~~~ set playback speed ~~~~~~~~
+    def setPlaybackSpeed(self, text):
+        if self.qtplot is not None:
+            self.qtplot.setSpeed(float(text.rstrip('x')))
+        
+        return
+    
+    # ~~~~~~~~ seek plot to the scrubber position ~~~~~~~~
+    def seekPlot(self, i):
+        if self.qtplot is not None:
+            self.qtplot.seek(i)
+        
+        return
+    
+    # ~~~~~~~~ pause while the scrubber is dragged ~~~~~~~~
+    def startScrubbing(self):
+        self.scrubbing = self.qtplot.playing
+        self.qtplot.pause()
+        
+        return
+    
+    # ~~~~~~~~ resume after the scrubber is released ~~~~~~~~
+    def stopScrubbing(self):
+        self.qtplot.seek(self.scrubber.value())
+        if self.scrubbing:
+            self.qtplot.play()
+        
+        return
+    
+    # ~~~~~~~~ follow playback with the scrubber ~~~~~~~~
+    def updateScrubber(self, i):
+        if not self.scrubber.isSliderDown():
+            self.scrubber.blockSignals(True)
+            self.scrubber.setValue(i)
+            self.scrubber.blockSignals(False)
         
         return
     
@@ -315,9 +638,8 @@ class MainGUI(QWidget):
     def toggleAnimation(self):
         self.flg_anim = not self.flg_anim
         if self.flg_anim:
-            self.animation.setMovie(self.movie)
-            self.movie.start()
-        else:
+            self.initAnimation()
+        elif self.movie is not None:
             self.movie.stop()
             self.animation.clear()
         
@@ -334,7 +656,7 @@ class MainGUI(QWidget):
         if self.flg_conn:
             self.connect()
         if self.flg_plot:
-            self.qtplot.clear()
+            self.plot()
         if self.flg_anim:
             self.toggleAnimation()
         
@@ -343,9 +665,33 @@ class MainGUI(QWidget):
 
 # main
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description='Kinect data acquisition and visualization toolbox.')
+    parser.add_argument('--sources', default=None,
+                        help='comma separated frame sources to open (default: color,depth,body)')
+    parser.add_argument('--rgbd', default=None, choices=['depth', 'jpeg', 'png', 'raw'],
+                        help='also record raw depth, infrared (if open) and optionally color frames in the given format')
+    parser.add_argument('--feed', default=None, choices=['color', 'infrared', 'longexposureinfrared'],
+                        help='camera feed shown on connect (its source must be open, e.g. --sources infrared,depth,body)')
+    parser.add_argument('--playback', default=None, metavar='PATH',
+                        help='replay a recording instead of connecting to the sensor')
+    parser.add_argument('--fast', action='store_true',
+                        help='replay as fast as possible instead of at the original timing')
+    parser.add_argument('--profile', action='store_true',
+                        help='show per stage latency and dropped frames on screen')
+    parser.add_argument('--profile-log', default=None, metavar='PATH',
+                        help='also append instrumentation summaries to this file every second')
+    parser.add_argument('--no-overlay', action='store_true',
+                        help='do not draw skeletons on the camera feed')
+    parser.add_argument('--processes', action='store_true',
+                        help='capture and record in separate processes over shared memory (no raw RGB-D streams)')
+    parser.add_argument('--filter', default=None, choices=['ema', 'holt', 'oneeuro'],
+                        help='smooth live and plotted joints with this temporal filter (recordings stay unfiltered)')
+    args, qtargs = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qtargs)
     app.setStyle('Fusion')
-    gui = MainGUI()
+    gui = MainGUI(sources=args.sources, rgbd=args.rgbd, playback=args.playback, realtime=not args.fast,
+                  profile=args.profile, profileLog=args.profile_log, overlay=not args.no_overlay,
+                  processes=args.processes, jointFilter=args.filter, previewSource=args.feed)
     gui.show()
     gui.moveWindowToCenter()
     sys.exit(app.exec_())
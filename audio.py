@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+Audio beam capture for Kinect sessions.
+Sub-frames of the beamformed microphone array signal are pulled on their
+own thread into a preallocated single producer, single consumer ring and
+written to WAV (or FLAC) segments by a background writer together with a
+log of beam angle and confidence per sub-frame. Sub-frames are timestamped
+on the clock of skeleton recordings so that gestures can be aligned with
+the sound track.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import ctypes
+import math
+import numpy
+import os
+import threading
+import time
+import wave
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+try:
+    from _ctypes import COMError
+except ImportError:
+    COMError = OSError
+
+
+# Kinect v2 audio beam: 16 kHz mono float samples in sub-frames of 16 ms
+SAMPLE_RATE = 16000
+SUBFRAME_SAMPLES = 256
+
+# beam angle and confidence of every sub-frame; sensor time is the SDK
+# relative time in seconds and timestamp the time.time() clock of skeleton
+# recordings, segment and sample locate the sub-frame in the audio files
+BEAM_LOG = numpy.dtype([('timestamp', '<f8'), ('sensorTime', '<f8'), ('segment', '<i4'), ('sample', '<i8'),
+                        ('angle', '<f4'), ('confidence', '<f4')])
+
+# audio file formats (FLAC needs the soundfile package)
+AUDIO_FORMATS = ('wav', 'flac')
+
+
+# ~~~~~~~~ load beam log ~~~~~~~~
+def loadBeamLog(path):
+    return numpy.atleast_1d(numpy.loadtxt(path, dtype=BEAM_LOG))
+
+
+# ~~~~~~~~ audio position of skeleton timestamps ~~~~~~~~
+def sampleAt(beamLog, timestamps, rate=SAMPLE_RATE):
+    # (segment, sample) of the audio files at the given time.time() timestamps,
+    # interpolated from the sub-frame nearest before each timestamp
+    timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+    i = numpy.clip(numpy.searchsorted(beamLog['timestamp'], timestamps, side='right') - 1, 0, len(beamLog) - 1)
+    offset = numpy.maximum(numpy.rint((timestamps - beamLog['timestamp'][i]) * rate), 0).astype(numpy.int64)
+    
+    return beamLog['segment'][i], beamLog['sample'][i] + offset
+
+
+# SyntheticAudioSource class
+class SyntheticAudioSource(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, start=None, frequency=440.0, rate=SAMPLE_RATE, subframeSamples=SUBFRAME_SAMPLES, seed=0):
+        # sub-frames become available in real time from start (time.time()),
+        # which is relative time zero like the frames of stand-in sensors; a
+        # tone with noise is heard from a beam sweeping left and right
+        self.rate = rate
+        self.subframeSamples = subframeSamples
+        self.frequency = frequency
+        self._start = time.time() if start is None else start
+        self._next = int((time.time() - self._start) * rate / subframeSamples)
+        self._random = numpy.random.RandomState(seed)
+        
+        # like the sensor, at most about a second of sub-frames is kept
+        self._backlog = rate // subframeSamples
+        
+        return
+    
+    # ~~~~~~~~ sub-frames since the last read ~~~~~~~~
+    def read(self):
+        # (samples (n, subframeSamples) float32, sensor times (n,) seconds,
+        # beam angles (n,) radians, confidences (n,)) or None
+        due = int((time.time() - self._start) * self.rate / self.subframeSamples)
+        if due <= self._next:
+            return None
+        self._next = max(self._next, due - self._backlog)
+        n = due - self._next
+        first = self._next * self.subframeSamples
+        t = (first + numpy.arange(n * self.subframeSamples)) / self.rate
+        samples = 0.1 * numpy.sin(2.0 * math.pi * self.frequency * t) + self._random.normal(0, 0.01, len(t))
+        times = (self._next + numpy.arange(n)) * self.subframeSamples / self.rate
+        angles = 0.6 * numpy.sin(0.5 * times)
+        confidences = 0.5 + 0.5 * numpy.abs(numpy.cos(0.5 * times))
+        self._next = due
+        
+        return samples.astype(numpy.float32).reshape(n, self.subframeSamples), times, angles, confidences
+    
+    # ~~~~~~~~ close ~~~~~~~~
+    def close(self):
+        return
+
+
+# KinectAudioSource class
+class KinectAudioSource(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, kinect):
+        # audio beam frame reader of the sensor opened by a PyKinectRuntime
+        self.rate = SAMPLE_RATE
+        self.subframeSamples = SUBFRAME_SAMPLES
+        self._reader = kinect._sensor.AudioSource.OpenReader()
+        
+        return
+    
+    # ~~~~~~~~ sub-frames since the last read ~~~~~~~~
+    def read(self):
+        # same layout as SyntheticAudioSource.read; the sensor keeps about a
+        # second of sub-frames between reads
+        try:
+            frames = self._reader.AcquireLatestBeamFrames()
+        except COMError:
+            # no sub-frames since the last read
+            return None
+        if not frames or frames.BeamCount == 0:
+            return None
+        frame = frames.OpenAudioBeamFrame(0)
+        n = frame.SubFrameCount
+        if n == 0:
+            return None
+        samples = numpy.zeros((n, self.subframeSamples), dtype=numpy.float32)
+        times = numpy.empty(n)
+        angles = numpy.empty(n)
+        confidences = numpy.empty(n)
+        for i in range(n):
+            subframe = frame.GetSubFrame(i)
+            size, buffer = subframe.AccessUnderlyingBuffer()
+            count = min(size // 4, self.subframeSamples)
+            samples[i, :count] = numpy.ctypeslib.as_array(ctypes.cast(buffer, ctypes.POINTER(ctypes.c_float)), (count,))
+            times[i] = subframe.RelativeTime / 1e7
+            angles[i] = subframe.BeamAngle
+            confidences[i] = subframe.BeamAngleConfidence
+        
+        return samples, times, angles, confidences
+    
+    # ~~~~~~~~ close ~~~~~~~~
+    def close(self):
+        self._reader = None
+        
+        return
+
+
+# ~~~~~~~~ open audio source of a sensor runtime ~~~~~~~~
+def openAudioSource(kinect):
+    # stand-in sensors provide their own audio source
+    if hasattr(kinect, 'open_audio_source'):
+        return kinect.open_audio_source()
+    
+    return KinectAudioSource(kinect)
+
+
+# AudioRing class
+class AudioRing(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, capacity=512, subframeSamples=SUBFRAME_SAMPLES):
+        # preallocated sub-frames with one producer and one consumer thread;
+        # each side only advances its own counter (after filling or reading
+        # the slots) so neither needs a lock, and a full ring drops new
+        # sub-frames instead of blocking the producer
+        self.capacity = capacity
+        self.samples = numpy.zeros((capacity, subframeSamples), dtype=numpy.float32)
+        self.log = numpy.zeros(capacity, dtype=BEAM_LOG)
+        self.dropped = 0
+        self._written = 0
+        self._read = 0
+        
+        return
+    
+    # ~~~~~~~~ number of sub-frames waiting to be read ~~~~~~~~
+    def pending(self):
+        return self._written - self._read
+    
+    # ~~~~~~~~ copy sub-frames in (producer) ~~~~~~~~
+    def push(self, samples, sensorTimes, timestamps, angles, confidences):
+        # returns the number of sub-frames stored
+        n = min(len(samples), self.capacity - self.pending())
+        self.dropped += len(samples) - n
+        for start, stop in self._spans(self._written, n):
+            count = stop - start
+            self.samples[start:stop] = samples[:count]
+            log = self.log[start:stop]
+            log['sensorTime'] = sensorTimes[:count]
+            log['timestamp'] = timestamps[:count]
+            log['angle'] = angles[:count]
+            log['confidence'] = confidences[:count]
+            samples, sensorTimes, timestamps = samples[count:], sensorTimes[count:], timestamps[count:]
+            angles, confidences = angles[count:], confidences[count:]
+        self._written += n
+        
+        return n
+    
+    # ~~~~~~~~ views of waiting sub-frames (consumer) ~~~~~~~~
+    def peek(self):
+        # at most two (samples, log) views in ring order; they stay valid
+        # until released
+        return [(self.samples[start:stop], self.log[start:stop]) for start, stop in self._spans(self._read, self.pending())]
+    
+    # ~~~~~~~~ hand read sub-frames back to the producer (consumer) ~~~~~~~~
+    def release(self, count):
+        self._read += count
+        
+        return
+    
+    # ~~~~~~~~ contiguous slot ranges of count sub-frames from a counter ~~~~~~~~
+    def _spans(self, counter, count):
+        start = counter % self.capacity
+        first = min(count, self.capacity - start)
+        spans = [(start, start + first)] if first else []
+        if count > first:
+            spans.append((0, count - first))
+        
+        return spans
+
+
+# AudioCapture class
+class AudioCapture(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, source, path, fmt='wav', segmentSeconds=None, capacity=512, pollInterval=0.005, writeInterval=0.1):
+        # audio files and beam log are derived from the (skeleton) base path;
+        # segments of segmentSeconds are numbered like recorder segments
+        if fmt not in AUDIO_FORMATS:
+            raise ValueError('Unknown audio format: {}'.format(fmt))
+        if fmt == 'flac' and soundfile is None:
+            raise RuntimeError('FLAC audio needs the soundfile package, use wav instead')
+        self.source = source
+        self.format = fmt
+        self.base = os.path.splitext(path)[0]
+        self.logPath = self.base + '.beam.txt'
+        self.files = []
+        self.segmentSamples = int(segmentSeconds * source.rate) if segmentSeconds else None
+        self.pollInterval = pollInterval
+        self.writeInterval = writeInterval
+        
+        # sensor time plus clockOffset is the time.time() clock of skeleton
+        # recordings; the runtime sets it from body frames which share the
+        # sensor clock, otherwise it is estimated from the earliest arrivals
+        self.clockOffset = None
+        self._estimatedOffset = None
+        
+        # ring between capture and writer thread
+        self.ring = AudioRing(capacity, source.subframeSamples)
+        self.subframes = 0
+        self.samples = 0
+        self._file = None
+        self._log = None
+        self._segmentFill = 0
+        self._latest = (0.0, 0.0)
+        self._stopEvent = threading.Event()
+        self._threads = []
+        self._start = 0.0
+        self._elapsed = 0.0
+        
+        return
+    
+    # ~~~~~~~~ path of next audio segment ~~~~~~~~
+    def _next_path(self):
+        if not self.files:
+            return '{}.{}'.format(self.base, self.format)
+        
+        return '{}_{:03d}.{}'.format(self.base, len(self.files) + 1, self.format)
+    
+    # ~~~~~~~~ open next audio segment ~~~~~~~~
+    def _open(self):
+        path = self._next_path()
+        if self.format == 'flac':
+            self._file = soundfile.SoundFile(path, 'w', self.source.rate, 1, 'PCM_16')
+        else:
+            self._file = wave.open(path, 'wb')
+            self._file.setnchannels(1)
+            self._file.setsampwidth(2)
+            self._file.setframerate(self.source.rate)
+        self._segmentFill = 0
+        self.files.append(path)
+        
+        return
+    
+    # ~~~~~~~~ write 16-bit samples to the current segment ~~~~~~~~
+    def _write_samples(self, pcm):
+        if self.format == 'flac':
+            self._file.write(pcm)
+        else:
+            self._file.writeframes(pcm.tobytes())
+        
+        return
+    
+    # ~~~~~~~~ capture loop ~~~~~~~~
+    def _capture(self):
+        while not self._stopEvent.is_set():
+            subframes = self.source.read()
+            if subframes is None:
+                self._stopEvent.wait(self.pollInterval)
+                continue
+            samples, sensorTimes, angles, confidences = subframes
+            now = time.time()
+            offset = self.clockOffset
+            if offset is None:
+                # the smallest arrival delay after the end of a sub-frame
+                arrival = now - (sensorTimes[-1] + self.source.subframeSamples / self.source.rate)
+                if self._estimatedOffset is None or arrival < self._estimatedOffset:
+                    self._estimatedOffset = arrival
+                offset = self._estimatedOffset
+            self.ring.push(samples, sensorTimes, sensorTimes + offset, angles, confidences)
+            self._latest = (float(angles[-1]), float(confidences[-1]))
+        
+        return
+    
+    # ~~~~~~~~ write waiting sub-frames ~~~~~~~~
+    def _drain(self):
+        for samples, log in self.ring.peek():
+            # sub-frames are split at segment boundaries
+            i = 0
+            while i < len(samples):
+                if self.segmentSamples is not None and self._segmentFill >= self.segmentSamples:
+                    self._file.close()
+                    self._open()
+                count = len(samples) - i
+                if self.segmentSamples is not None:
+                    count = min(count, max(1, (self.segmentSamples - self._segmentFill) // samples.shape[1]))
+                block = log[i:i+count]
+                block['segment'] = len(self.files) - 1
+                block['sample'] = self._segmentFill + numpy.arange(count) * samples.shape[1]
+                pcm = numpy.clip(samples[i:i+count], -1.0, 1.0) * 32767.0
+                self._write_samples(pcm.astype(numpy.int16).ravel())
+                numpy.savetxt(self._log, block, fmt=['%.6f', '%.6f', '%d', '%d', '%.4f', '%.4f'])
+                self._segmentFill += count * samples.shape[1]
+                self.subframes += count
+                self.samples += count * samples.shape[1]
+                i += count
+            self.ring.release(len(samples))
+        
+        return
+    
+    # ~~~~~~~~ writer loop ~~~~~~~~
+    def _run(self):
+        self._open()
+        self._log = open(self.logPath, 'w')
+        self._log.write('# timestamp sensorTime segment sample angle confidence\n')
+        while not self._stopEvent.wait(self.writeInterval):
+            self._drain()
+            self._log.flush()
+        self._drain()
+        self._file.close()
+        self._log.close()
+        
+        return
+    
+    # ~~~~~~~~ start capture and writer threads ~~~~~~~~
+    def start(self):
+        self._stopEvent.clear()
+        self._threads = [threading.Thread(target=self._capture), threading.Thread(target=self._run)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        self._start = time.time()
+        
+        return
+    
+    # ~~~~~~~~ latest beam angle (radians) and confidence ~~~~~~~~
+    def beam(self):
+        return self._latest
+    
+    # ~~~~~~~~ session report ~~~~~~~~
+    def report(self):
+        elapsed = self._elapsed or (time.time() - self._start)
+        
+        return {'seconds': elapsed,
+                'subframes': self.subframes,
+                'samples': self.samples,
+                'audioSeconds': self.samples / self.source.rate,
+                'dropped': self.ring.dropped,
+                'files': list(self.files),
+                'beamLog': self.logPath}
+    
+    # ~~~~~~~~ stop capture and flush pending sub-frames ~~~~~~~~
+    def stop(self):
+        if not self._threads:
+            return self.report()
+        self._stopEvent.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.source.close()
+        self._elapsed = time.time() - self._start
+        
+        return self.report()
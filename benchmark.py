@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the acquisition, overlay, preview and plot hot paths.
+Drives each stage separately with synthetic 1920x1080 BGRA color frames,
+512x424 depth frames and 1-6 tracked bodies and emits JSON results.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import numpy
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# pygame (and the stages importing it) must not print its banner into the report
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+
+# ~~~~~~~~ current resident set size in kilobytes ~~~~~~~~
+def currentRSS():
+    # the current size rather than the process peak, which only ever grows
+    # and would attribute earlier stages to later ones
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss // 1024
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+# script started in a fresh interpreter to time the GUI cold start
+STARTUP_SCRIPT = '''
+import os
+import sys
+from PyQt5.QtWidgets import QApplication
+qapp = QApplication(sys.argv[:1])
+from app import MainGUI
+gui = MainGUI()
+gui.show()
+qapp.processEvents()
+os._exit(0)
+'''
+
+
+# ~~~~~~~~ time a stage ~~~~~~~~
+def measure(function, iterations, warmup=3):
+    for _ in range(warmup):
+        function()
+    samples = numpy.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples[i] = time.perf_counter() - start
+    total = samples.sum()
+    
+    return {'iterations': iterations,
+            'fps': iterations / total if total > 0 else None,
+            'p50_ms': float(numpy.percentile(samples, 50) * 1e3),
+            'p99_ms': float(numpy.percentile(samples, 99) * 1e3),
+            'rss_kb': currentRSS()}
+
+
+# ~~~~~~~~ synthetic runtime with every body frame available ~~~~~~~~
+def syntheticRuntime(bodies, preview=False):
+    from kinect import KinectRuntime
+    from synthetic import SyntheticRuntime
+    sensor = SyntheticRuntime(body_count=bodies)
+    runtime = KinectRuntime(preview=preview, sensor=sensor)
+    runtime._fps = 0
+    runtime._colorFrame = sensor.get_last_color_frame()
+    runtime._depthFrame = sensor.get_last_depth_frame().reshape(runtime._depthFrame_H, runtime._depthFrame_W)
+    runtime._bodyFrame = sensor.get_last_body_frame()
+    
+    return runtime, sensor
+
+
+# ~~~~~~~~ tracked bodies of a runtime ~~~~~~~~
+def trackedBodies(runtime):
+    return [body for body in runtime._bodyFrame.bodies if body.is_tracked]
+
+
+# ~~~~~~~~ stage: color frame to back buffer surface ~~~~~~~~
+def benchDrawColorFrame(iterations, bodies):
+    runtime, sensor = syntheticRuntime(bodies)
+    result = measure(lambda: runtime._draw_color_frame(runtime._colorFrame, runtime._frameSurface), iterations)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: skeleton overlay on preview surface ~~~~~~~~
+def benchDrawBody(iterations, bodies, height=360):
+    runtime, sensor = syntheticRuntime(bodies, preview=True)
+    width = int(runtime._aspect_ratio_w_h * height)
+    runtime._draw_preview_frame(runtime._colorFrame, width, height)
+    tracked = trackedBodies(runtime)
+    result = measure(lambda: runtime._draw_overlay(tracked, runtime._previewSurface, runtime._previewScale), iterations)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: joint depth lookup of all bodies ~~~~~~~~
+def benchDepthLookup(iterations, bodies):
+    runtime, sensor = syntheticRuntime(bodies)
+    tracked = trackedBodies(runtime)
+    result = measure(lambda: runtime._body_coordinates(tracked), iterations)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: depth frame to point cloud ~~~~~~~~
+def benchPointCloud(iterations, bodies):
+    from pointcloud import PointCloud
+    runtime, sensor = syntheticRuntime(bodies)
+    cloud = PointCloud(sensor)
+    result = measure(lambda: cloud.points(runtime._depthFrame), iterations)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: surface scaling and array conversion ~~~~~~~~
+def benchScaleArray3d(iterations, bodies, height=360):
+    import pygame
+    runtime, sensor = syntheticRuntime(bodies)
+    runtime._draw_color_frame(runtime._colorFrame, runtime._frameSurface)
+    width = int(runtime._aspect_ratio_w_h * height)
+    result = measure(lambda: pygame.surfarray.array3d(pygame.transform.scale(runtime._frameSurface, (width, height))), iterations)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: preview gather at target resolution ~~~~~~~~
+def benchPreviewFrame(iterations, bodies, height=360):
+    runtime, sensor = syntheticRuntime(bodies, preview=True)
+    width = int(runtime._aspect_ratio_w_h * height)
+    result = measure(lambda: runtime._draw_preview_frame(runtime._colorFrame, width, height), iterations)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: infrared preview through the tone table ~~~~~~~~
+def benchInfraredPreview(iterations, bodies, height=360):
+    runtime, sensor = syntheticRuntime(bodies, preview=True)
+    frame = sensor.get_last_infrared_frame().reshape(runtime._depthFrame_H, runtime._depthFrame_W)
+    size = runtime._source_size('infrared')
+    width = int(size[0] / size[1] * height)
+    toneMapper = runtime.toneMapper('infrared')
+    toneMapper.update(frame)
+    result = measure(lambda: runtime._draw_preview_frame(frame, width, height, size, toneMapper), iterations)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: numpy frame to QPixmap conversion ~~~~~~~~
+def benchQtConversion(iterations, bodies, height=360):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtGui import QImage, QPixmap
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    runtime, sensor = syntheticRuntime(bodies, preview=True)
+    width = int(runtime._aspect_ratio_w_h * height)
+    runtime._draw_preview_frame(runtime._colorFrame, width, height)
+    frame = runtime._previewBuffer
+    
+    def run():
+        image = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_RGB32)
+        QPixmap.fromImage(image)
+    
+    result = measure(run, iterations)
+    runtime.clear()
+    del app
+    
+    return result
+
+
+# ~~~~~~~~ stage: 3D skeleton plot update ~~~~~~~~
+def benchPlotUpdate(iterations, bodies, frames=300):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot
+    from qtplot import QtPlot
+    figure = pyplot.figure()
+    runtime, sensor = syntheticRuntime(bodies)
+    coords, valid = runtime._body_coordinates(trackedBodies(runtime))
+    data = numpy.tile(runtime._jointRows[:len(coords)], (frames, 1))
+    plot = QtPlot(figure, figure.canvas)
+    plot.data = data
+    plot.dataHead = 0
+    plot.dataTail = len(data) - 1
+    plot._create_artists()
+    frames = iter(range(1 << 30))
+    result = measure(lambda: plot._render(next(frames) % len(data)), iterations)
+    pyplot.close(figure)
+    runtime.clear()
+    
+    return result
+
+
+# ~~~~~~~~ stage: text recording import ~~~~~~~~
+def benchTextImport(iterations, bodies, frames=9000):
+    import pandas
+    from importer import TextImporter
+    data = numpy.random.RandomState(0).randint(0, 4500, size=(frames * bodies, 75))
+    handle, path = tempfile.mkstemp(suffix='.txt')
+    os.close(handle)
+    numpy.savetxt(path, data, fmt='%d')
+    try:
+        result = measure(lambda: importText(TextImporter, path), iterations, warmup=1)
+    finally:
+        os.remove(path)
+    result['rows'] = frames * bodies
+    
+    return result
+
+
+# ~~~~~~~~ import a text recording as the GUI does ~~~~~~~~
+def importText(TextImporter, path):
+    importer = TextImporter(path)
+    importer.start()
+    importer.join()
+    if importer.error is not None:
+        raise importer.error
+    
+    return importer.available()
+
+
+# ~~~~~~~~ stage: GUI cold start until the window is shown ~~~~~~~~
+def benchGuiStartup(iterations, bodies):
+    import PyQt5
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    root = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, '-c', STARTUP_SCRIPT]
+    
+    return measure(lambda: subprocess.check_call(command, cwd=root, env=env), iterations, warmup=1)
+
+
+# benchmark stages
+STAGES = [('draw_color_frame', benchDrawColorFrame),
+          ('draw_body', benchDrawBody),
+          ('depth_lookup', benchDepthLookup),
+          ('point_cloud', benchPointCloud),
+          ('scale_array3d', benchScaleArray3d),
+          ('preview_frame', benchPreviewFrame),
+          ('infrared_preview', benchInfraredPreview),
+          ('qt_conversion', benchQtConversion),
+          ('plot_update', benchPlotUpdate),
+          ('text_import', benchTextImport),
+          ('gui_startup', benchGuiStartup)]
+
+# stages which are slow per iteration and run with fewer iterations
+SLOW_STAGES = {'text_import': 20, 'gui_startup': 20}
+
+# stages which do not depend on the number of bodies and run once
+BODY_INDEPENDENT = ('gui_startup',)
+
+
+# ~~~~~~~~ run benchmark suite ~~~~~~~~
+def run(stages=None, bodies=(1, 6), iterations=100):
+    results = {'meta': {'python': platform.python_version(),
+                        'platform': platform.platform(),
+                        'numpy': numpy.__version__,
+                        'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'stages': {}}
+    for name, function in STAGES:
+        if stages and name not in stages:
+            continue
+        results['stages'][name] = {}
+        for count in bodies[:1] if name in BODY_INDEPENDENT else bodies:
+            # text import parses whole files and startup spawns interpreters, keep their iteration counts small
+            n = max(1, iterations // SLOW_STAGES.get(name, 1))
+            # objects of earlier stages are released before the baseline is taken
+            gc.collect()
+            before = currentRSS()
+            try:
+                result = function(n, count)
+            except ImportError as error:
+                result = {'skipped': str(error)}
+            else:
+                # memory held by the stage while it ran (setup and timed loop)
+                result['rss_before_kb'] = before
+                if before is not None and result['rss_kb'] is not None:
+                    result['rss_growth_kb'] = result['rss_kb'] - before
+            results['stages'][name]['all' if name in BODY_INDEPENDENT else 'bodies_{}'.format(count)] = result
+    
+    return results
+
+
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Kinect toolbox hot path benchmarks.')
+    parser.add_argument('--stages', nargs='*', default=None, choices=[name for name, _ in STAGES])
+    parser.add_argument('--bodies', nargs='*', type=int, default=[1, 6])
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--output', default=None, help='write JSON results to this file')
+    args = parser.parse_args()
+    results = run(args.stages, args.bodies, args.iterations)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    print(text)
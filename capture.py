@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Headless command line recorder for unattended Kinect captures.
+Records skeletons (optionally raw RGB-D streams and audio) without Qt, matplotlib
+or any display; no frames are drawn. Stops after a duration or on
+SIGINT/SIGTERM and flushes all pending data before exiting.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from instrumentation import Instrumentation
+from kinect import KinectRuntime
+
+
+# output formats selectable on the command line
+FORMATS = {'kbin': '.kbin', 'txt': '.txt'}
+
+
+# ~~~~~~~~ parse command line arguments ~~~~~~~~
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Headless Kinect skeleton recorder.')
+    parser.add_argument('output', help='output file (the extension is replaced according to --format)')
+    parser.add_argument('--format', default='kbin', choices=sorted(FORMATS),
+                        help='skeleton file format (default: kbin)')
+    parser.add_argument('--sources', default='depth,body',
+                        help='comma separated frame sources to open (default: depth,body)')
+    parser.add_argument('--rgbd', default=None, choices=['depth', 'jpeg', 'png', 'raw'],
+                        help='also record raw depth and optionally color frames in the given format')
+    parser.add_argument('--audio', default='wav', choices=['wav', 'flac'],
+                        help='audio track format when the audio source is open (default: wav)')
+    parser.add_argument('--duration', type=float, default=None, metavar='SECONDS',
+                        help='stop after this many seconds (default: until interrupted)')
+    parser.add_argument('--rotate-size', type=float, default=None, metavar='MB',
+                        help='start a new file segment after this many megabytes')
+    parser.add_argument('--rotate-duration', type=float, default=None, metavar='SECONDS',
+                        help='start a new file segment after this many seconds')
+    parser.add_argument('--fps', type=float, default=60,
+                        help='sensor polling rate limit, 0 for no limit (default: 60)')
+    parser.add_argument('--status', type=float, default=60, metavar='SECONDS',
+                        help='print a status line at this interval, 0 to disable (default: 60)')
+    parser.add_argument('--report', default=None, metavar='PATH',
+                        help='also write the exit report as JSON to this file')
+    parser.add_argument('--playback', default=None, metavar='PATH',
+                        help='record from a recording instead of the sensor')
+    parser.add_argument('--synthetic', type=int, default=None, metavar='BODIES',
+                        help='record from a synthetic sensor with this many bodies')
+    
+    return parser.parse_args(argv)
+
+
+# ~~~~~~~~ create headless runtime ~~~~~~~~
+def createRuntime(args, profile):
+    if args.playback is not None:
+        from playback import PlaybackRuntime
+        return PlaybackRuntime(args.playback, loop=False, sources=args.sources, profile=profile, headless=True)
+    sensor = None
+    if args.synthetic is not None:
+        from synthetic import SyntheticRuntime
+        sensor = SyntheticRuntime(body_count=args.synthetic)
+    
+    return KinectRuntime(sensor=sensor, sources=args.sources, profile=profile, overlay=False, headless=True)
+
+
+# ~~~~~~~~ exit report ~~~~~~~~
+def captureReport(recorder, rgbdReport, profile, elapsed, syncReport=None, audioReport=None):
+    summary = profile.summary()
+    stages = summary['stages']
+    bodyFrames = stages.get('body', {}).get('count', 0)
+    written = sum(os.path.getsize(path) for path in recorder.files if os.path.exists(path))
+    report = {'seconds': elapsed,
+              'bodyFrames': bodyFrames,
+              'bodyFps': bodyFrames / elapsed if elapsed > 0 else 0.0,
+              'rows': recorder.frames,
+              'rowsPerSecond': recorder.frames / elapsed if elapsed > 0 else 0.0,
+              'droppedRows': recorder.dropped,
+              'droppedSensorFrames': summary['dropped'],
+              'bytesWritten': written,
+              'files': list(recorder.files),
+              'stages': stages}
+    if rgbdReport is not None:
+        report['rgbd'] = rgbdReport
+    if syncReport is not None:
+        report['sync'] = syncReport
+    if audioReport is not None:
+        report['audio'] = audioReport
+    
+    return report
+
+
+# ~~~~~~~~ run capture ~~~~~~~~
+def capture(args):
+    # SIGINT and SIGTERM (and SIGBREAK on Windows) end the capture loop so
+    # that the recorders are stopped and flushed on the main thread
+    stop = threading.Event()
+    def interrupt(signum, frame):
+        stop.set()
+    for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), interrupt)
+    
+    # instrumentation counts body frames and frames overwritten on the sensor
+    profile = Instrumentation(enabled=True)
+    runtime = createRuntime(args, profile)
+    runtime.setFrameRate(args.fps)
+    path = os.path.splitext(args.output)[0] + FORMATS[args.format]
+    rotateSize = int(args.rotate_size * 1e6) if args.rotate_size else None
+    
+    recorder = runtime.startRecording(path, rgbd=args.rgbd, audio=args.audio, rotateSize=rotateSize,
+                                      rotateDuration=args.rotate_duration)
+    start = time.time()
+    lastStatus = start
+    try:
+        while not stop.is_set():
+            runtime.getFrame()
+            now = time.time()
+            if args.duration is not None and now - start >= args.duration:
+                break
+            if args.playback is not None and runtime.finished():
+                break
+            if args.status and now - lastStatus >= args.status:
+                lastStatus = now
+                # status goes to stderr, stdout carries only the report
+                print('[{:8.0f} s] {} rows, {} dropped'.format(now - start, recorder.frames, recorder.dropped), file=sys.stderr)
+                sys.stderr.flush()
+    finally:
+        elapsed = time.time() - start
+        runtime.stopRecording()
+        rgbdReport = runtime.rgbdReport()
+        syncReport = runtime.syncReport()
+        audioReport = runtime.audioReport()
+        runtime.clear()
+    
+    return captureReport(recorder, rgbdReport, profile, elapsed, syncReport, audioReport)
+
+
+# ~~~~~~~~ main ~~~~~~~~
+def main(argv=None):
+    args = parseArguments(argv)
+    report = capture(args)
+    print(json.dumps(report, indent=2))
+    if args.report is not None:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    
+    return 0
+
+
+# main
+if __name__ == '__main__':
+    sys.exit(main())
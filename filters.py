@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Temporal filtering of Kinect body joints.
+Exponential, One-Euro and Holt double exponential smoothing of all tracked
+bodies in one vectorized call per frame, with filter state kept per body
+tracking id and reset on tracking loss. The same filters run as a batch
+pass over recordings.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import math
+import numpy
+
+from recording import isFrameRecord
+
+try:
+    from pykinect2 import PyKinectV2
+except ImportError:
+    import kinectv2 as PyKinectV2
+
+
+# JointFilter class
+class JointFilter(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, bodyCount=6, jointCount=25, rate=30):
+        # frame period used without timestamps and for the first frame of a body
+        self.bodyCount = bodyCount
+        self.jointCount = jointCount
+        self.period = 1.0 / rate
+        
+        # body slot of every tracking id and time of the last frame; new bodies
+        # start at their first sample whatever the time step
+        self._ids = numpy.zeros(bodyCount, dtype=numpy.uint64)
+        self._active = numpy.zeros(bodyCount, dtype=bool)
+        self._lastTime = None
+        self._lastIds = None
+        self._lastSlots = None
+        
+        # last filtered joints of every slot, held for joints which are not tracked
+        self._last = numpy.zeros((bodyCount, jointCount, 3))
+        self._allocate()
+        
+        return
+    
+    # ~~~~~~~~ allocate filter state ~~~~~~~~
+    def _allocate(self):
+        return
+    
+    # ~~~~~~~~ initialize filter state of new bodies ~~~~~~~~
+    def _reset(self, slots, x):
+        return
+    
+    # ~~~~~~~~ filter joints of tracked bodies ~~~~~~~~
+    def _update(self, slots, x, dt):
+        return x
+    
+    # ~~~~~~~~ forget every body ~~~~~~~~
+    def reset(self):
+        self._active[:] = False
+        self._lastIds = None
+        self._lastTime = None
+        
+        return
+    
+    # ~~~~~~~~ body slots of tracking ids ~~~~~~~~
+    def _assign(self, ids):
+        # bodies which are no longer tracked free their slots and new bodies
+        # take free slots; returns the slots (a slice when they are the first
+        # ones, so that filter state is updated through views) and a mask of
+        # new bodies
+        if self._lastIds is not None and len(ids) == len(self._lastIds) and (ids == self._lastIds).all():
+            return self._lastSlots, numpy.zeros(len(ids), dtype=bool)
+        match = (self._ids[None, :] == ids[:, None]) & self._active[None, :]
+        found = match.any(axis=1)
+        slots = numpy.argmax(match, axis=1)
+        self._active[:] = False
+        self._active[slots[found]] = True
+        new = ~found
+        if new.any():
+            free = numpy.flatnonzero(~self._active)
+            if new.sum() > len(free):
+                raise ValueError('More than {} bodies to filter'.format(self.bodyCount))
+            slots[new] = free[:new.sum()]
+            self._active[slots] = True
+            self._ids[slots] = ids
+        if (slots == numpy.arange(len(slots))).all():
+            slots = slice(0, len(slots))
+        self._lastIds = ids.copy()
+        self._lastSlots = slots
+        
+        return slots, new
+    
+    # ~~~~~~~~ filter one frame ~~~~~~~~
+    def filter(self, coords, ids=None, timestamp=None, states=None):
+        # coords reshape to (bodies, joints, 3), ids are the tracking ids of the
+        # bodies (positions by default), timestamp is in seconds and states are
+        # the (bodies, joints) tracking states; joints which are not tracked
+        # are passed through and do not update the filter. The result may be
+        # overwritten by the next call
+        n = len(coords)
+        x = numpy.asarray(coords, dtype=numpy.float64).reshape(n, self.jointCount, 3)
+        ids = numpy.arange(n, dtype=numpy.uint64) if ids is None else numpy.asarray(ids, dtype=numpy.uint64)
+        slots, new = self._assign(ids)
+        if n == 0:
+            return x
+        tracked = None
+        if states is not None:
+            tracked = numpy.asarray(states).reshape(n, self.jointCount, 1) != PyKinectV2.TrackingState_NotTracked
+            tracked = None if tracked.all() else tracked
+        measured = x
+        if tracked is not None:
+            measured = numpy.where(tracked | new[:, None, None], x, self._last[slots])
+        if new.any():
+            self._reset(numpy.arange(self.bodyCount)[slots][new], measured[new])
+        dt = self.period
+        if timestamp is not None:
+            if self._lastTime is not None:
+                dt = max(timestamp - self._lastTime, 1e-3)
+            self._lastTime = timestamp
+        filtered = self._update(slots, measured, dt)
+        self._last[slots] = filtered
+        if tracked is not None:
+            filtered = numpy.where(tracked, filtered, x)
+        
+        return filtered
+    
+    # ~~~~~~~~ filter a sequence of one body ~~~~~~~~
+    def filterSequence(self, coords, timestamps=None, body=0):
+        # coords are (frames, joints, 3) or (frames, joints * 3); the filter
+        # state is kept so that a growing sequence can be filtered in parts
+        coords = numpy.asarray(coords)
+        filtered = numpy.empty(coords.shape, dtype=numpy.float64)
+        rows = filtered.reshape(len(coords), -1)
+        ids = numpy.array([body], dtype=numpy.uint64)
+        for i in range(len(coords)):
+            t = None if timestamps is None else timestamps[i]
+            rows[i] = self.filter(coords[i:i+1], ids, t).ravel()
+        
+        return filtered
+
+
+# ExponentialFilter class
+class ExponentialFilter(JointFilter):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, alpha=0.5, bodyCount=6, jointCount=25, rate=30):
+        # weight of the new sample (1 passes joints through unfiltered)
+        self.alpha = alpha
+        super(ExponentialFilter, self).__init__(bodyCount, jointCount, rate)
+        
+        return
+    
+    # ~~~~~~~~ allocate filter state ~~~~~~~~
+    def _allocate(self):
+        self._y = numpy.zeros((self.bodyCount, self.jointCount, 3))
+        
+        return
+    
+    # ~~~~~~~~ initialize filter state of new bodies ~~~~~~~~
+    def _reset(self, slots, x):
+        self._y[slots] = x
+        
+        return
+    
+    # ~~~~~~~~ filter joints of tracked bodies ~~~~~~~~
+    def _update(self, slots, x, dt):
+        y = self._y[slots]
+        y += self.alpha * (x - y)
+        self._y[slots] = y
+        
+        return y
+
+
+# OneEuroFilter class
+class OneEuroFilter(JointFilter):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, minCutoff=1.0, beta=0.05, derivativeCutoff=1.0, bodyCount=6, jointCount=25, rate=30):
+        # cutoff frequencies in Hz; beta raises the cutoff with joint speed
+        # (pixels or millimeters per second) to trade jitter for lag
+        self.minCutoff = minCutoff
+        self.beta = beta
+        self.derivativeCutoff = derivativeCutoff
+        super(OneEuroFilter, self).__init__(bodyCount, jointCount, rate)
+        
+        return
+    
+    # ~~~~~~~~ allocate filter state ~~~~~~~~
+    def _allocate(self):
+        self._y = numpy.zeros((self.bodyCount, self.jointCount, 3))
+        self._dy = numpy.zeros((self.bodyCount, self.jointCount, 3))
+        
+        return
+    
+    # ~~~~~~~~ initialize filter state of new bodies ~~~~~~~~
+    def _reset(self, slots, x):
+        self._y[slots] = x
+        self._dy[slots] = 0.0
+        
+        return
+    
+    # ~~~~~~~~ smoothing factor of a low pass filter ~~~~~~~~
+    def _alpha(self, cutoff, dt):
+        return 1.0 / (1.0 + 1.0 / (2.0 * math.pi * cutoff * dt))
+    
+    # ~~~~~~~~ filter joints of tracked bodies ~~~~~~~~
+    def _update(self, slots, x, dt):
+        y = self._y[slots]
+        dy = self._dy[slots]
+        dy += self._alpha(self.derivativeCutoff, dt) * ((x - y) / dt - dy)
+        cutoff = self.minCutoff + self.beta * numpy.abs(dy)
+        y += self._alpha(cutoff, dt) * (x - y)
+        self._y[slots] = y
+        self._dy[slots] = dy
+        
+        return y
+
+
+# HoltFilter class
+class HoltFilter(JointFilter):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, smoothing=0.5, correction=0.5, prediction=0.0, bodyCount=6, jointCount=25, rate=30):
+        # double exponential smoothing of level and trend per frame; prediction
+        # extrapolates the output by this many frames to compensate lag
+        self.smoothing = smoothing
+        self.correction = correction
+        self.prediction = prediction
+        super(HoltFilter, self).__init__(bodyCount, jointCount, rate)
+        
+        return
+    
+    # ~~~~~~~~ allocate filter state ~~~~~~~~
+    def _allocate(self):
+        self._level = numpy.zeros((self.bodyCount, self.jointCount, 3))
+        self._trend = numpy.zeros((self.bodyCount, self.jointCount, 3))
+        
+        return
+    
+    # ~~~~~~~~ initialize filter state of new bodies ~~~~~~~~
+    def _reset(self, slots, x):
+        self._level[slots] = x
+        self._trend[slots] = 0.0
+        
+        return
+    
+    # ~~~~~~~~ filter joints of tracked bodies ~~~~~~~~
+    def _update(self, slots, x, dt):
+        level = self._level[slots]
+        trend = self._trend[slots]
+        previous = level.copy()
+        level += trend
+        level += (1.0 - self.smoothing) * (x - level)
+        trend += self.correction * ((level - previous) - trend)
+        self._level[slots] = level
+        self._trend[slots] = trend
+        
+        return level + self.prediction * trend
+
+
+# filters selectable by name
+FILTERS = {'ema': ExponentialFilter, 'oneeuro': OneEuroFilter, 'holt': HoltFilter}
+
+
+# ~~~~~~~~ create filter by name ~~~~~~~~
+def createFilter(name, **options):
+    if name not in FILTERS:
+        raise ValueError('Unknown joint filter {} (choose from {})'.format(name, ', '.join(sorted(FILTERS))))
+    
+    return FILTERS[name](**options)
+
+
+# ~~~~~~~~ filter a whole recording ~~~~~~~~
+def filterRecording(records, jointFilter):
+    # frame records (version 2) return (frames, bodies, joints, 3) coordinates
+    # with untracked slots zero; body records (version 1) return (rows, joints, 3)
+    # with the rows of every body id filtered as one sequence
+    jointFilter.reset()
+    timestamps = numpy.asarray(records['timestamp'])
+    if isFrameRecord(records):
+        filtered = numpy.zeros(records['coords'].shape, dtype=numpy.float32)
+        for i in range(len(records)):
+            record = records[i]
+            tracked = numpy.flatnonzero(record['tracked'])
+            filtered[i, tracked] = jointFilter.filter(record['coords'][tracked], record['body'][tracked],
+                                                      timestamps[i], record['state'][tracked])
+        return filtered
+    filtered = numpy.zeros(records['coords'].shape, dtype=numpy.float32)
+    ids = numpy.asarray(records['body'])
+    for body in numpy.unique(ids):
+        rows = numpy.flatnonzero(ids == body)
+        # rows converted from text recordings carry no timestamps
+        times = timestamps[rows]
+        if not (numpy.diff(times) > 0).all():
+            times = None
+        jointFilter.reset()
+        filtered[rows] = jointFilter.filterSequence(records['coords'][rows], times, body)
+    
+    return filtered
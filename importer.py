@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Background import of text recordings.
+Parses .txt/.csv recordings in chunks on a worker thread into a compact
+preallocated array which can be used while the import is still running.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+import os
+import threading
+
+from recording import TEXT_EXTENSIONS
+
+
+# ~~~~~~~~ sniff column count and value type of a text recording ~~~~~~~~
+def sniffText(path, sep=None, lines=16):
+    # returns (separator, columns, dtype, bytes per line) or raises ValueError
+    if sep is None:
+        sep = TEXT_EXTENSIONS.get(os.path.splitext(path)[-1].lower(), ' ')
+    rows = []
+    size = 0
+    count = 0
+    with open(path, 'r') as file:
+        for line in file:
+            if count >= lines:
+                break
+            size += len(line)
+            count += 1
+            if line.strip():
+                rows.append((count, line.strip().split(sep)))
+    if not rows:
+        raise ValueError('Empty recording: {}'.format(path))
+    columns = len(rows[0][1])
+    if columns % 3 != 0:
+        raise ValueError('Column count {} is not a multiple of 3: {}'.format(columns, path))
+    dtype = numpy.dtype('int16')
+    for n, values in rows:
+        if len(values) != columns:
+            raise ValueError('Line {} has {} columns instead of {}: {}'.format(n, len(values), columns, path))
+        for value in values:
+            try:
+                int(value)
+            except ValueError:
+                try:
+                    float(value)
+                except ValueError:
+                    raise ValueError('Line {} has a non numeric value {!r}: {}'.format(n, value, path))
+                dtype = numpy.dtype('float32')
+    
+    return sep, columns, dtype, size / count
+
+
+# TextImporter class
+class TextImporter(threading.Thread):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, path, chunkRows=16384):
+        super(TextImporter, self).__init__()
+        self.daemon = True
+        self.path = path
+        self.chunkRows = chunkRows
+        
+        # fails fast on malformed files before any thread is started
+        self.sep, self.columns, self.dtype, lineSize = sniffText(path)
+        
+        # preallocated for the estimated row count and grown when exceeded
+        self.estimate = max(1, int(os.path.getsize(path) / max(lineSize, 1)))
+        self.data = numpy.zeros((int(self.estimate * 1.1) + 1, self.columns), dtype=self.dtype)
+        self.rows = 0
+        self.error = None
+        self.done = False
+        
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        
+        return
+    
+    # ~~~~~~~~ store one parsed chunk ~~~~~~~~
+    def _store(self, chunk, line):
+        if chunk.shape[1] != self.columns:
+            raise ValueError('Line {} has {} columns instead of {}: {}'.format(line, chunk.shape[1], self.columns, self.path))
+        if chunk.dtype.kind not in 'iuf':
+            raise ValueError('Non numeric values after line {}: {}'.format(line, self.path))
+        if chunk.dtype.kind == 'f' and numpy.isnan(chunk).any():
+            row = int(numpy.flatnonzero(numpy.isnan(chunk).any(axis=1))[0])
+            raise ValueError('Line {} has missing values: {}'.format(line + row, self.path))
+        with self._lock:
+            data = self.data
+            # integer recordings with values outside int16 or fractional values are widened
+            if data.dtype.kind == 'i' and chunk.dtype.kind == 'f':
+                data = data.astype(numpy.float32)
+            elif data.dtype.kind == 'i' and len(chunk) and (chunk.min() < numpy.iinfo(data.dtype).min or chunk.max() > numpy.iinfo(data.dtype).max):
+                data = data.astype(numpy.int32)
+            if self.rows + len(chunk) > len(data):
+                grown = numpy.zeros((max(2 * len(data), self.rows + len(chunk)), self.columns), dtype=data.dtype)
+                grown[:self.rows] = data[:self.rows]
+                data = grown
+            data[self.rows:self.rows+len(chunk)] = chunk
+            self.data = data
+            self.rows += len(chunk)
+        
+        return
+    
+    # ~~~~~~~~ import loop ~~~~~~~~
+    def run(self):
+        import pandas
+        try:
+            reader = pandas.read_csv(self.path, sep=self.sep, header=None, chunksize=self.chunkRows)
+            line = 1
+            for chunk in reader:
+                if self._cancel.is_set():
+                    break
+                self._store(chunk.values, line)
+                line += len(chunk)
+        except Exception as error:
+            self.error = error
+        self.done = True
+        
+        return
+    
+    # ~~~~~~~~ rows imported so far ~~~~~~~~
+    def available(self):
+        with self._lock:
+            return self.data[:self.rows]
+    
+    # ~~~~~~~~ import progress between 0 and 1 ~~~~~~~~
+    def progress(self):
+        if self.done:
+            return 1.0
+        
+        return min(self.rows / self.estimate, 0.99)
+    
+    # ~~~~~~~~ cancel import ~~~~~~~~
+    def cancel(self, timeout=None):
+        self._cancel.set()
+        if self.is_alive():
+            self.join(timeout)
+        
+        return
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tone mapping of Kinect infrared frames for display.
+Maps 16-bit infrared and long exposure infrared intensities to 8-bit gray
+(or opaque BGRA) through a lookup table of all 65536 values, so that every
+frame costs a single table lookup. The intensity range is fixed (scaled as
+in the Kinect SDK samples) or follows the scene from a sparse sample of
+frames every few frames.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+
+
+# Kinect SDK infrared sample scaling: intensities are normalized by the
+# source maximum and by the average scene value times a number of standard
+# deviations, then clipped to a minimum output so that dark areas stay visible
+SOURCE_MAXIMUM = 65535
+SCENE_AVERAGE = 0.08
+SCENE_DEVIATIONS = 3.0
+OUTPUT_MINIMUM = 0.01
+
+
+# ~~~~~~~~ 8-bit lookup table of 16-bit intensities ~~~~~~~~
+def toneTable(low=0, high=SOURCE_MAXIMUM * SCENE_AVERAGE * SCENE_DEVIATIONS, gamma=1.0, minimum=OUTPUT_MINIMUM):
+    # intensities from low to high map linearly (before gamma) onto minimum to 1
+    values = numpy.arange(SOURCE_MAXIMUM + 1, dtype=numpy.float32)
+    scaled = (values - low) / max(high - low, 1.0)
+    numpy.clip(scaled, minimum, 1.0, out=scaled)
+    if gamma != 1.0:
+        numpy.power(scaled, gamma, out=scaled)
+    
+    return (scaled * 255.0 + 0.5).astype(numpy.uint8)
+
+
+# InfraredToneMapper class
+class InfraredToneMapper(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, gamma=0.5, autoRange=True, percentiles=(1.0, 99.5), interval=15, stride=16):
+        # gamma below 1 brightens dark areas; with auto range the intensities
+        # between the percentiles of a sample of every stride-th pixel are
+        # stretched over the output range, updated every interval frames
+        self.gamma = gamma
+        self.autoRange = autoRange
+        self.percentiles = percentiles
+        self.interval = interval
+        self.stride = stride
+        
+        # gray and opaque BGRA (as uint32) tables, rebuilt only when the range moves
+        self._range = None
+        self._gray = None
+        self._bgra = None
+        self._frames = 0
+        self.setRange(0, SOURCE_MAXIMUM * SCENE_AVERAGE * SCENE_DEVIATIONS)
+        
+        return
+    
+    # ~~~~~~~~ intensity range ~~~~~~~~
+    def range(self):
+        return self._range
+    
+    # ~~~~~~~~ set intensity range and rebuild tables ~~~~~~~~
+    def setRange(self, low, high):
+        self._range = (float(low), float(high))
+        self._gray = toneTable(low, high, self.gamma)
+        self._bgra = self._gray.astype(numpy.uint32) * 0x010101 | 0xff000000
+        
+        return
+    
+    # ~~~~~~~~ follow the intensity range of the scene ~~~~~~~~
+    def update(self, frame):
+        # cheap for all but every interval-th frame; small range changes keep
+        # the tables to avoid rebuilding them for sensor noise
+        if not self.autoRange:
+            return
+        self._frames += 1
+        if (self._frames - 1) % self.interval:
+            return
+        sample = numpy.asarray(frame).reshape(-1)[::self.stride]
+        low, high = numpy.percentile(sample, self.percentiles)
+        high = max(high, low + 1.0)
+        span = self._range[1] - self._range[0]
+        if abs(low - self._range[0]) > 0.05 * span or abs(high - self._range[1]) > 0.05 * span:
+            self.setRange(low, high)
+        
+        return
+    
+    # ~~~~~~~~ 8-bit gray image of a frame ~~~~~~~~
+    def gray(self, frame, out=None):
+        return numpy.take(self._gray, frame, out=out)
+    
+    # ~~~~~~~~ opaque BGRA pixels of a frame as uint32 ~~~~~~~~
+    def bgra(self, frame, out=None):
+        return numpy.take(self._bgra, frame, out=out)
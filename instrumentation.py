@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage latency and dropped frame instrumentation.
+Records monotonic stage timings into rolling windows and cumulative
+histograms; every call is a single attribute check when disabled.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import json
+import numpy
+import threading
+import time
+
+
+# histogram bin edges in seconds (10 us to 10 s, log spaced)
+BINS = numpy.logspace(-5, 1, 61)
+
+# nominal sensor frame period
+FRAME_PERIOD = 1.0 / 30
+
+
+# Stage class
+class Stage(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, window):
+        self.count = 0
+        self.samples = numpy.zeros(window)
+        self.histogram = numpy.zeros(len(BINS) + 1, dtype=numpy.int64)
+        
+        return
+    
+    # ~~~~~~~~ add sample ~~~~~~~~
+    def add(self, duration):
+        self.samples[self.count % len(self.samples)] = duration
+        self.histogram[numpy.searchsorted(BINS, duration)] += 1
+        self.count += 1
+        
+        return
+    
+    # ~~~~~~~~ rolling statistics in milliseconds ~~~~~~~~
+    def summary(self):
+        samples = self.samples[:min(self.count, len(self.samples))]
+        if len(samples) == 0:
+            return {'count': 0}
+        p50, p99 = numpy.percentile(samples, [50, 99]) * 1e3
+        
+        return {'count': self.count,
+                'mean_ms': float(samples.mean() * 1e3),
+                'p50_ms': float(p50),
+                'p99_ms': float(p99),
+                'max_ms': float(samples.max() * 1e3)}
+
+
+# Instrumentation class
+class Instrumentation(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, enabled=False, window=512):
+        self.enabled = enabled
+        self.window = window
+        self.stages = {}
+        self.dropped = {}
+        self._lastArrival = {}
+        self._start = time.time()
+        
+        # stages are recorded from capture, recorder and GUI threads while
+        # summaries are read from others
+        self._lock = threading.Lock()
+        
+        return
+    
+    # ~~~~~~~~ current time ~~~~~~~~
+    def start(self):
+        if not self.enabled:
+            return 0.0
+        
+        return time.perf_counter()
+    
+    # ~~~~~~~~ record stage duration since start and return current time ~~~~~~~~
+    def stamp(self, name, start):
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        self.record(name, now - start)
+        
+        return now
+    
+    # ~~~~~~~~ record a duration measured elsewhere ~~~~~~~~
+    def record(self, name, duration):
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = Stage(self.window)
+            stage.add(duration)
+        
+        return
+    
+    # ~~~~~~~~ record latency since a host monotonic capture time ~~~~~~~~
+    def latency(self, name, captureTime):
+        # capture times come from time.perf_counter which is system wide, so
+        # frames captured in another process are measured as well
+        if not self.enabled or not captureTime:
+            return
+        self.record(name, max(time.perf_counter() - captureTime, 0.0))
+        
+        return
+    
+    # ~~~~~~~~ count frames overwritten before they were consumed ~~~~~~~~
+    def arrival(self, stream, timestamp=None, period=FRAME_PERIOD):
+        # timestamp is the sensor time in seconds when known, host time otherwise
+        if not self.enabled:
+            return
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        with self._lock:
+            last = self._lastArrival.get(stream)
+            self._lastArrival[stream] = timestamp
+            if last is None:
+                return
+            missed = int(round((timestamp - last) / period)) - 1
+            if missed > 0:
+                self.dropped[stream] = self.dropped.get(stream, 0) + missed
+        
+        return
+    
+    # ~~~~~~~~ summary of all stages ~~~~~~~~
+    def summary(self):
+        with self._lock:
+            return {'time': time.time(),
+                    'uptime': time.time() - self._start,
+                    'stages': {name: stage.summary() for name, stage in self.stages.items()},
+                    'dropped': dict(self.dropped)}
+    
+    # ~~~~~~~~ multi line text for on-screen overlay ~~~~~~~~
+    def text(self):
+        lines = []
+        summary = self.summary()
+        for name in sorted(summary['stages']):
+            stats = summary['stages'][name]
+            if stats['count']:
+                lines.append('{:<12s} {:6.2f} ms  p99 {:6.2f} ms'.format(name, stats['p50_ms'], stats['p99_ms']))
+        for stream in sorted(summary['dropped']):
+            lines.append('{:<12s} {:d} dropped'.format(stream, summary['dropped'][stream]))
+        
+        return '\n'.join(lines)
+    
+    # ~~~~~~~~ append summary and histograms to a log file ~~~~~~~~
+    def export(self, path):
+        summary = self.summary()
+        summary['bins_s'] = BINS.tolist()
+        with self._lock:
+            summary['histograms'] = {name: stage.histogram.tolist() for name, stage in self.stages.items()}
+        with open(path, 'a') as file:
+            file.write(json.dumps(summary))
+            file.write('\n')
+        
+        return
@@ -13,38 +13,110 @@ from __future__ import division
 from __future__ import print_function
 
 import ctypes
+import datetime
 import numpy
-import pygame
+import os
 import sys
+import time
 
-from pykinect2 import PyKinectRuntime
-from pykinect2 import PyKinectV2
+from infrared import InfraredToneMapper
+from instrumentation import Instrumentation
+from recorder import SkeletonRecorder
+from synchronizer import FrameSynchronizer
+
+# pygame (drawing only) and optional stages are imported where they are used so
+# that headless runtimes load neither; pygame must not print its banner to the
+# stdout of command line tools
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+try:
+    from pykinect2 import PyKinectRuntime
+    from pykinect2 import PyKinectV2
+except ImportError:
+    PyKinectRuntime = None
+    import kinectv2 as PyKinectV2
+
+
+# frame sources selectable by name
+SOURCES = {'color': PyKinectV2.FrameSourceTypes_Color,
+           'infrared': PyKinectV2.FrameSourceTypes_Infrared,
+           'longexposureinfrared': PyKinectV2.FrameSourceTypes_LongExposureInfrared,
+           'depth': PyKinectV2.FrameSourceTypes_Depth,
+           'bodyindex': PyKinectV2.FrameSourceTypes_BodyIndex,
+           'body': PyKinectV2.FrameSourceTypes_Body,
+           'audio': PyKinectV2.FrameSourceTypes_Audio}
+
+# frame sources read by default
+DEFAULT_SOURCES = 'color,depth,body'
+
+# stream names used by PyKinect2 for frame arrival times
+RUNTIME_STREAMS = {'color': 'color', 'depth': 'depth', 'bodyindex': 'body_index', 'body': 'body',
+                   'infrared': 'infrared', 'longexposureinfrared': 'long_exposure_infrared'}
+
+# frame sources which can be shown as preview
+PREVIEW_SOURCES = ('color', 'infrared', 'longexposureinfrared')
+
+
+# ~~~~~~~~ parse frame sources ~~~~~~~~
+def parseSources(sources):
+    # accepts a FrameSourceTypes bitmask, a list of names or a comma separated string
+    if sources is None:
+        sources = DEFAULT_SOURCES
+    if isinstance(sources, int):
+        return sources
+    if isinstance(sources, str):
+        sources = sources.split(',')
+    flags = 0
+    for name in sources:
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in SOURCES:
+            raise ValueError('Unknown frame source: {}'.format(name))
+        flags |= SOURCES[name]
+    
+    return flags
+
+
+# ~~~~~~~~ preview sources among frame sources ~~~~~~~~
+def previewSources(sources):
+    flags = parseSources(sources)
+    
+    return [name for name in PREVIEW_SOURCES if flags & SOURCES[name]]
 
 
 # KinectRuntime class
 class KinectRuntime(object):
     
     # ~~~~~~~~ constructor ~~~~~~~~
-    def __init__(self):
+    def __init__(self, preview=False, sensor=None, sources=None, profile=None, overlay=True, headless=False, jointFilter=None,
+                 previewSource=None):
         # debug state
         self._debug = False
         
-        # initialize pygame
-        flag0, flag1 = pygame.init()
-        if flag0:
-            if self._debug: print('[DEBUG] PyGame initialized')
+        # per stage latency instrumentation (disabled unless provided)
+        self._profile = profile if profile is not None else Instrumentation(enabled=False)
+        
+        # headless runtimes only acquire and record; no frames are drawn or returned
+        self._headless = headless
+        
+        # selected frame sources
+        self._sources = parseSources(sources)
+        self._useColor = bool(self._sources & PyKinectV2.FrameSourceTypes_Color)
+        self._useDepth = bool(self._sources & PyKinectV2.FrameSourceTypes_Depth)
+        self._useBody = bool(self._sources & PyKinectV2.FrameSourceTypes_Body)
+        self._useBodyIndex = bool(self._sources & PyKinectV2.FrameSourceTypes_BodyIndex)
+        self._useInfrared = bool(self._sources & PyKinectV2.FrameSourceTypes_Infrared)
+        self._useLongExposure = bool(self._sources & PyKinectV2.FrameSourceTypes_LongExposureInfrared)
+        self._useAudio = bool(self._sources & PyKinectV2.FrameSourceTypes_Audio)
+        
+        # create kinect runtime object (or use a stand-in sensor)
+        if sensor is not None:
+            self._kinect = sensor
+        elif PyKinectRuntime is None:
+            raise RuntimeError('PyKinect2 is not available, use a stand-in sensor instead')
         else:
-            if self._debug: print('[DEBUG] PyGame initialization failed')
-            sys.exit(0)
-        
-        # create kinect runtime object
-        self._kinect = PyKinectRuntime.PyKinectRuntime(PyKinectV2.FrameSourceTypes_Color|\
-                                                       PyKinectV2.FrameSourceTypes_Infrared|\
-                                                       PyKinectV2.FrameSourceTypes_LongExposureInfrared|\
-                                                       PyKinectV2.FrameSourceTypes_Depth|\
-                                                       PyKinectV2.FrameSourceTypes_BodyIndex|\
-                                                       PyKinectV2.FrameSourceTypes_Body|\
-                                                       PyKinectV2.FrameSourceTypes_Audio)
+            self._kinect = PyKinectRuntime.PyKinectRuntime(self._sources)
         
         # frame dimensions
         self._colorFrame_W = self._kinect.color_frame_desc.Width
@@ -52,95 +124,117 @@ class KinectRuntime(object):
         self._depthFrame_W = self._kinect.depth_frame_desc.Width
         self._depthFrame_H = self._kinect.depth_frame_desc.Height
         
-        # back buffer surface for getting kinect color frames
-        self._frameSurface = pygame.Surface((self._colorFrame_W, self._colorFrame_H), 0, 32)
+        # back buffer surface for getting kinect color frames (not needed in preview mode);
+        # off-screen surfaces need no pygame initialization so no pygame subsystem is started
+        if preview or headless or not self._useColor:
+            self._frameSurface = None
+        else:
+            import pygame
+            self._frameSurface = pygame.Surface((self._colorFrame_W, self._colorFrame_H), 0, 32)
         
-        # aspect ratio of back buffer surface
-        self._aspect_ratio_w_h = self._frameSurface.get_width() / self._frameSurface.get_height()
-        self._aspect_ratio_h_w = self._frameSurface.get_height() / self._frameSurface.get_width()
+        # aspect ratio of color frames
+        self._aspect_ratio_w_h = self._colorFrame_W / self._colorFrame_H
+        self._aspect_ratio_h_w = self._colorFrame_H / self._colorFrame_W
         
         # dimension of returned frame
         self._targetW = None
         self._targetH = None
         
+        # preview mode returns a contiguous BGRA frame at target resolution
+        # which maps directly onto QImage.Format_RGB32 without any conversion
+        # per frame budget: one gather of targetW*targetH*4 bytes into a
+        # preallocated buffer and no new allocations after the first frame
+        self._preview = preview
+        self._previewBuffer = None
+        self._previewSurface = None
+        self._previewIndex = None
+        self._previewScale = (1.0, 1.0)
+        self._previewKey = None
+        self._previewPixels = None
+        
+        # preview source (color or infrared in preview mode) and the tone mapping
+        # of each infrared source from 16-bit intensities to BGRA pixels
+        self._previewSource = None
+        self._toneMappers = {'infrared': InfraredToneMapper(), 'longexposureinfrared': InfraredToneMapper()}
+        self.setPreviewSource(previewSource)
+        
+        # skeleton overlay drawn at target resolution (None disables drawing)
+        if overlay is True and not headless:
+            from overlay import SkeletonOverlay
+            overlay = SkeletonOverlay()
+        self._overlay = overlay or None
+        
         # detected frames
         self._colorFrame = None
         self._depthFrame = None
+        self._bodyIndexFrame = None
         self._bodyFrame = None
+        self._infraredFrame = None
+        self._longExposureFrame = None
+        
+        # preallocated joint buffers for all bodies: depth space points, pixels,
+        # camera space depth, tracking states, validity and coordinates
+        bodyCount = self._kinect.max_body_count
+        jointCount = PyKinectV2.JointType_Count
+        self._jointPoints = numpy.zeros((bodyCount, jointCount, 2), dtype=numpy.float32)
+        self._jointPixels = numpy.zeros((bodyCount, jointCount, 2), dtype=numpy.int32)
+        self._jointDepth = numpy.zeros((bodyCount, jointCount), dtype=numpy.float32)
+        self._jointStates = numpy.zeros((bodyCount, jointCount), dtype=numpy.uint8)
+        self._jointValid = numpy.zeros((bodyCount, jointCount), dtype=bool)
+        self._jointCoords = numpy.zeros((bodyCount, jointCount, 3), dtype=numpy.int32)
+        self._jointRows = self._jointCoords.reshape(bodyCount, jointCount * 3)
+        self._colorPoints = numpy.zeros((bodyCount, jointCount, 2), dtype=numpy.float32)
+        self._trackingIds = numpy.zeros(bodyCount, dtype=numpy.uint64)
+        self._sensorSlots = numpy.zeros(bodyCount, dtype=numpy.int32)
+        
+        # joints of all tracked bodies gathered for a single coordinate mapper
+        # call per frame: SDK joint records, camera space points and mapped points
+        self._jointRecords = numpy.zeros((bodyCount, jointCount),
+                                         dtype=numpy.ctypeslib.as_array((PyKinectV2._Joint * 1)()).dtype)
+        self._cameraPoints = (PyKinectV2._CameraSpacePoint * (bodyCount * jointCount))()
+        self._mappedPoints = {'depth': (PyKinectV2._DepthSpacePoint * (bodyCount * jointCount))(),
+                              'color': (PyKinectV2._ColorSpacePoint * (bodyCount * jointCount))()}
+        self._filteredCoords = numpy.zeros((bodyCount, jointCount, 3), dtype=numpy.int32)
+        self._filteredRows = self._filteredCoords.reshape(bodyCount, jointCount * 3)
+        
+        # temporal joint filter (see filters.py) applied to the joint coordinates
+        # of bodyData; recordings keep the unfiltered coordinates
+        self._filter = jointFilter
+        
+        # number of color, body or (without color) previewed infrared frames
+        # received and latest joint coordinates
+        self._frameIndex = 0
+        self._bodyData = self._jointRows[:0]
+        self._bodyValid = self._jointValid[:0]
+        self._bodyIds = self._trackingIds[:0]
+        self._bodySlots = self._sensorSlots[:0]
+        self._bodyTime = 0.0
+        
+        # sensor and host time of the last frame of every stream; body frames
+        # are paired with the depth frame nearest in time for joint depths
+        self._frameTimes = {}
+        self._sync = FrameSynchronizer(profile=self._profile)
         
         # data acquisition
         self._kinectDump = False
         self._kinectFile = 'temp.txt'
-        self._kinectData = []
+        self._recorder = None
+        self._rgbdRecorder = None
+        self._rgbdReport = None
+        self._audio = None
+        self._audioReport = None
         
-        # control surface refresh rate
-        self._fps = 60
-        self._clock = pygame.time.Clock()
+        # point cloud and registration stages created on first use
+        self._pointCloud = None
+        self._registration = None
         
-        return
-    
-    # ~~~~~~~~ draw bone ~~~~~~~~
-    def _draw_bone(self, joints, jointPoints, joint0, joint1, color):
-#        # tracking states of both joints
-#        joint0State = joints[joint0].TrackingState
-#        joint1State = joints[joint1].TrackingState
-#        
-#        # tracking failure
-#        if (joint0State == PyKinectV2.TrackingState_NotTracked) or (joint1State == PyKinectV2.TrackingState_NotTracked):
-#            return
-#        
-#        # both joints are inferred
-#        if (joint0State == PyKinectV2.TrackingState_Inferred) and (joint1State == PyKinectV2.TrackingState_Inferred):
-#            return
-        
-        # draw bone
-        point0 = (jointPoints[joint0].x, jointPoints[joint0].y)
-        point1 = (jointPoints[joint1].x, jointPoints[joint1].y)
-        
-        try:
-            pygame.draw.line(self._frameSurface, color, point0, point1, 15)
-            pygame.draw.rect(self._frameSurface, (0, 255, 0), (int(point0[0])-5, int(point0[1])-5, 10, 10), 0)
-            pygame.draw.rect(self._frameSurface, (0, 255, 0), (int(point1[0])-5, int(point1[1])-5, 10, 10), 0)
-        except:
-            if self._debug: print('[DEBUG] PyGame drawing failed')
-        
-        return
-    
-    # ~~~~~~~~ draw body ~~~~~~~~
-    def _draw_body(self, joints, jointPoints, color):
-        # draw torso
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_Head, PyKinectV2.JointType_Neck, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_Neck, PyKinectV2.JointType_SpineShoulder, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_SpineShoulder, PyKinectV2.JointType_SpineMid, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_SpineMid, PyKinectV2.JointType_SpineBase, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_SpineShoulder, PyKinectV2.JointType_ShoulderLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_SpineShoulder, PyKinectV2.JointType_ShoulderRight, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_SpineBase, PyKinectV2.JointType_HipLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_SpineBase, PyKinectV2.JointType_HipRight, color)
-        
-        # draw left arm
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_ShoulderLeft, PyKinectV2.JointType_ElbowLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_ElbowLeft, PyKinectV2.JointType_WristLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_WristLeft, PyKinectV2.JointType_HandLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_HandLeft, PyKinectV2.JointType_HandTipLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_WristLeft, PyKinectV2.JointType_ThumbLeft, color)
-        
-        # draw right arm
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_ShoulderRight, PyKinectV2.JointType_ElbowRight, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_ElbowRight, PyKinectV2.JointType_WristRight, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_WristRight, PyKinectV2.JointType_HandRight, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_HandRight, PyKinectV2.JointType_HandTipRight, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_WristRight, PyKinectV2.JointType_ThumbRight, color)
-        
-        # draw left leg
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_HipLeft, PyKinectV2.JointType_KneeLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_KneeLeft, PyKinectV2.JointType_AnkleLeft, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_AnkleLeft, PyKinectV2.JointType_FootLeft, color)
-        
-        # draw right leg
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_HipRight, PyKinectV2.JointType_KneeRight, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_KneeRight, PyKinectV2.JointType_AnkleRight, color)
-        self._draw_bone(joints, jointPoints, PyKinectV2.JointType_AnkleRight, PyKinectV2.JointType_FootRight, color)
+        # control surface refresh rate (preview and headless runtimes pace without the pygame clock)
+        self._fps = 60
+        self._clock = None
+        if not (preview or headless):
+            import pygame
+            self._clock = pygame.time.Clock()
+        self._nextTick = 0.0
         
         return
     
@@ -154,82 +248,558 @@ class KinectRuntime(object):
         
         return
     
+    # ~~~~~~~~ draw preview frame ~~~~~~~~
+    def _draw_preview_frame(self, frame, targetW, targetH, frameSize=None, toneMapper=None):
+        # frames are BGRA color frames, or 16-bit infrared frames of frameSize
+        # mapped to BGRA by the tone mapper
+        frameW, frameH = frameSize or (self._colorFrame_W, self._colorFrame_H)
+        
+        # (re)allocate preview buffer and gather index on resize or source change only
+        if self._previewKey != (targetW, targetH, frameW, frameH):
+            rows = numpy.arange(targetH) * frameH // targetH
+            cols = numpy.arange(targetW) * frameW // targetW
+            self._previewIndex = (rows[:, None] * frameW + cols[None, :]).astype(numpy.intp).ravel()
+            if self._previewBuffer is None or self._previewBuffer.shape[:2] != (targetH, targetW):
+                self._previewBuffer = numpy.zeros((targetH, targetW, 4), dtype=numpy.uint8)
+                self._previewSurface = None
+                self._previewPixels = numpy.zeros(targetH * targetW, dtype=numpy.uint16)
+            self._previewScale = (targetW / frameW, targetH / frameH)
+            self._previewKey = (targetW, targetH, frameW, frameH)
+        
+        # nearest neighbour downscaling as a single gather of 32-bit pixels; infrared
+        # is gathered at 16 bits and then mapped through the tone table in one lookup
+        if frame is not None:
+            out = self._previewBuffer.view(numpy.uint32).reshape(-1)
+            if toneMapper is None:
+                numpy.take(frame.view(numpy.uint32), self._previewIndex, out=out, mode='clip')
+            else:
+                numpy.take(frame.reshape(-1), self._previewIndex, out=self._previewPixels, mode='clip')
+                toneMapper.bgra(self._previewPixels, out=out)
+        
+        return
+    
+    # ~~~~~~~~ dimension of preview source frames ~~~~~~~~
+    def _source_size(self, source='color'):
+        # infrared frames have the depth frame dimension
+        if source in ('infrared', 'longexposureinfrared'):
+            return self._depthFrame_W, self._depthFrame_H
+        
+        return self._colorFrame_W, self._colorFrame_H
+    
+    # ~~~~~~~~ get target frame dimension ~~~~~~~~
+    def _target_size(self, source='color'):
+        sourceW, sourceH = self._source_size(source)
+        if self._targetW is None and self._targetH is None:
+            targetW = sourceW
+            targetH = sourceH
+        elif self._targetW is None:
+            targetH = self._targetH
+            targetW = int(sourceW / sourceH * targetH)
+        elif self._targetH is None:
+            targetW = self._targetW
+            targetH = int(sourceH / sourceW * targetW)
+        else:
+            targetW = self._targetW
+            targetH = self._targetH
+        
+        return targetW, targetH
+    
+    # ~~~~~~~~ mapped joint points as (joints, 2) array ~~~~~~~~
+    def _joint_points(self, points):
+        if isinstance(points, ctypes.Array):
+            return numpy.ctypeslib.as_array(points).view(numpy.float32).reshape(-1, 2)
+        # PyKinect2 maps joints one by one into an object array
+        return [(point.x, point.y) for point in points]
+    
+    # ~~~~~~~~ joint records of all bodies ~~~~~~~~
+    def _gather_joints(self, bodies):
+        # (bodies, joints) SDK joint records copied with one copy per body
+        records = self._jointRecords[:len(bodies)]
+        jointCount = records.shape[1]
+        for i, body in enumerate(bodies):
+            records[i] = numpy.ctypeslib.as_array(body.joints, shape=(jointCount,))
+        
+        return records
+    
+    # ~~~~~~~~ map joints of all bodies to depth or color space ~~~~~~~~
+    def _map_joints(self, bodies, records, space, out):
+        # out is (bodies, joints, 2); the SDK coordinate mapper maps every
+        # joint of the frame in one call, stand-in sensors project per body
+        mapper = getattr(self._kinect, '_mapper', None)
+        if mapper is None:
+            project = self._kinect.body_joints_to_depth_space if space == 'depth' else self._kinect.body_joints_to_color_space
+            for i, body in enumerate(bodies):
+                out[i] = self._joint_points(project(body.joints))
+            return
+        count = records.size
+        camera = numpy.ctypeslib.as_array(self._cameraPoints)
+        camera[:count] = records['Position'].reshape(-1)
+        mapped = self._mappedPoints[space]
+        if space == 'depth':
+            mapper.MapCameraPointsToDepthSpace(ctypes.c_uint(count), self._cameraPoints, ctypes.c_uint(count), mapped)
+        else:
+            mapper.MapCameraPointsToColorSpace(ctypes.c_uint(count), self._cameraPoints, ctypes.c_uint(count), mapped)
+        out[...] = numpy.ctypeslib.as_array(mapped).view(numpy.float32).reshape(-1, 2)[:count].reshape(out.shape)
+        
+        return
+    
+    # ~~~~~~~~ sensor and host time of the last frame of a stream ~~~~~~~~
+    def _frame_time(self, stream, frame=None):
+        # sensor time is the SDK relative time in seconds where the runtime
+        # exposes it (body frames of PyKinect2, every frame of stand-in sensors);
+        # host time is time.perf_counter at arrival where the runtime records
+        # it and at retrieval otherwise
+        now = time.perf_counter()
+        relative = getattr(frame, 'relative_time', None)
+        if relative is None:
+            relative = getattr(self._kinect, 'relative_times', {}).get(stream)
+        hostTime = now
+        arrived = getattr(self._kinect, '_last_{}_frame_time'.format(RUNTIME_STREAMS[stream]), None)
+        if isinstance(arrived, datetime.datetime):
+            hostTime = now - min(max((datetime.datetime.now() - arrived).total_seconds(), 0.0), 1.0)
+        times = (None if relative is None else relative / 1e7, hostTime)
+        self._frameTimes[stream] = times
+        
+        return times
+    
+    # ~~~~~~~~ joint coordinates of all bodies in depth space ~~~~~~~~
+    def _body_coordinates(self, bodies, depthFrame=None):
+        # fills the preallocated (bodies, joints, 3) coordinates in one pass;
+        # joints outside the depth frame are clipped to its border, get zero
+        # depth and are marked invalid and not tracked instead of dropping the body
+        n = len(bodies)
+        points = self._jointPoints[:n]
+        pixels = self._jointPixels[:n]
+        depth = self._jointDepth[:n]
+        states = self._jointStates[:n]
+        valid = self._jointValid[:n]
+        coords = self._jointCoords[:n]
+        records = self._gather_joints(bodies)
+        self._map_joints(bodies, records, 'depth', points)
+        depth[...] = records['Position']['z']
+        states[...] = records['TrackingState']
+        
+        # truncate towards zero like int() after limiting infinite projections
+        numpy.nan_to_num(points, copy=False)
+        numpy.clip(points, -1e6, 1e6, out=points)
+        pixels[...] = points
+        x, y = pixels[..., 0], pixels[..., 1]
+        numpy.logical_and((x >= 0) & (x < self._depthFrame_W), (y >= 0) & (y < self._depthFrame_H), out=valid)
+        numpy.clip(x, 0, self._depthFrame_W - 1, out=coords[..., 0])
+        numpy.clip(y, 0, self._depthFrame_H - 1, out=coords[..., 1])
+        
+        # sample depth frame or fall back to joint camera space depth in millimeters
+        if depthFrame is None:
+            depthFrame = self._depthFrame
+        if self._useDepth:
+            coords[..., 2] = depthFrame[coords[..., 1], coords[..., 0]]
+        else:
+            numpy.multiply(depth, 1000, out=coords[..., 2], casting='unsafe')
+        coords[..., 2][~valid] = 0
+        states[~valid] = PyKinectV2.TrackingState_NotTracked
+        
+        return coords, valid
+    
+    # ~~~~~~~~ draw skeleton overlay of all bodies ~~~~~~~~
+    def _draw_overlay(self, bodies, surface, scale, depthSpace=False):
+        # infrared previews are in depth space; joints mapped there are scaled
+        # to color frame pixels so that bones and joints keep their size
+        if self._overlay is None or not bodies:
+            return
+        if surface is None:
+            # preview surface sharing the preview buffer, created on first use
+            # so that previews without an overlay never load pygame
+            import pygame
+            h, w = self._previewBuffer.shape[:2]
+            self._previewSurface = surface = pygame.image.frombuffer(self._previewBuffer, (w, h), 'BGRA')
+        points = self._colorPoints[:len(bodies)]
+        self._map_joints(bodies, self._gather_joints(bodies), 'depth' if depthSpace else 'color', points)
+        if depthSpace:
+            ratio = self._colorFrame_W / self._depthFrame_W
+            points *= ratio
+            scale = (scale[0] / ratio, scale[1] / ratio)
+        self._overlay.draw(surface, points, scale)
+        
+        return
+    
     # ~~~~~~~~ set target frame dimension ~~~~~~~~
     def setFrameSize(self, size=(None, None)):
         self._targetW, self._targetH = size
         
         return
     
+    # ~~~~~~~~ set preview source ~~~~~~~~
+    def setPreviewSource(self, source=None):
+        # None selects color, or the first open infrared source without color;
+        # infrared previews need preview mode
+        if source is None:
+            sources = [name for name in PREVIEW_SOURCES if self._sources & SOURCES[name]]
+            if not self._preview:
+                sources = sources[:1] if sources[:1] == ['color'] else []
+            source = sources[0] if sources else None
+        elif source not in PREVIEW_SOURCES or not self._sources & SOURCES[source]:
+            raise ValueError('Preview source is not open: {}'.format(source))
+        elif source != 'color' and not self._preview:
+            raise ValueError('Infrared preview needs preview mode')
+        self._previewSource = source
+        
+        return
+    
+    # ~~~~~~~~ current preview source ~~~~~~~~
+    def previewSource(self):
+        return self._previewSource
+    
+    # ~~~~~~~~ tone mapping of an infrared source ~~~~~~~~
+    def toneMapper(self, source='infrared'):
+        # the InfraredToneMapper can be configured (gamma, range) while running
+        return self._toneMappers[source]
+    
+    # ~~~~~~~~ set temporal joint filter ~~~~~~~~
+    def setFilter(self, jointFilter):
+        # None disables filtering
+        if jointFilter is not None:
+            jointFilter.reset()
+        self._filter = jointFilter
+        
+        return
+    
+    # ~~~~~~~~ set frame rate limit ~~~~~~~~
+    def setFrameRate(self, fps):
+        # 0 polls the sensor as fast as possible
+        self._fps = fps
+        
+        return
+    
+    # ~~~~~~~~ wait for next frame period without the pygame clock ~~~~~~~~
+    def _tick(self):
+        if not self._fps:
+            return
+        now = time.time()
+        self._nextTick = max(self._nextTick + 1.0 / self._fps, now)
+        if self._nextTick > now:
+            time.sleep(self._nextTick - now)
+        
+        return
+    
     # ~~~~~~~~ get frame from device ~~~~~~~~
     def getFrame(self):
+        profile = self._profile
+        t0 = t = profile.start()
+        
         # received a color frame
-        if self._kinect.has_new_color_frame():
+        newColor = self._useColor and self._kinect.has_new_color_frame()
+        if newColor:
             self._colorFrame = self._kinect.get_last_color_frame()
-            self._draw_color_frame(self._colorFrame, self._frameSurface)
+            profile.arrival('color', self._frame_time('color')[0])
+            self._frameIndex += 1
+            if self._frameSurface is not None:
+                self._draw_color_frame(self._colorFrame, self._frameSurface)
+            t = profile.stamp('color', t)
         
         # received a depth frame
-        if self._kinect.has_new_depth_frame():
+        newDepth = self._useDepth and self._kinect.has_new_depth_frame()
+        if newDepth:
             self._depthFrame = self._kinect.get_last_depth_frame()
             self._depthFrame = self._depthFrame.reshape(self._depthFrame_H, self._depthFrame_W)
+            times = self._frame_time('depth')
+            profile.arrival('depth', times[0])
+            self._sync.add('depth', self._depthFrame, *times)
+            t = profile.stamp('depth', t)
+        
+        # received a body index frame
+        newBodyIndex = self._useBodyIndex and self._kinect.has_new_body_index_frame()
+        if newBodyIndex:
+            self._bodyIndexFrame = self._kinect.get_last_body_index_frame()
+            profile.arrival('bodyindex', self._frame_time('bodyindex')[0])
+            self._bodyIndexFrame = self._bodyIndexFrame.reshape(self._depthFrame_H, self._depthFrame_W)
+            t = profile.stamp('bodyindex', t)
+        
+        # received infrared frames; the scene range of the previewed one is followed
+        # by its tone mapper (see infrared.py)
+        newInfrared = self._useInfrared and self._kinect.has_new_infrared_frame()
+        if newInfrared:
+            self._infraredFrame = self._kinect.get_last_infrared_frame()
+            self._infraredFrame = self._infraredFrame.reshape(self._depthFrame_H, self._depthFrame_W)
+            self._sync.add('infrared', self._infraredFrame, *self._frame_time('infrared'))
+            if self._previewSource == 'infrared':
+                self._toneMappers['infrared'].update(self._infraredFrame)
+                self._frameIndex += not self._useColor
+            t = profile.stamp('infrared', t)
+        newLongExposure = self._useLongExposure and self._kinect.has_new_long_exposure_infrared_frame()
+        if newLongExposure:
+            self._longExposureFrame = self._kinect.get_last_long_exposure_infrared_frame()
+            self._longExposureFrame = self._longExposureFrame.reshape(self._depthFrame_H, self._depthFrame_W)
+            self._sync.add('longexposureinfrared', self._longExposureFrame, *self._frame_time('longexposureinfrared'))
+            if self._previewSource == 'longexposureinfrared':
+                self._toneMappers['longexposureinfrared'].update(self._longExposureFrame)
+                self._frameIndex += not self._useColor
+            t = profile.stamp('infrared', t)
+        
+        # raw depth, color, body index and infrared frames are handed to the encoder pool as received
+        rgbdRecorder = self._rgbdRecorder
+        if rgbdRecorder is not None and (newDepth or newColor or newBodyIndex or newInfrared or newLongExposure):
+            rgbdRecorder.write(self._depthFrame if newDepth else None,
+                               self._colorFrame if newColor else None,
+                               (self._depthFrame_W, self._depthFrame_H),
+                               (self._colorFrame_W, self._colorFrame_H),
+                               bodyIndex=self._bodyIndexFrame if newBodyIndex else None,
+                               infrared=self._infraredFrame if newInfrared else None,
+                               longExposure=self._longExposureFrame if newLongExposure else None,
+                               times=self._frameTimes)
+            t = profile.stamp('rgbd', t)
         
         # recceived a body frame
-        if self._kinect.has_new_body_frame():
+        newBody = self._useBody and self._kinect.has_new_body_frame()
+        if newBody:
             self._bodyFrame = self._kinect.get_last_body_frame()
+            self._frameIndex += 1
+            self._bodyData = self._jointRows[:0]
+            self._bodyValid = self._jointValid[:0]
+            self._bodyIds = self._trackingIds[:0]
+            self._bodySlots = self._sensorSlots[:0]
+            self._bodyTime = time.time()
+            sensorTime = self._frame_time('body', self._bodyFrame)[0]
+            profile.arrival('body', sensorTime)
+            audio = self._audio
+            if audio is not None and sensorTime is not None:
+                # audio sub-frames share the sensor clock and are timestamped like
+                # skeletons with the smallest offset seen to keep them monotonic
+                offset = self._bodyTime - sensorTime
+                if audio.clockOffset is None or offset < audio.clockOffset:
+                    audio.clockOffset = offset
+            t = profile.stamp('body', t)
         
         # detected body
+        bodies = []
         if self._bodyFrame is not None:
-            for i in range(self._kinect.max_body_count):
-                body = self._bodyFrame.bodies[i]
-                if not body.is_tracked:
-                    continue
-                joints = body.joints
-                jointPoints = self._kinect.body_joints_to_color_space(joints)
-                self._draw_body(joints, jointPoints, (255, 100, 100))
-                depthPoints = self._kinect.body_joints_to_depth_space(joints)
-                coordinates = []
-                for j in range(len(depthPoints)):
-                    x = int(max(min(depthPoints[j].x, 1e6), -1e6))
-                    y = int(max(min(depthPoints[j].y, 1e6), -1e6))
-                    if x < 0 or x >= self._depthFrame_W or y < 0 or y >= self._depthFrame_H:
-                        coordinates = []
-                        break
-                    z = self._depthFrame[y, x]
-                    coordinates.append(x)
-                    coordinates.append(y)
-                    coordinates.append(z)
-                if len(coordinates) > 0 and self._kinectDump:
-                    self._kinectData.append(coordinates)
-                if len(self._kinectData) > 0 and not self._kinectDump:
-                    data = numpy.asarray(self._kinectData, dtype='int')
-                    numpy.savetxt(self._kinectFile, data, fmt='%d')
-                    self._kinectData = []
-        
-        # copy back buffer surface to window preserving aspect ratio
-        if self._targetW is None and self._targetH is None:
-            targetW = self._frameSurface.get_width()
-            targetH = self._frameSurface.get_height()
-        elif self._targetW is None:
-            targetH = self._targetH
-            targetW = int(self._aspect_ratio_w_h * targetH)
-        elif self._targetH is None:
-            targetW = self._targetW
-            targetH = int(self._aspect_ratio_h_w * targetW)
-        else:
-            targetW = self._targetW
-            targetH = self._targetH
-        target_surface = pygame.transform.scale(self._frameSurface, (targetW, targetH))
+            slots = [i for i in range(self._kinect.max_body_count) if self._bodyFrame.bodies[i].is_tracked]
+            bodies = [self._bodyFrame.bodies[i] for i in slots]
+            if newBody and not (self._useDepth and self._depthFrame is None):
+                # joint depths are sampled from the depth frame captured with the
+                # body frame, or from the latest one when none is within tolerance
+                depthFrame = None
+                if self._useDepth:
+                    depthFrame = self._sync.nearest('depth', *self._frameTimes['body'])[0]
+                coords, valid = self._body_coordinates(bodies, depthFrame)
+                self._bodyData = self._jointRows[:len(bodies)]
+                self._bodyValid = valid
+                self._trackingIds[:len(bodies)] = [body.tracking_id for body in bodies]
+                self._bodyIds = self._trackingIds[:len(bodies)]
+                self._sensorSlots[:len(bodies)] = slots
+                self._bodySlots = self._sensorSlots[:len(bodies)]
+                if self._filter is not None:
+                    sensorTime, hostTime = self._frameTimes['body']
+                    filtered = self._filter.filter(coords, self._bodyIds, hostTime if sensorTime is None else sensorTime,
+                                                   self._jointStates[:len(bodies)])
+                    numpy.copyto(self._filteredCoords[:len(bodies)], numpy.rint(filtered), casting='unsafe')
+                    self._bodyData = self._filteredRows[:len(bodies)]
+                    t = profile.stamp('filter', t)
+                recorder = self._recorder
+                if recorder is not None and bodies:
+                    # bodies keep their sensor slots; the recorder copies them out of the joint buffers
+                    recorder.writeFrame(coords, self._bodyIds, self._jointStates[:len(bodies)], self._bodyTime, self._bodySlots)
+            t = profile.stamp('skeleton', t)
         
-        # convert pygame surface to numpy array
-        frame = pygame.surfarray.array3d(target_surface)
+        # preview frame is a contiguous (height, width, 4) BGRA view drawn at target resolution
+        source = self._previewSource
+        if self._headless or source is None:
+            frame = None
+        elif self._preview:
+            targetW, targetH = self._target_size(source)
+            if source == 'color':
+                self._draw_preview_frame(self._colorFrame, targetW, targetH)
+            else:
+                infraredFrame = self._infraredFrame if source == 'infrared' else self._longExposureFrame
+                self._draw_preview_frame(infraredFrame, targetW, targetH, self._source_size(source), self._toneMappers[source])
+            t = profile.stamp('preview', t)
+            self._draw_overlay(bodies, self._previewSurface, self._previewScale, source != 'color')
+            t = profile.stamp('overlay', t)
+            frame = self._previewBuffer
+        else:
+            # copy back buffer surface to window preserving aspect ratio
+            import pygame
+            targetW, targetH = self._target_size()
+            target_surface = pygame.transform.scale(self._frameSurface, (targetW, targetH))
+            self._draw_overlay(bodies, target_surface, (targetW / self._colorFrame_W, targetH / self._colorFrame_H))
+            
+            # convert pygame surface to numpy array
+            frame = pygame.surfarray.array3d(target_surface)
+            t = profile.stamp('scale', t)
+        profile.stamp('getFrame', t0)
         
         # limit frames per second
-        self._clock.tick(self._fps)
+        if self._clock is not None:
+            self._clock.tick(self._fps)
+        else:
+            self._tick()
         
         return frame
     
+    # ~~~~~~~~ start recording ~~~~~~~~
+    def startRecording(self, path=None, rgbd=None, audio='wav', **options):
+        # rgbd selects raw stream capture: None, 'depth' or a color format ('jpeg', 'png', 'raw');
+        # audio selects the format of the audio beam track ('wav', 'flac' or None)
+        # recorded on its own threads when the audio source is open
+        self.stopRecording()
+        if path is not None:
+            self._kinectFile = path
+        if rgbd is not None:
+            from rgbd import RGBDRecorder
+            rgbdRecorder = RGBDRecorder(self._kinectFile, color=None if rgbd == 'depth' or not self._useColor else rgbd,
+                                        bodyIndex=self._useBodyIndex, infrared=self._useInfrared,
+                                        longExposure=self._useLongExposure)
+            rgbdRecorder.start()
+            self._rgbdRecorder = rgbdRecorder
+        if audio is not None and self._useAudio:
+            from audio import AudioCapture, openAudioSource
+            audioCapture = AudioCapture(openAudioSource(self._kinect), self._kinectFile, audio)
+            audioCapture.start()
+            self._audio = audioCapture
+        recorder = SkeletonRecorder(self._kinectFile, **options)
+        recorder.start()
+        self._recorder = recorder
+        self._kinectDump = True
+        
+        return recorder
+    
+    # ~~~~~~~~ stop recording ~~~~~~~~
+    def stopRecording(self):
+        recorder = self._recorder
+        rgbdRecorder = self._rgbdRecorder
+        audioCapture = self._audio
+        self._recorder = None
+        self._rgbdRecorder = None
+        self._audio = None
+        self._kinectDump = False
+        if audioCapture is not None:
+            self._audioReport = audioCapture.stop()
+            if self._debug: print('[DEBUG] Audio recording report: {}'.format(self._audioReport))
+        if rgbdRecorder is not None:
+            self._rgbdReport = rgbdRecorder.stop()
+            if self._debug: print('[DEBUG] RGB-D recording report: {}'.format(self._rgbdReport))
+        if recorder is not None:
+            recorder.stop()
+            if self._debug: print('[DEBUG] Recorded {} frames ({} dropped)'.format(recorder.frames, recorder.dropped))
+        
+        return recorder
+    
+    # ~~~~~~~~ report of last raw stream recording ~~~~~~~~
+    def rgbdReport(self):
+        return self._rgbdReport
+    
+    # ~~~~~~~~ report of last audio recording ~~~~~~~~
+    def audioReport(self):
+        return self._audioReport
+    
+    # ~~~~~~~~ latest audio beam angle and confidence while recording ~~~~~~~~
+    def audioBeam(self):
+        # (radians, 0 to 1) or None
+        return self._audio.beam() if self._audio is not None else None
+    
+    # ~~~~~~~~ point cloud of latest depth frame ~~~~~~~~
+    def getPointCloud(self, **options):
+        # (n, 3) camera space points in meters, overwritten on the next call;
+        # options (decimation, roi, minDepth, maxDepth) recreate the stage
+        if self._depthFrame is None:
+            return None
+        if self._pointCloud is None or options:
+            from pointcloud import PointCloud
+            self._pointCloud = PointCloud(self._kinect, **options)
+        
+        return self._pointCloud.points(self._depthFrame)
+    
+    # ~~~~~~~~ depth to color registration ~~~~~~~~
+    def getRegistration(self):
+        # mapping tables are built once per sensor and reused for every frame
+        if self._registration is None:
+            from registration import Registration
+            self._registration = Registration(self._kinect)
+        
+        return self._registration
+    
+    # ~~~~~~~~ registered color of body pixels in latest frames ~~~~~~~~
+    def getForeground(self, body=None):
+        # (h, w, 4) BGRA at depth resolution with background pixels set to zero
+        if self._depthFrame is None or self._colorFrame is None or self._bodyIndexFrame is None:
+            return None
+        
+        return self.getRegistration().removeBackground(self._depthFrame, self._colorFrame, self._bodyIndexFrame, body)
+    
+    # ~~~~~~~~ number of frames received ~~~~~~~~
+    def frameIndex(self):
+        return self._frameIndex
+    
+    # ~~~~~~~~ latest depth frame ~~~~~~~~
+    def depthFrame(self):
+        # (height, width) uint16 in millimeters, replaced on every new depth frame
+        return self._depthFrame
+    
+    # ~~~~~~~~ latest infrared frame ~~~~~~~~
+    def infraredFrame(self):
+        # (height, width) uint16 intensities, replaced on every new infrared frame
+        return self._infraredFrame
+    
+    # ~~~~~~~~ latest long exposure infrared frame ~~~~~~~~
+    def longExposureInfraredFrame(self):
+        # (height, width) uint16 intensities, replaced on every new frame
+        return self._longExposureFrame
+    
+    # ~~~~~~~~ joint coordinates of tracked bodies ~~~~~~~~
+    def bodyData(self):
+        # (bodies, joints * 3) view that is overwritten on the next body frame;
+        # filtered when a joint filter is set (for display and streaming)
+        return self._bodyData
+    
+    # ~~~~~~~~ unfiltered joint coordinates of tracked bodies ~~~~~~~~
+    def rawBodyData(self):
+        # (bodies, joints * 3) view of the joints as recorded
+        return self._jointRows[:len(self._bodyData)]
+    
+    # ~~~~~~~~ joint validity of tracked bodies ~~~~~~~~
+    def bodyValid(self):
+        # (bodies, joints) mask of joints inside the depth frame
+        return self._bodyValid
+    
+    # ~~~~~~~~ tracking ids of tracked bodies ~~~~~~~~
+    def bodyIds(self):
+        return self._bodyIds
+    
+    # ~~~~~~~~ sensor body slots of tracked bodies ~~~~~~~~
+    def bodySlots(self):
+        # (bodies,) slots of the SDK body frame, kept by binary recordings
+        return self._bodySlots
+    
+    # ~~~~~~~~ joint tracking states of tracked bodies ~~~~~~~~
+    def bodyStates(self):
+        # (bodies, joints) view that is overwritten on the next body frame
+        return self._jointStates[:len(self._bodyData)]
+    
+    # ~~~~~~~~ host time of latest body frame ~~~~~~~~
+    def bodyTime(self):
+        return self._bodyTime
+    
+    # ~~~~~~~~ sensor and host times of the latest frames ~~~~~~~~
+    def frameTimes(self):
+        # {stream: (SDK relative time in seconds or None, time.perf_counter time)}
+        return dict(self._frameTimes)
+    
+    # ~~~~~~~~ host time of the frame shown in the preview ~~~~~~~~
+    def captureTime(self):
+        # the color frame where color is read, the body frame otherwise
+        times = self._frameTimes.get('color' if self._useColor else 'body')
+        
+        return times[1] if times is not None else 0.0
+    
+    # ~~~~~~~~ body and depth pairing statistics ~~~~~~~~
+    def syncReport(self):
+        return self._sync.report()
+    
     # ~~~~~~~~ clean up and release resources ~~~~~~~~
     def clear(self):
+        self.stopRecording()
+        self._sync.clear()
         self._kinect.close()
-        pygame.quit()
+        if 'pygame' in sys.modules:
+            sys.modules['pygame'].quit()
         
         return
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Pure Python mirror of PyKinectV2 constants and structures.
+Used in place of pykinect2 on machines without the Kinect for Windows SDK.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+import ctypes
+
+
+# frame source types
+FrameSourceTypes_None = 0x0
+FrameSourceTypes_Color = 0x1
+FrameSourceTypes_Infrared = 0x2
+FrameSourceTypes_LongExposureInfrared = 0x4
+FrameSourceTypes_Depth = 0x8
+FrameSourceTypes_BodyIndex = 0x10
+FrameSourceTypes_Body = 0x20
+FrameSourceTypes_Audio = 0x40
+
+# joint types
+JointType_SpineBase = 0
+JointType_SpineMid = 1
+JointType_Neck = 2
+JointType_Head = 3
+JointType_ShoulderLeft = 4
+JointType_ElbowLeft = 5
+JointType_WristLeft = 6
+JointType_HandLeft = 7
+JointType_ShoulderRight = 8
+JointType_ElbowRight = 9
+JointType_WristRight = 10
+JointType_HandRight = 11
+JointType_HipLeft = 12
+JointType_KneeLeft = 13
+JointType_AnkleLeft = 14
+JointType_FootLeft = 15
+JointType_HipRight = 16
+JointType_KneeRight = 17
+JointType_AnkleRight = 18
+JointType_FootRight = 19
+JointType_SpineShoulder = 20
+JointType_HandTipLeft = 21
+JointType_ThumbLeft = 22
+JointType_HandTipRight = 23
+JointType_ThumbRight = 24
+JointType_Count = 25
+
+# tracking states
+TrackingState_NotTracked = 0
+TrackingState_Inferred = 1
+TrackingState_Tracked = 2
+
+# maximum number of tracked bodies
+BODY_COUNT = 6
+
+
+# coordinate structures
+class _CameraSpacePoint(ctypes.Structure):
+    _fields_ = [('x', ctypes.c_float),
+                ('y', ctypes.c_float),
+                ('z', ctypes.c_float)]
+
+
+class _ColorSpacePoint(ctypes.Structure):
+    _fields_ = [('x', ctypes.c_float),
+                ('y', ctypes.c_float)]
+
+
+class _DepthSpacePoint(ctypes.Structure):
+    _fields_ = [('x', ctypes.c_float),
+                ('y', ctypes.c_float)]
+
+
+class _Joint(ctypes.Structure):
+    _fields_ = [('JointType', ctypes.c_int),
+                ('Position', _CameraSpacePoint),
+                ('TrackingState', ctypes.c_int)]
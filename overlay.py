@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Batched skeleton overlay rendering.
+Draws the bones of all tracked bodies as polylines and all joints as one
+pixel scatter directly on the (small) target surface.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+import os
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+from skeleton import bones, chains
+
+
+# SkeletonOverlay class
+class SkeletonOverlay(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, boneColor=(255, 100, 100), jointColor=(0, 255, 0), boneWidth=15, jointSize=10, jointCount=25):
+        # colors and sizes (in color frame pixels, scaled to the target surface)
+        self.boneColor = boneColor
+        self.jointColor = jointColor
+        self.boneWidth = boneWidth
+        self.jointSize = jointSize
+        
+        # bones are built once and drawn as a few polylines per body
+        self.chains = chains(bones(jointCount))
+        
+        # pixel offsets of a square joint marker for the current size
+        self._markerSize = None
+        self._markerOffsets = None
+        
+        return
+    
+    # ~~~~~~~~ pixel offsets of a joint marker ~~~~~~~~
+    def _marker_offsets(self, size):
+        if size != self._markerSize:
+            offsets = numpy.arange(size) - size // 2
+            self._markerOffsets = (numpy.repeat(offsets, size), numpy.tile(offsets, size))
+            self._markerSize = size
+        
+        return self._markerOffsets
+    
+    # ~~~~~~~~ draw skeletons ~~~~~~~~
+    def draw(self, surface, points, scale=(1.0, 1.0)):
+        # points is a (bodies, joints, 2) array of joint positions in color space
+        if len(points) == 0:
+            return
+        w, h = surface.get_size()
+        limit = 4 * max(w, h)
+        points = numpy.nan_to_num(numpy.multiply(points, scale))
+        numpy.clip(points, -limit, limit, out=points)
+        
+        # bones
+        width = max(1, int(self.boneWidth * scale[0]))
+        for body in points:
+            for chain in self.chains:
+                pygame.draw.lines(surface, self.boneColor, False, body[chain].tolist(), width)
+        
+        # joints of all bodies in a single scatter into the surface pixels
+        dx, dy = self._marker_offsets(max(2, int(self.jointSize * scale[0])))
+        x = (points[..., 0].astype(numpy.intp).reshape(-1, 1) + dx).ravel()
+        y = (points[..., 1].astype(numpy.intp).reshape(-1, 1) + dy).ravel()
+        inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[x[inside], y[inside]] = surface.map_rgb(self.jointColor) & 0xffffffff
+        del pixels
+        
+        return
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Playback of recorded Kinect sessions through the KinectRuntime interface.
+Replays skeleton recordings (and raw depth/color/infrared streams where available)
+either at the original timing or as fast as possible.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+import os
+import time
+
+import kinectv2
+import recording
+from kinect import KinectRuntime
+from rgbd import STREAM_SOURCES, StreamReader
+from synthetic import SyntheticRuntime
+
+
+# PlaybackSensor class
+class PlaybackSensor(SyntheticRuntime):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, path, realtime=True, loop=True, fps=30):
+        super(PlaybackSensor, self).__init__(body_count=0, fps=fps)
+        
+        # playback mode
+        self._realtime = realtime
+        self._loop = loop
+        
+        # skeleton records grouped into frames by timestamp
+        self._load_skeleton(path, fps)
+        
+        # raw streams recorded next to the skeleton file
+        base = os.path.splitext(path)[0]
+        self._streams = {}
+        for stream in STREAM_SOURCES:
+            streamPath = '{}.{}.kstream'.format(base, stream)
+            if os.path.exists(streamPath):
+                reader = StreamReader(streamPath)
+                if len(reader) > 0:
+                    self._streams[stream] = (reader, reader.timestamps())
+        
+        # playback position; as fast as possible it advances once per poll of
+        # the runtime after a frame of any open stream was consumed
+        self._position = 0
+        self._consumed = False
+        self._last_color_frame_access = -1
+        self._last_depth_frame_access = -1
+        self._last_body_frame_access = -1
+        self._last_body_index_frame_access = -1
+        self._last_infrared_frame_access = -1
+        self._last_long_exposure_infrared_frame_access = -1
+        self._start = time.time()
+        
+        return
+    
+    # ~~~~~~~~ load skeleton recording ~~~~~~~~
+    def _load_skeleton(self, path, fps):
+        # frame records (version 2) are one frame each, body records are grouped by timestamp
+        self._frames = None
+        if os.path.splitext(path)[-1].lower() == recording.BINARY_EXTENSION:
+            records = recording.loadBinary(path)
+            timestamps = numpy.asarray(records['timestamp'])
+            if recording.isFrameRecord(records):
+                self._frames = records
+                starts = numpy.arange(len(records))
+            else:
+                starts = numpy.concatenate([[0], numpy.flatnonzero(numpy.diff(timestamps) != 0) + 1])
+            self._coords = records['coords']
+            self._states = records['state']
+            self._bodies = records['body']
+        else:
+            data = recording.loadText(path)
+            self._coords = data.reshape(len(data), -1, 3)
+            self._states = None
+            self._bodies = None
+            timestamps = numpy.arange(len(data)) / fps
+            starts = numpy.arange(len(data))
+        self._frameStarts = starts
+        self._frameEnds = numpy.concatenate([starts[1:], [len(self._coords)]])
+        self._frameTimes = timestamps[starts] - timestamps[starts[0]] if len(starts) else numpy.zeros(0)
+        self._timeOrigin = timestamps[starts[0]] if len(starts) else 0.0
+        
+        return
+    
+    # ~~~~~~~~ recorded bodies of a frame ~~~~~~~~
+    def _frame_bodies(self, position):
+        # {sensor slot: (tracking id, (joints, 3) coordinates, joint states or None)}
+        if self._frames is not None:
+            record = self._frames[position]
+            return {int(slot): (int(record['body'][slot]), record['coords'][slot], record['state'][slot])
+                    for slot in numpy.flatnonzero(record['tracked'])}
+        bodies = {}
+        for i, row in enumerate(range(self._frameStarts[position], self._frameEnds[position])):
+            bodies[i] = (int(self._bodies[row]) if self._bodies is not None else i + 1,
+                         self._coords[row],
+                         self._states[row] if self._states is not None else None)
+        
+        return bodies
+    
+    # ~~~~~~~~ number of frames ~~~~~~~~
+    def frameCount(self):
+        return len(self._frameStarts)
+    
+    # ~~~~~~~~ playback finished ~~~~~~~~
+    def finished(self):
+        return not self._loop and self._current() >= self.frameCount() - 1 and self._consumed
+    
+    # ~~~~~~~~ current frame number ~~~~~~~~
+    def _current(self):
+        count = self.frameCount()
+        if count == 0:
+            return 0
+        if self._realtime:
+            elapsed = time.time() - self._start
+            duration = self._frameTimes[-1] + self._period
+            if self._loop:
+                elapsed = elapsed % duration
+            position = int(numpy.searchsorted(self._frameTimes, elapsed, side='right')) - 1
+            return min(max(position, 0), count - 1)
+        
+        return self._position
+    
+    # ~~~~~~~~ advance to the next frame when replaying as fast as possible ~~~~~~~~
+    def advance(self):
+        # called before every poll so that all streams of a poll see one frame
+        count = self.frameCount()
+        if self._realtime or count == 0 or not self._consumed:
+            return
+        if self._loop or self._position < count - 1:
+            self._position = (self._position + 1) % count
+            self._consumed = False
+        
+        return
+    
+    # ~~~~~~~~ frame number used for access bookkeeping ~~~~~~~~
+    def _frame_number(self):
+        return self._current()
+    
+    # ~~~~~~~~ new color frame ~~~~~~~~
+    def has_new_color_frame(self):
+        return self._current() != self._last_color_frame_access
+    
+    # ~~~~~~~~ new depth frame ~~~~~~~~
+    def has_new_depth_frame(self):
+        return self._current() != self._last_depth_frame_access
+    
+    # ~~~~~~~~ new body frame ~~~~~~~~
+    def has_new_body_frame(self):
+        return self.frameCount() > 0 and self._current() != self._last_body_frame_access
+    
+    # ~~~~~~~~ new body index frame ~~~~~~~~
+    def has_new_body_index_frame(self):
+        return 'bodyidx' in self._streams and self._current() != self._last_body_index_frame_access
+    
+    # ~~~~~~~~ new infrared frame ~~~~~~~~
+    def has_new_infrared_frame(self):
+        return 'infrared' in self._streams and self._current() != self._last_infrared_frame_access
+    
+    # ~~~~~~~~ new long exposure infrared frame ~~~~~~~~
+    def has_new_long_exposure_infrared_frame(self):
+        return 'irlong' in self._streams and self._current() != self._last_long_exposure_infrared_frame_access
+    
+    # ~~~~~~~~ relative time of a playback frame ~~~~~~~~
+    def _relative_time(self, position):
+        return int(self._frameTimes[position] * 1e7) if self.frameCount() else 0
+    
+    # ~~~~~~~~ recorded stream frame nearest to a playback frame ~~~~~~~~
+    def _stream_frame(self, stream, position):
+        # the recorded time of the frame becomes its relative time
+        reader, timestamps = self._streams[stream]
+        t = self._timeOrigin + (self._frameTimes[position] if self.frameCount() else 0.0)
+        i = int(numpy.searchsorted(timestamps, t))
+        i = min(i, len(timestamps) - 1)
+        if i > 0 and abs(timestamps[i-1] - t) < abs(timestamps[i] - t):
+            i -= 1
+        self.relative_times[STREAM_SOURCES[stream]] = int((timestamps[i] - self._timeOrigin) * 1e7)
+        
+        return reader.read(i)[2]
+    
+    # ~~~~~~~~ last color frame ~~~~~~~~
+    def get_last_color_frame(self):
+        position = self._current()
+        self._last_color_frame_access = position
+        self._consumed = True
+        if 'color' in self._streams:
+            return self._stream_frame('color', position).ravel()
+        self.relative_times['color'] = self._relative_time(position)
+        
+        return self._color.copy()
+    
+    # ~~~~~~~~ last depth frame ~~~~~~~~
+    def get_last_depth_frame(self):
+        position = self._current()
+        self._last_depth_frame_access = position
+        self._consumed = True
+        if 'depth' in self._streams:
+            return self._stream_frame('depth', position).ravel()
+        self.relative_times['depth'] = self._relative_time(position)
+        
+        # without a depth stream the recorded joint depths are painted at
+        # their pixels so that depth lookups reproduce the recorded values
+        w, h = self.depth_frame_desc.Width, self.depth_frame_desc.Height
+        depth = self._depth.reshape(h, w).copy()
+        if self.frameCount():
+            coords = [coords for body, coords, states in self._frame_bodies(position).values()]
+            for x, y, z in numpy.reshape(coords, (-1, 3)).astype(int):
+                if 0 <= x < w and 0 <= y < h:
+                    depth[max(y-1, 0):y+2, max(x-1, 0):x+2] = z
+        
+        return depth.ravel()
+    
+    # ~~~~~~~~ last body index frame ~~~~~~~~
+    def get_last_body_index_frame(self):
+        position = self._current()
+        self._last_body_index_frame_access = position
+        self._consumed = True
+        
+        return self._stream_frame('bodyidx', position).ravel()
+    
+    # ~~~~~~~~ last infrared frame ~~~~~~~~
+    def get_last_infrared_frame(self):
+        position = self._current()
+        self._last_infrared_frame_access = position
+        self._consumed = True
+        
+        return self._stream_frame('infrared', position).ravel()
+    
+    # ~~~~~~~~ last long exposure infrared frame ~~~~~~~~
+    def get_last_long_exposure_infrared_frame(self):
+        position = self._current()
+        self._last_long_exposure_infrared_frame_access = position
+        self._consumed = True
+        
+        return self._stream_frame('irlong', position).ravel()
+    
+    # ~~~~~~~~ last body frame ~~~~~~~~
+    def get_last_body_frame(self):
+        position = self._current()
+        self._last_body_frame_access = position
+        self._consumed = True
+        fx, fy, cx, cy = self.DEPTH_INTRINSICS
+        tracked = self._frame_bodies(position)
+        for i, body in enumerate(self._bodyFrame.bodies):
+            body.is_tracked = i in tracked
+            if not body.is_tracked:
+                body.tracking_id = 0
+                continue
+            body.tracking_id, coords, states = tracked[i]
+            coords = numpy.asarray(coords, dtype=numpy.float64)
+            # recorded depth space pixels (centers) and millimeters back to camera space meters
+            z = numpy.maximum(coords[:, 2], 1.0) / 1000.0
+            x = (coords[:, 0] + 0.5 - cx) * z / fx
+            y = (cy - coords[:, 1] - 0.5) * z / fy
+            for j in range(min(len(coords), kinectv2.JointType_Count)):
+                joint = body.joints[j]
+                joint.JointType = j
+                joint.Position.x = x[j]
+                joint.Position.y = y[j]
+                joint.Position.z = z[j]
+                joint.TrackingState = int(states[j]) if states is not None else kinectv2.TrackingState_Tracked
+        self._bodyFrame.relative_time = self._relative_time(position)
+        
+        return self._bodyFrame
+    
+    # ~~~~~~~~ close ~~~~~~~~
+    def close(self):
+        for reader, timestamps in self._streams.values():
+            reader.close()
+        self._streams = {}
+        
+        return
+
+
+# PlaybackRuntime class
+class PlaybackRuntime(KinectRuntime):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, path, realtime=True, loop=True, preview=False, sources=None, profile=None, overlay=True, headless=False,
+                 jointFilter=None, previewSource=None):
+        super(PlaybackRuntime, self).__init__(preview=preview,
+                                              sensor=PlaybackSensor(path, realtime, loop),
+                                              sources=sources,
+                                              profile=profile,
+                                              overlay=overlay,
+                                              headless=headless,
+                                              jointFilter=jointFilter,
+                                              previewSource=previewSource)
+        
+        # no frame rate limit when replaying as fast as possible
+        if not realtime:
+            self._fps = 0
+        
+        return
+    
+    # ~~~~~~~~ next frame ~~~~~~~~
+    def getFrame(self):
+        self._kinect.advance()
+        
+        return super(PlaybackRuntime, self).getFrame()
+    
+    # ~~~~~~~~ playback finished ~~~~~~~~
+    def finished(self):
+        return self._kinect.finished()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion of Kinect depth frames to camera space point clouds.
+A per-pixel ray table is computed once per sensor and cached on disk so
+that each frame costs a single vectorized multiply.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+import os
+
+
+# nominal Kinect v2 depth camera intrinsics (fx, fy, cx, cy) for stand-in sensors
+DEPTH_INTRINSICS = (365.5, 365.5, 256.0, 212.0)
+
+# ray tables are cached here unless another directory is given
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.kinect-toolbox')
+
+
+# ~~~~~~~~ ray table from camera intrinsics ~~~~~~~~
+def intrinsicsTable(width, height, intrinsics=DEPTH_INTRINSICS):
+    # (height, width, 2) camera space x, y at 1 m depth through each pixel center
+    fx, fy, cx, cy = intrinsics
+    table = numpy.empty((height, width, 2), dtype=numpy.float32)
+    table[:, :, 0] = ((numpy.arange(width) + 0.5 - cx) / fx)[None, :]
+    table[:, :, 1] = ((cy - numpy.arange(height) - 0.5) / fy)[:, None]
+    
+    return table
+
+
+# ~~~~~~~~ ray table from the SDK coordinate mapper ~~~~~~~~
+def sdkTable(sensor, width, height):
+    # GetDepthFrameToCameraSpaceTable is only available once the sensor is
+    # running; returns None for stand-in sensors or while it is still empty
+    mapper = getattr(sensor, '_mapper', None)
+    if mapper is None:
+        return None
+    try:
+        count, entries = mapper.GetDepthFrameToCameraSpaceTable()
+    except (AttributeError, TypeError, ValueError, OSError):
+        return None
+    if count != width * height or not entries:
+        return None
+    table = numpy.ctypeslib.as_array(entries, shape=(count,)).view(numpy.float32)
+    
+    return table.reshape(height, width, 2).copy()
+
+
+# ~~~~~~~~ ray table of a sensor ~~~~~~~~
+def rayTable(sensor=None, cacheDir=CACHE_DIR):
+    if sensor is not None:
+        width, height = sensor.depth_frame_desc.Width, sensor.depth_frame_desc.Height
+    else:
+        width, height = 512, 424
+    intrinsics = getattr(sensor, 'DEPTH_INTRINSICS', None)
+    if intrinsics is not None:
+        return intrinsicsTable(width, height, intrinsics)
+    
+    # tables of real sensors are cached so that later sessions need not wait for the mapper
+    path = os.path.join(cacheDir, 'raytable_{}x{}.npy'.format(width, height)) if cacheDir else None
+    table = sdkTable(sensor, width, height) if sensor is not None else None
+    if table is not None:
+        if path is not None:
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            numpy.save(path, table)
+        return table
+    if path is not None and os.path.exists(path):
+        table = numpy.load(path)
+        if table.shape == (height, width, 2):
+            return table
+    
+    return intrinsicsTable(width, height)
+
+
+# ~~~~~~~~ write point cloud as binary PLY ~~~~~~~~
+def writePLY(path, points, colors=None):
+    # points is an (n, 3) array in meters and colors an optional (n, 3) uint8 RGB array
+    points = numpy.ascontiguousarray(points, dtype='<f4').reshape(-1, 3)
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if colors is not None:
+        fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    vertices = numpy.empty(len(points), dtype=fields)
+    vertices['x'], vertices['y'], vertices['z'] = points[:, 0], points[:, 1], points[:, 2]
+    if colors is not None:
+        colors = numpy.asarray(colors, dtype=numpy.uint8).reshape(-1, 3)
+        vertices['red'], vertices['green'], vertices['blue'] = colors[:, 0], colors[:, 1], colors[:, 2]
+    header = ['ply', 'format binary_little_endian 1.0', 'element vertex {}'.format(len(points)),
+              'property float x', 'property float y', 'property float z']
+    if colors is not None:
+        header += ['property uchar red', 'property uchar green', 'property uchar blue']
+    header.append('end_header')
+    with open(path, 'wb') as file:
+        file.write(('\n'.join(header) + '\n').encode('ascii'))
+        file.write(vertices.tobytes())
+    
+    return path
+
+
+# ~~~~~~~~ read binary PLY written by writePLY ~~~~~~~~
+def readPLY(path):
+    with open(path, 'rb') as file:
+        header = []
+        while not header or header[-1] != 'end_header':
+            header.append(file.readline().decode('ascii').strip())
+        count = int([line for line in header if line.startswith('element vertex')][0].split()[-1])
+        colored = 'property uchar red' in header
+        fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+        if colored:
+            fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+        vertices = numpy.frombuffer(file.read(count * numpy.dtype(fields).itemsize), dtype=fields)
+    points = numpy.stack([vertices['x'], vertices['y'], vertices['z']], axis=1)
+    if colored:
+        return points, numpy.stack([vertices['red'], vertices['green'], vertices['blue']], axis=1)
+    
+    return points, None
+
+
+# PointCloud class
+class PointCloud(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, sensor=None, decimation=1, roi=None, minDepth=500, maxDepth=4500, table=None, cacheDir=CACHE_DIR):
+        # ray table of the full depth frame
+        if table is None:
+            table = rayTable(sensor, cacheDir)
+        self.height, self.width = table.shape[:2]
+        
+        # region of interest (x0, y0, x1, y1) in depth pixels and decimation step
+        x0, y0, x1, y1 = roi if roi is not None else (0, 0, self.width, self.height)
+        self.roi = (x0, y0, x1, y1)
+        self.decimation = decimation
+        self._window = (slice(y0, y1, decimation), slice(x0, x1, decimation))
+        self._rays = numpy.ascontiguousarray(table[self._window])
+        
+        # valid depth range in millimeters
+        self.minDepth = minDepth
+        self.maxDepth = maxDepth
+        
+        # bounded output buffers reused for every frame
+        h, w = self._rays.shape[:2]
+        self.shape = (h, w)
+        self._points = numpy.zeros((h, w, 3), dtype=numpy.float32)
+        self._valid = numpy.zeros((h, w), dtype=bool)
+        self._compact = numpy.zeros((h * w, 3), dtype=numpy.float32)
+        
+        return
+    
+    # ~~~~~~~~ organized point cloud of a depth frame ~~~~~~~~
+    def compute(self, depth):
+        # returns (h, w, 3) camera space points in meters and an (h, w) validity
+        # mask; both are overwritten by the next call
+        depth = numpy.asarray(depth).reshape(self.height, self.width)[self._window]
+        z = self._points[:, :, 2]
+        numpy.multiply(depth, 0.001, out=z, casting='unsafe')
+        numpy.multiply(z[:, :, None], self._rays, out=self._points[:, :, :2])
+        numpy.logical_and(depth >= self.minDepth, depth <= self.maxDepth, out=self._valid)
+        
+        return self._points, self._valid
+    
+    # ~~~~~~~~ valid points of a depth frame ~~~~~~~~
+    def points(self, depth):
+        # returns an (n, 3) view of the bounded compact buffer
+        points, valid = self.compute(depth)
+        n = int(numpy.count_nonzero(valid))
+        numpy.compress(valid.ravel(), points.reshape(-1, 3), axis=0, out=self._compact[:n])
+        
+        return self._compact[:n]
+    
+    # ~~~~~~~~ memory mapped organized point cloud sequence ~~~~~~~~
+    def openSequence(self, path, frames):
+        # (frames, h, w, 3) float32 .npy file; invalid points are stored as zeros
+        # and the file can be reopened with numpy.load(path, mmap_mode='r')
+        return numpy.lib.format.open_memmap(path, mode='w+', dtype=numpy.float32, shape=(frames,) + self.shape + (3,))
+    
+    # ~~~~~~~~ store frame into a sequence ~~~~~~~~
+    def store(self, sequence, i, depth):
+        points, valid = self.compute(depth)
+        numpy.multiply(points, valid[:, :, None], out=sequence[i])
+        
+        return
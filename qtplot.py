@@ -9,117 +9,74 @@ GitHub: https://github.com/prasunroy/kinect-toolbox
 
 
 # imports
-from mpl_toolkits.mplot3d import Axes3D
-from pykinect2 import PyKinectV2
+import numpy
+import time
+
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 from PyQt5.QtCore import QTimer
 
+from instrumentation import Instrumentation
+from recording import selectBody, trackedBodies
+from skeleton import BONES, BONES_V1, bones
+
 
 # QtPlot class
 class QtPlot(object):
     
     # ~~~~~~~~ constructor ~~~~~~~~
-    def __init__(self, figure, canvas):
-        # joint data
+    def __init__(self, figure, canvas, profile=None):
+        # joint data of the plotted body and binary records it was selected from
         self.data = None
         self.dataHead = -1
         self.dataTail = -1
+        self.records = None
+        self.body = None
+        
+        # temporal joint filter (see filters.py) applied to plotted joints and
+        # the buffer of filtered joints which grows while a recording is imported
+        self.jointFilter = None
+        self._filtered = None
         
-        # joint connections for Kinect v1
-        self.connections = [[PyKinectV2.JointType_Head,
-                             PyKinectV2.JointType_Neck],
-                            [PyKinectV2.JointType_Neck,
-                             PyKinectV2.JointType_SpineMid],
-                            [PyKinectV2.JointType_SpineMid,
-                             PyKinectV2.JointType_SpineBase],
-                            [PyKinectV2.JointType_Neck,
-                             PyKinectV2.JointType_ShoulderLeft],
-                            [PyKinectV2.JointType_Neck,
-                             PyKinectV2.JointType_ShoulderRight],
-                            [PyKinectV2.JointType_SpineBase,
-                             PyKinectV2.JointType_HipLeft],
-                            [PyKinectV2.JointType_SpineBase,
-                             PyKinectV2.JointType_HipRight],
-                            [PyKinectV2.JointType_ShoulderLeft,
-                             PyKinectV2.JointType_ElbowLeft],
-                            [PyKinectV2.JointType_ElbowLeft,
-                             PyKinectV2.JointType_WristLeft],
-                            [PyKinectV2.JointType_WristLeft,
-                             PyKinectV2.JointType_HandLeft],
-                            [PyKinectV2.JointType_ShoulderRight,
-                             PyKinectV2.JointType_ElbowRight],
-                            [PyKinectV2.JointType_ElbowRight,
-                             PyKinectV2.JointType_WristRight],
-                            [PyKinectV2.JointType_WristRight,
-                             PyKinectV2.JointType_HandRight],
-                            [PyKinectV2.JointType_HipLeft,
-                             PyKinectV2.JointType_KneeLeft],
-                            [PyKinectV2.JointType_KneeLeft,
-                             PyKinectV2.JointType_AnkleLeft],
-                            [PyKinectV2.JointType_AnkleLeft,
-                             PyKinectV2.JointType_FootLeft],
-                            [PyKinectV2.JointType_HipRight,
-                             PyKinectV2.JointType_KneeRight],
-                            [PyKinectV2.JointType_KneeRight,
-                             PyKinectV2.JointType_AnkleRight],
-                            [PyKinectV2.JointType_AnkleRight,
-                             PyKinectV2.JointType_FootRight]]
-        
-        # joint connections for Kinect v2
-        self.connections2 = [[PyKinectV2.JointType_Head,
-                              PyKinectV2.JointType_Neck],
-                             [PyKinectV2.JointType_Neck,
-                              PyKinectV2.JointType_SpineShoulder],
-                             [PyKinectV2.JointType_SpineShoulder,
-                              PyKinectV2.JointType_SpineMid],
-                             [PyKinectV2.JointType_SpineMid,
-                              PyKinectV2.JointType_SpineBase],
-                             [PyKinectV2.JointType_SpineShoulder,
-                              PyKinectV2.JointType_ShoulderLeft],
-                             [PyKinectV2.JointType_SpineShoulder,
-                              PyKinectV2.JointType_ShoulderRight],
-                             [PyKinectV2.JointType_SpineBase,
-                              PyKinectV2.JointType_HipLeft],
-                             [PyKinectV2.JointType_SpineBase,
-                              PyKinectV2.JointType_HipRight],
-                             [PyKinectV2.JointType_ShoulderLeft,
-                              PyKinectV2.JointType_ElbowLeft],
-                             [PyKinectV2.JointType_ElbowLeft,
-                              PyKinectV2.JointType_WristLeft],
-                             [PyKinectV2.JointType_WristLeft,
-                              PyKinectV2.JointType_HandLeft],
-                             [PyKinectV2.JointType_HandLeft,
-                              PyKinectV2.JointType_HandTipLeft],
-                             [PyKinectV2.JointType_WristLeft,
-                              PyKinectV2.JointType_ThumbLeft],
-                             [PyKinectV2.JointType_ShoulderRight,
-                              PyKinectV2.JointType_ElbowRight],
-                             [PyKinectV2.JointType_ElbowRight,
-                              PyKinectV2.JointType_WristRight],
-                             [PyKinectV2.JointType_WristRight,
-                              PyKinectV2.JointType_HandRight],
-                             [PyKinectV2.JointType_HandRight,
-                              PyKinectV2.JointType_HandTipRight],
-                             [PyKinectV2.JointType_WristRight,
-                              PyKinectV2.JointType_ThumbRight],
-                             [PyKinectV2.JointType_HipLeft,
-                              PyKinectV2.JointType_KneeLeft],
-                             [PyKinectV2.JointType_KneeLeft,
-                              PyKinectV2.JointType_AnkleLeft],
-                             [PyKinectV2.JointType_AnkleLeft,
-                              PyKinectV2.JointType_FootLeft],
-                             [PyKinectV2.JointType_HipRight,
-                              PyKinectV2.JointType_KneeRight],
-                             [PyKinectV2.JointType_KneeRight,
-                              PyKinectV2.JointType_AnkleRight],
-                             [PyKinectV2.JointType_AnkleRight,
-                              PyKinectV2.JointType_FootRight]]
+        # joint connections for Kinect v1 and v2
+        self.connections = BONES_V1
+        self.connections2 = BONES
         
         # figure and canvas for plotting
         self.figure = figure
         self.canvas = canvas
         
-        # update timer
+        # axes and artists reused for every frame
+        self.axes = None
+        self.scatter = None
+        self.lines = None
+        self.title = None
+        self._bones = None
+        self._limits = None
+        
+        # blitting state: static background and draw event connection
+        self._background = None
+        self._drawEvent = None
+        
+        # update timer and render rate
         self.timer = None
+        self.fps = 30
+        
+        # playback clock: frame times in seconds (nominal rate without
+        # recorded timestamps), speed multiplier and wall clock reference
+        self.times = None
+        self.rate = 30
+        self.speed = 1.0
+        self.playing = False
+        self.skipped = 0
+        self._origin = 0.0
+        self._start = 0.0
+        self._rendered = -1
+        
+        # called with the frame number whenever a frame is rendered
+        self.frameChanged = None
+        
+        # per frame latency instrumentation (disabled unless provided)
+        self.profile = profile if profile is not None else Instrumentation(enabled=False)
         
         return
     
@@ -128,62 +85,289 @@ class QtPlot(object):
         self.data = None
         self.dataHead = -1
         self.dataTail = -1
-        self.figure.clear()
-        self.canvas.draw()
+        self.records = None
+        self.body = None
+        self.times = None
+        self.playing = False
+        self.skipped = 0
+        self._rendered = -1
         if self.timer is not None:
             self.timer.stop()
+        if self._drawEvent is not None:
+            self.canvas.mpl_disconnect(self._drawEvent)
+            self._drawEvent = None
+        self._background = None
+        self.figure.clear()
+        self.axes = None
+        self.scatter = None
+        self.lines = None
+        self.title = None
+        self._limits = None
+        self.canvas.draw()
         
         return
     
     # ~~~~~~~~ plot ~~~~~~~~
-    def plot(self, data):
+    def plot(self, data, timestamps=None, body=None):
+        # binary records (see recording.loadBinary) are plotted one body at a
+        # time, by default the body tracked the longest
+        records = None
+        if data.dtype.names is not None:
+            records = data
+            data, timestamps = selectBody(records, body)
         self.clear()
+        if len(data) == 0:
+            # nothing to plot, data stays None for the caller to report
+            return
+        self.records = records
+        self.body = body
+        if self.jointFilter is not None:
+            self.jointFilter.reset()
+            data = self._filter_rows(data, timestamps, 0)
         self.data = data
         self.dataHead = 0
         self.dataTail = self.data.shape[0] - 1
+        if timestamps is not None and len(timestamps) == len(data):
+            timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+            self.times = timestamps - timestamps[0]
+        self._create_artists()
+        self.seek(0)
+        self.play()
         self.timer = QTimer()
         self.timer.timeout.connect(self._update_plot)
-        self.timer.start(100)
+        self.timer.start(int(1000 / self.fps))
+        
+        return
+    
+    # ~~~~~~~~ tracked bodies of binary records ~~~~~~~~
+    def bodies(self):
+        if self.records is None:
+            return []
+        
+        return trackedBodies(self.records)
+    
+    # ~~~~~~~~ plot another body of the same records ~~~~~~~~
+    def selectBody(self, body):
+        if self.records is None or body == self.body:
+            return
+        self.plot(self.records, body=body)
+        
+        return
+    
+    # ~~~~~~~~ extend data of a running plot ~~~~~~~~
+    def extend(self, data):
+        # used while a recording is still being imported
+        if self.data is None:
+            return
+        start = len(self.data)
+        if self.jointFilter is not None:
+            data = self._filter_rows(data, None, start)
+        self.data = data
+        self.dataTail = self.data.shape[0] - 1
+        
+        # limits widen when imported chunks reach outside the view so far
+        if len(data) > start and self.axes is not None:
+            low, high = self._sample_limits(data[start:])
+            low, high = numpy.minimum(low, self._limits[0]), numpy.maximum(high, self._limits[1])
+            if (low < self._limits[0]).any() or (high > self._limits[1]).any():
+                self._set_limits(low, high)
+                self.canvas.draw_idle()
+        
+        return
+    
+    # ~~~~~~~~ filter joint rows from start on ~~~~~~~~
+    def _filter_rows(self, data, timestamps, start):
+        # rows before start were filtered already; the buffer doubles in size
+        # so that a growing import is filtered in amortized constant time per row
+        n = len(data)
+        if timestamps is not None and not (numpy.diff(timestamps[start:n]) > 0).all():
+            # interleaved rows of several bodies are filtered at the nominal rate
+            timestamps = None
+        if start == 0 or self._filtered is None or len(self._filtered) < n:
+            buffer = numpy.zeros((max(n, 2 * start),) + data.shape[1:], dtype=numpy.float64)
+            if start:
+                buffer[:start] = self._filtered[:start]
+            self._filtered = buffer
+        self._filtered[start:n] = self.jointFilter.filterSequence(data[start:n], None if timestamps is None else timestamps[start:n])
+        
+        return self._filtered[:n]
+    
+    # ~~~~~~~~ joints of a frame in plot axes order ~~~~~~~~
+    def _frame_points(self, i):
+        # recorded (x, y, depth) is plotted as (x, depth, y) with y up
+        joints = numpy.asarray(self.data[i]).reshape(-1, 3)
+        
+        return joints[:, [0, 2, 1]].astype(numpy.float64)
+    
+    # ~~~~~~~~ create axes and artists once per recording ~~~~~~~~
+    def _create_artists(self):
+        self.axes = self.figure.add_subplot(111, projection='3d')
+        self.axes.set_facecolor('none')
+        self.axes.set_xticklabels([])
+        self.axes.set_yticklabels([])
+        self.axes.set_zticklabels([])
+        
+        # fixed limits from a sample of the recording so that the view does not
+        # jump; only widened while an import adds rows outside of them
+        self._set_limits(*self._sample_limits(self.data))
+        
+        # one scatter for all joints and one collection for all bones
+        points = self._frame_points(self.dataHead)
+        self._bones = numpy.array(bones(len(points)), dtype=numpy.intp).reshape(-1, 2)
+        self.scatter = self.axes.scatter(points[:, 0], points[:, 1], points[:, 2], c='#64a0ff')
+        self.lines = Line3DCollection(points[self._bones], colors='#ff6464')
+        self.axes.add_collection3d(self.lines)
+        self.title = self.axes.set_title('')
+        
+        # where the backend allows, only the artists are redrawn over a cached
+        # background which is grabbed again whenever the figure is fully drawn
+        if getattr(self.canvas, 'supports_blit', False):
+            for artist in (self.scatter, self.lines, self.title):
+                artist.set_animated(True)
+            self._drawEvent = self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.draw()
+        
+        return
+    
+    # ~~~~~~~~ joint coordinate range of a sample of rows ~~~~~~~~
+    def _sample_limits(self, data):
+        step = max(1, len(data) // 1000)
+        sample = numpy.asarray(data[::step]).reshape(-1, 3)[:, [0, 2, 1]]
+        
+        return sample.min(axis=0), sample.max(axis=0)
+    
+    # ~~~~~~~~ set axes limits with a margin ~~~~~~~~
+    def _set_limits(self, low, high):
+        self._limits = (low, high)
+        margin = numpy.maximum((high - low) * 0.05, 1.0)
+        self.axes.set_xlim(high[0] + margin[0], low[0] - margin[0])
+        self.axes.set_ylim(low[1] - margin[1], high[1] + margin[1])
+        # image rows grow downwards
+        self.axes.set_zlim(high[2] + margin[2], low[2] - margin[2])
+        
+        return
+    
+    # ~~~~~~~~ cache background after a full draw ~~~~~~~~
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_artists()
+        
+        return
+    
+    # ~~~~~~~~ draw animated artists ~~~~~~~~
+    def _draw_artists(self):
+        # 3D artists are projected by the axes only during a full draw
+        self.scatter.do_3d_projection()
+        self.lines.do_3d_projection()
+        self.axes.draw_artist(self.scatter)
+        self.axes.draw_artist(self.lines)
+        self.figure.draw_artist(self.title)
+        
+        return
+    
+    # ~~~~~~~~ recording time of a frame ~~~~~~~~
+    def _frame_time(self, i):
+        if self.times is None:
+            return i / self.rate
+        
+        return self.times[i]
+    
+    # ~~~~~~~~ frame shown at a recording time ~~~~~~~~
+    def _frame_at(self, t):
+        if self.times is None:
+            i = int(t * self.rate)
+        else:
+            i = int(numpy.searchsorted(self.times, t, side='right')) - 1
+        
+        return min(max(i, 0), self.dataTail)
+    
+    # ~~~~~~~~ recording duration ~~~~~~~~
+    def duration(self):
+        return self._frame_time(self.dataTail) + 1.0 / self.rate
+    
+    # ~~~~~~~~ current recording time ~~~~~~~~
+    def position(self):
+        if not self.playing:
+            return self._origin
+        
+        return self._origin + (time.perf_counter() - self._start) * self.speed
+    
+    # ~~~~~~~~ seek to frame ~~~~~~~~
+    def seek(self, i):
+        if self.data is None:
+            return
+        self.dataHead = min(max(int(i), 0), self.dataTail)
+        self._origin = self._frame_time(self.dataHead)
+        self._start = time.perf_counter()
+        self._render(self.dataHead)
+        
+        return
+    
+    # ~~~~~~~~ set playback speed ~~~~~~~~
+    def setSpeed(self, speed):
+        # rebase the clock so that the current position is kept
+        self._origin = self.position()
+        self._start = time.perf_counter()
+        self.speed = speed
+        
+        return
+    
+    # ~~~~~~~~ resume playback ~~~~~~~~
+    def play(self):
+        if not self.playing:
+            self._start = time.perf_counter()
+            self.playing = True
+        
+        return
+    
+    # ~~~~~~~~ pause playback ~~~~~~~~
+    def pause(self):
+        if self.playing:
+            self._origin = self.position()
+            self.playing = False
+        
+        return
+    
+    # ~~~~~~~~ render frame ~~~~~~~~
+    def _render(self, i):
+        if self.data is None or self.scatter is None:
+            return
+        t = self.profile.start()
+        points = self._frame_points(i)
+        self.scatter._offsets3d = (points[:, 0], points[:, 1], points[:, 2])
+        self.lines.set_segments(points[self._bones])
+        self.title.set_text('FRAME {:3d} / {:3d}'.format(i+1, self.dataTail+1))
+        if self._background is not None:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.figure.bbox)
+        else:
+            self.canvas.draw_idle()
+        self.profile.stamp('plot', t)
+        self._rendered = i
+        if self.frameChanged is not None:
+            self.frameChanged(i)
         
         return
     
     # ~~~~~~~~ update plot ~~~~~~~~
     def _update_plot(self):
-        try:
-            joints = self.data[self.dataHead].reshape(-1, 3)
-            x = joints[:, 0]
-            y = joints[:, 1]
-            z = joints[:, 2]
-            self.figure.clear()
-            axes = self.figure.gca(projection=Axes3D.name)
-            axes.set_facecolor('none')
-            axes.set_xlim([-1, 1])
-            axes.set_ylim([-1, 1])
-            axes.set_zlim([-1, 1])
-            # axes.set_xlabel('X-axis')
-            # axes.set_ylabel('Z-axis')
-            # axes.set_zlabel('Y-axis')
-            axes.set_xticklabels([])
-            axes.set_yticklabels([])
-            axes.set_zticklabels([])
-            axes.invert_xaxis()
-            axes.set_title('FRAME {:3d} / {:3d}'
-                           .format(self.dataHead+1, self.dataTail+1))
-            axes.scatter(x, z, y, c='#64a0ff')
-            if len(joints) == 20:
-                connections = self.connections
-            elif len(joints) == 25:
-                connections = self.connections2
-            else:
-                connections = []
-            for connection in connections:
-                axes.plot(x[connection], z[connection], y[connection],
-                          c='#ff6464')
-            self.canvas.draw()
-            self.dataHead += 1
-            if self.dataHead > self.dataTail:
-                self.dataHead  = 0
-        except:
-            pass
+        # paced by wall clock against recording time; frames which are due
+        # while rendering falls behind are skipped instead of slowing down
+        if self.data is None or not self.playing:
+            return
+        t = self.position()
+        duration = self.duration()
+        if t >= duration:
+            t = t % duration
+            self._origin = t
+            self._start = time.perf_counter()
+            self._rendered = -1
+        self.dataHead = self._frame_at(t)
+        if self.dataHead == self._rendered:
+            return
+        if self._rendered >= 0 and self.dataHead > self._rendered + 1:
+            self.skipped += self.dataHead - self._rendered - 1
+        self._render(self.dataHead)
         
         return
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming recorder for Kinect body joints data.
+Writes joint coordinates to disk incrementally from a background thread
+with a bounded queue, periodic fsync and optional file rotation. Binary
+recordings are filled frame by frame into a pool of preallocated blocks.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+import os
+import threading
+import time
+
+from recording import BINARY_EXTENSION, BODY_COUNT, BinaryWriter, fillFrame, frameType
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# SkeletonRecorder class
+class SkeletonRecorder(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, path, queueSize=256, syncInterval=1.0, rotateSize=None, rotateDuration=None,
+                 bodyCount=BODY_COUNT, jointCount=25, blockFrames=4, flushInterval=0.1):
+        # output path and rotation limits (bytes and seconds)
+        self.path = path
+        self.rotateSize = rotateSize
+        self.rotateDuration = rotateDuration
+        self.syncInterval = syncInterval
+        self.flushInterval = flushInterval
+        
+        # files written so far (binary format is chosen by file extension)
+        self.files = []
+        self.binary = os.path.splitext(path)[-1].lower() == BINARY_EXTENSION
+        
+        # recorded and dropped rows (frames of binary recordings)
+        self.frames = 0
+        self.dropped = 0
+        
+        # binary frames are filled in place into preallocated blocks which are
+        # handed to the writer thread when full or after the flush interval (the
+        # most a crash can lose) and returned to the pool once written; appends
+        # allocate nothing. Blocks are small so that the pool still buffers
+        # queueSize frames when they are handed off partially filled. The lock
+        # guards the current block, which is filled on the acquisition thread,
+        # taken by the writer thread when no frame arrives within the flush
+        # interval (nobody tracked) and handed off by whichever thread stops
+        self.bodyCount = bodyCount
+        self.jointCount = jointCount
+        self._free = queue.Queue()
+        if self.binary:
+            for i in range(max(queueSize // blockFrames, 2)):
+                self._free.put(numpy.zeros(blockFrames, dtype=frameType(bodyCount, jointCount)))
+        self._block = None
+        self._blockFill = 0
+        self._blockStart = 0.0
+        self._blockLock = threading.Lock()
+        
+        # bounded queue between acquisition and writer thread
+        self._queue = queue.Queue(maxsize=queueSize)
+        self._thread = None
+        self._file = None
+        self._fileStart = 0.0
+        self._lastSync = 0.0
+        self._running = False
+        
+        return
+    
+    # ~~~~~~~~ path of next file segment ~~~~~~~~
+    def _next_path(self):
+        if not self.files:
+            return self.path
+        fname, fextn = os.path.splitext(self.path)
+        
+        return '{}_{:03d}{}'.format(fname, len(self.files) + 1, fextn)
+    
+    # ~~~~~~~~ open next file segment ~~~~~~~~
+    def _open(self):
+        path = self._next_path()
+        if self.binary:
+            self._file = BinaryWriter(path, self.jointCount, bodyCount=self.bodyCount)
+        else:
+            self._file = open(path, 'w')
+        self._fileStart = time.time()
+        self.files.append(path)
+        
+        return
+    
+    # ~~~~~~~~ flush and close current file segment ~~~~~~~~
+    def _close(self):
+        if self._file is None:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+        
+        return
+    
+    # ~~~~~~~~ flush to disk ~~~~~~~~
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._lastSync = time.time()
+        
+        return
+    
+    # ~~~~~~~~ rotate file segment when limits are exceeded ~~~~~~~~
+    def _rotate(self):
+        if self.rotateSize is not None and self._file.tell() >= self.rotateSize:
+            self._close()
+            self._open()
+        elif self.rotateDuration is not None and time.time() - self._fileStart >= self.rotateDuration:
+            self._close()
+            self._open()
+        
+        return
+    
+    # ~~~~~~~~ writer loop ~~~~~~~~
+    def _run(self):
+        self._open()
+        while True:
+            try:
+                rows = [self._queue.get(timeout=self.flushInterval if self.binary else None)]
+            except queue.Empty:
+                # no frames arrive while nobody is tracked; the partial block is
+                # taken from the acquisition thread so that it is written anyway
+                with self._blockLock:
+                    self._hand_off()
+                continue
+            # drain whatever else is pending to write in one batch
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = rows[-1] is None
+            if stop:
+                rows.pop()
+            if rows and self.binary:
+                frames = 0
+                for block, count in rows:
+                    self._file.writeRecords(block[:count])
+                    self._free.put(block)
+                    frames += count
+            elif rows:
+                lines = [' '.join([str(int(value)) for value in row[0]]) for row in rows]
+                self._file.write('\n'.join(lines))
+                self._file.write('\n')
+            if rows:
+                # flush every batch so a crashed process loses nothing already written
+                self._file.flush()
+                self.frames += frames if self.binary else len(rows)
+            if stop:
+                break
+            if time.time() - self._lastSync >= self.syncInterval:
+                self._sync()
+            self._rotate()
+        self._close()
+        
+        return
+    
+    # ~~~~~~~~ start recording ~~~~~~~~
+    def start(self):
+        self._running = True
+        self._lastSync = time.time()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        
+        return
+    
+    # ~~~~~~~~ hand the current block to the writer thread ~~~~~~~~
+    def _hand_off(self):
+        # called with the block lock held
+        if self._block is not None and self._blockFill:
+            self._queue.put((self._block, self._blockFill))
+            self._block = None
+        
+        return
+    
+    # ~~~~~~~~ record all bodies of a frame without blocking ~~~~~~~~
+    def writeFrame(self, coordinates, ids, states, timestamp=None, slots=None):
+        # coordinates reshape to (bodies, joints, 3), ids are (bodies,) and
+        # states (bodies, joints); slots are the sensor body slots if known
+        if not self._running:
+            return False
+        if timestamp is None:
+            timestamp = time.time()
+        if not self.binary:
+            for i in range(len(ids)):
+                self.write(numpy.ravel(coordinates[i]).copy(), timestamp, ids[i], numpy.array(states[i]))
+            return True
+        with self._blockLock:
+            if not self._running:
+                return False
+            if self._block is None:
+                try:
+                    self._block = self._free.get_nowait()
+                except queue.Empty:
+                    # every block is still waiting to be written
+                    self.dropped += 1
+                    return False
+                self._blockFill = 0
+                self._blockStart = timestamp
+            fillFrame(self._block[self._blockFill], coordinates, ids, states, timestamp, slots)
+            self._blockFill += 1
+            if self._blockFill == len(self._block) or timestamp - self._blockStart >= self.flushInterval:
+                self._hand_off()
+        
+        return True
+    
+    # ~~~~~~~~ queue joint coordinates without blocking ~~~~~~~~
+    def write(self, coordinates, timestamp=None, body=0, states=None):
+        # one body per row; binary recordings store it as a frame of its own
+        # (see writeFrame for all bodies of a frame)
+        if self.binary:
+            return self.writeFrame([coordinates], [body], [2 if states is None else states], timestamp)
+        if not self._running:
+            return False
+        if timestamp is None:
+            timestamp = time.time()
+        try:
+            self._queue.put_nowait((coordinates, timestamp, body, states))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        
+        return True
+    
+    # ~~~~~~~~ stop recording and flush pending rows ~~~~~~~~
+    def stop(self):
+        if not self._running:
+            return
+        with self._blockLock:
+            self._running = False
+            self._hand_off()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        
+        return
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary recording format for Kinect body joints data.
+A fixed size header followed by fixed stride frame records which are loaded
+as a numpy.memmap, plus import of the legacy .txt/.csv text recordings.
+Version 2 records hold all body slots of a sensor frame; version 1 records
+hold one body each and are still readable.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+import os
+import struct
+import sys
+
+
+# file signature and versions (1: one body per record, 2: all bodies of a frame per record)
+MAGIC = b'KTBX'
+VERSION = 2
+VERSIONS = (1, 2)
+
+# header layout: magic, version, joint count, dtype code, record count, body slot count
+# (version 1 headers are zero padded and read with a body slot count of zero)
+HEADER = struct.Struct('<4sHHHQH')
+HEADER_SIZE = 64
+
+# body slots of a Kinect v2 sensor
+BODY_COUNT = 6
+
+# supported coordinate types
+DTYPES = {0: numpy.dtype('<i2'), 1: numpy.dtype('<f4')}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+# binary and text file extensions
+BINARY_EXTENSION = '.kbin'
+TEXT_EXTENSIONS = {'.txt': ' ', '.csv': ','}
+
+
+# ~~~~~~~~ frame record type ~~~~~~~~
+def recordType(jointCount=25, dtype='int16'):
+    return numpy.dtype([('timestamp', '<f8'),
+                        ('body', '<u8'),
+                        ('state', 'u1', (jointCount,)),
+                        ('coords', numpy.dtype(dtype).newbyteorder('<'), (jointCount, 3))])
+
+
+# ~~~~~~~~ multi-body frame record type ~~~~~~~~
+def frameType(bodyCount=BODY_COUNT, jointCount=25, dtype='int16'):
+    # body slots keep the sensor slot of a tracked body so that one body is a
+    # strided view over the recording; unused slots are zero and not tracked
+    return numpy.dtype([('timestamp', '<f8'),
+                        ('tracked', 'u1', (bodyCount,)),
+                        ('body', '<u8', (bodyCount,)),
+                        ('state', 'u1', (bodyCount, jointCount)),
+                        ('coords', numpy.dtype(dtype).newbyteorder('<'), (bodyCount, jointCount, 3))])
+
+
+# ~~~~~~~~ read header ~~~~~~~~
+def readHeader(path):
+    # returns (version, joint count, coordinate type, record count, body slot count)
+    with open(path, 'rb') as file:
+        magic, version, jointCount, code, frameCount, bodyCount = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a Kinect Toolbox binary recording: {}'.format(path))
+    if version not in VERSIONS:
+        raise ValueError('Unsupported recording version {}: {}'.format(version, path))
+    if code not in DTYPES:
+        raise ValueError('Unsupported coordinate type {}: {}'.format(code, path))
+    
+    return version, jointCount, DTYPES[code], frameCount, bodyCount
+
+
+# ~~~~~~~~ load binary recording ~~~~~~~~
+def loadBinary(path, mode='r'):
+    # version 1 files load as body records and version 2 files as frame records
+    version, jointCount, dtype, frameCount, bodyCount = readHeader(path)
+    if version == 1:
+        record = recordType(jointCount, dtype)
+    else:
+        record = frameType(bodyCount, jointCount, dtype)
+    # frame count is derived from the file size so that a recording which
+    # was never closed properly is still readable up to its last full frame
+    available = (os.path.getsize(path) - HEADER_SIZE) // record.itemsize
+    if available <= 0:
+        return numpy.zeros(0, dtype=record)
+    
+    return numpy.memmap(path, dtype=record, mode=mode, offset=HEADER_SIZE, shape=(available,))
+
+
+# ~~~~~~~~ load text recording ~~~~~~~~
+def loadText(path, sep=None):
+    import pandas
+    if sep is None:
+        sep = TEXT_EXTENSIONS.get(os.path.splitext(path)[-1].lower(), ' ')
+    
+    return pandas.read_csv(path, sep=sep, header=None).values
+
+
+# ~~~~~~~~ records hold all bodies of a frame ~~~~~~~~
+def isFrameRecord(records):
+    return records.dtype.names is not None and 'tracked' in records.dtype.names
+
+
+# ~~~~~~~~ tracked bodies of binary records ~~~~~~~~
+def trackedBodies(records):
+    # tracking ids ordered by the number of frames in which they are tracked;
+    # only the id columns are read
+    if isFrameRecord(records):
+        ids = numpy.asarray(records['body'])[numpy.asarray(records['tracked'], dtype=bool)]
+    else:
+        ids = numpy.asarray(records['body'])
+    ids, counts = numpy.unique(ids, return_counts=True)
+    
+    return [int(body) for body in ids[numpy.argsort(-counts, kind='stable')]]
+
+
+# ~~~~~~~~ body slot of every frame ~~~~~~~~
+def bodySlots(records, body):
+    # slot holding the body in each frame record, -1 where it is not tracked
+    match = (numpy.asarray(records['body']) == body) & numpy.asarray(records['tracked'], dtype=bool)
+    slots = numpy.argmax(match, axis=1)
+    slots[~match.any(axis=1)] = -1
+    
+    return slots
+
+
+# ~~~~~~~~ joint coordinates and timestamps of one body ~~~~~~~~
+def selectBody(records, body=None):
+    # returns ((frames, joints, 3) coordinates, (frames,) timestamps) of the
+    # frames in which the body is tracked; None selects the body tracked the
+    # longest, or all rows of version 1 recordings as they were interleaved
+    if not isFrameRecord(records):
+        if body is None:
+            return records['coords'], numpy.asarray(records['timestamp'])
+        rows = numpy.flatnonzero(numpy.asarray(records['body']) == body)
+        return records['coords'][rows], numpy.asarray(records['timestamp'])[rows]
+    if body is None:
+        bodies = trackedBodies(records)
+        if not bodies:
+            return records['coords'][:0, 0], numpy.zeros(0)
+        body = bodies[0]
+    slots = bodySlots(records, body)
+    frames = numpy.flatnonzero(slots >= 0)
+    slots = slots[frames]
+    if len(frames) and frames[-1] - frames[0] + 1 == len(frames) and (slots == slots[0]).all():
+        # a body tracked throughout in one sensor slot is a strided view of the recording
+        return records['coords'][frames[0]:frames[-1]+1, slots[0]], numpy.asarray(records['timestamp'])[frames]
+    
+    return records['coords'][frames, slots], numpy.asarray(records['timestamp'])[frames]
+
+
+# ~~~~~~~~ load frame timestamps of any supported recording ~~~~~~~~
+def loadTimestamps(path, body=None):
+    # text recordings carry no timestamps and return None
+    if os.path.splitext(path)[-1].lower() == BINARY_EXTENSION:
+        return selectBody(loadBinary(path), body)[1]
+    
+    return None
+
+
+# ~~~~~~~~ load joint coordinates of any supported recording ~~~~~~~~
+def loadRecording(path, body=None):
+    # returns an array indexed by frame whose rows reshape to (joints, 3);
+    # binary recordings are memory mapped and paged in on access and return
+    # one body (see selectBody)
+    if os.path.splitext(path)[-1].lower() == BINARY_EXTENSION:
+        return selectBody(loadBinary(path), body)[0]
+    
+    return loadText(path)
+
+
+# BinaryWriter class
+class BinaryWriter(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, path, jointCount=25, dtype='int16', bodyCount=None):
+        # a body slot count writes version 2 frame records, otherwise version 1 body records
+        self.path = path
+        self.jointCount = jointCount
+        self.bodyCount = bodyCount
+        self.version = 1 if bodyCount is None else 2
+        self.dtype = numpy.dtype(dtype).newbyteorder('<')
+        self.frames = 0
+        
+        # single reusable record for record by record writes
+        if bodyCount is None:
+            self._record = numpy.zeros(1, dtype=recordType(jointCount, self.dtype))
+        else:
+            self._record = numpy.zeros(1, dtype=frameType(bodyCount, jointCount, self.dtype))
+        self._file = open(path, 'wb')
+        self._write_header()
+        
+        return
+    
+    # ~~~~~~~~ write header ~~~~~~~~
+    def _write_header(self):
+        header = HEADER.pack(MAGIC, self.version, self.jointCount, DTYPE_CODES[self.dtype], self.frames, self.bodyCount or 0)
+        self._file.seek(0)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+        self._file.seek(0, os.SEEK_END)
+        
+        return
+    
+    # ~~~~~~~~ write one frame ~~~~~~~~
+    def write(self, coordinates, timestamp=0.0, body=0, states=None):
+        record = self._record[0]
+        record['timestamp'] = timestamp
+        record['body'] = body
+        record['state'] = 2 if states is None else states
+        record['coords'] = numpy.reshape(coordinates, (self.jointCount, 3))
+        self._file.write(self._record.tobytes())
+        self.frames += 1
+        
+        return
+    
+    # ~~~~~~~~ write all bodies of one frame ~~~~~~~~
+    def writeFrame(self, coordinates, ids, states, timestamp=0.0, slots=None):
+        fillFrame(self._record[0], coordinates, ids, states, timestamp, slots)
+        self._file.write(self._record.tobytes())
+        self.frames += 1
+        
+        return
+    
+    # ~~~~~~~~ write many frames ~~~~~~~~
+    def writeRecords(self, records):
+        records = numpy.asarray(records, dtype=self._record.dtype)
+        self._file.write(records.tobytes())
+        self.frames += len(records)
+        
+        return
+    
+    # ~~~~~~~~ current file size ~~~~~~~~
+    def tell(self):
+        return self._file.tell()
+    
+    # ~~~~~~~~ flush ~~~~~~~~
+    def flush(self):
+        self._file.flush()
+        
+        return
+    
+    # ~~~~~~~~ file descriptor ~~~~~~~~
+    def fileno(self):
+        return self._file.fileno()
+    
+    # ~~~~~~~~ update frame count and close ~~~~~~~~
+    def close(self):
+        if self._file is None:
+            return
+        self._write_header()
+        self._file.close()
+        self._file = None
+        
+        return
+
+
+# ~~~~~~~~ fill a frame record in place ~~~~~~~~
+def fillFrame(record, coordinates, ids, states, timestamp, slots=None):
+    # coordinates reshape to (bodies, joints, 3), ids are (bodies,) and states
+    # (bodies, joints); bodies go to their sensor slots or to the first slots
+    n = len(ids)
+    record['timestamp'] = timestamp
+    record['tracked'] = 0
+    record['body'] = 0
+    record['state'] = 0
+    record['coords'] = 0
+    if n == 0:
+        return
+    if slots is None:
+        slots = slice(0, n)
+    record['tracked'][slots] = 1
+    record['body'][slots] = ids
+    record['state'][slots] = states
+    record['coords'][slots] = numpy.reshape(coordinates, (n, -1, 3))
+    
+    return
+
+
+# ~~~~~~~~ convert between text and binary recordings ~~~~~~~~
+def convert(src, dst, dtype='int16', chunkSize=65536):
+    srcBinary = os.path.splitext(src)[-1].lower() == BINARY_EXTENSION
+    dstBinary = os.path.splitext(dst)[-1].lower() == BINARY_EXTENSION
+    if srcBinary and dstBinary:
+        raise ValueError('Source and destination are both binary recordings')
+    
+    # binary to text (tracked bodies of a frame become consecutive rows), one
+    # chunk of records at a time so that memory use is independent of file size
+    if srcBinary:
+        records = loadBinary(src)
+        frames = isFrameRecord(records)
+        sep = TEXT_EXTENSIONS.get(os.path.splitext(dst)[-1].lower(), ' ')
+        with open(dst, 'w') as file:
+            for i in range(0, len(records), chunkSize):
+                coords = numpy.asarray(records['coords'][i:i+chunkSize])
+                if frames:
+                    coords = coords[numpy.asarray(records['tracked'][i:i+chunkSize], dtype=bool)]
+                chunk = coords.reshape(-1, coords.shape[-2] * 3)
+                numpy.savetxt(file, chunk, fmt='%d' if chunk.dtype.kind == 'i' else '%.6f', delimiter=sep)
+        return dst
+    
+    # text to binary, parsed in chunks of rows like the background importer
+    import pandas
+    sep = TEXT_EXTENSIONS.get(os.path.splitext(src)[-1].lower(), ' ')
+    writer = None
+    try:
+        for chunk in pandas.read_csv(src, sep=sep, header=None, chunksize=chunkSize):
+            data = chunk.values
+            if writer is None:
+                if data.shape[1] % 3 != 0:
+                    raise ValueError('Column count {} is not a multiple of 3: {}'.format(data.shape[1], src))
+                writer = BinaryWriter(dst, data.shape[1] // 3, dtype)
+            records = numpy.zeros(len(data), dtype=writer._record.dtype)
+            records['state'] = 2
+            records['coords'] = data.reshape(len(data), -1, 3)
+            writer.writeRecords(records)
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    return dst
+
+
+# main
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python recording.py <source> <destination>')
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
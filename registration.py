@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Registration of Kinect color and depth frames with body index masking.
+Depth to color mapping tables are computed once per sensor and reused for
+every frame; batches of frames and whole recordings can be processed offline
+on a process pool.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import ctypes
+import numpy
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from pointcloud import CACHE_DIR, rayTable
+from synchronizer import FrameSynchronizer
+
+
+# nominal Kinect v2 color camera intrinsics (fx, fy, cx, cy) and depth to color baseline in meters for stand-in sensors
+COLOR_INTRINSICS = (1063.0, 1063.0, 960.0, 540.0)
+COLOR_BASELINE = 0.052
+
+# depths (millimeters) at which the SDK coordinate mapper is sampled to derive color tables
+SAMPLE_DEPTHS = (1000, 4000)
+
+# body index value of pixels which belong to no body
+BACKGROUND = 255
+
+
+# ~~~~~~~~ color table from camera intrinsics ~~~~~~~~
+def intrinsicsColorTable(table, intrinsics=COLOR_INTRINSICS, baseline=COLOR_BASELINE):
+    # (height, width, 4) u0, u parallax, v0, v parallax of every depth pixel such
+    # that it maps to color pixel (u0 + u parallax / z, v0 + v parallax / z) at
+    # depth z in millimeters; a depth pixel at (x * z, y * z, z) maps to
+    #   u = cx + fx * (x * z + b) / z = (cx + fx * x) + fx * b / z
+    #   v = cy - fy * y
+    fx, fy, cx, cy = intrinsics
+    colorTable = numpy.zeros(table.shape[:2] + (4,), dtype=numpy.float32)
+    colorTable[:, :, 0] = cx + fx * table[:, :, 0]
+    colorTable[:, :, 1] = fx * baseline * 1000.0
+    colorTable[:, :, 2] = cy - fy * table[:, :, 1]
+    
+    return colorTable
+
+
+# ~~~~~~~~ color table from the SDK coordinate mapper ~~~~~~~~
+def sdkColorTable(sensor, width, height):
+    # maps constant depth frames at two depths and solves u = u0 + parallax / z
+    # (and likewise v) per pixel; returns None for stand-in sensors
+    mapper = getattr(sensor, '_mapper', None)
+    if mapper is None:
+        return None
+    try:
+        from pykinect2 import PyKinectV2
+    except ImportError:
+        return None
+    count = width * height
+    samples = []
+    for z in SAMPLE_DEPTHS:
+        depth = numpy.full(count, z, dtype=numpy.uint16)
+        points = numpy.zeros((count, 2), dtype=numpy.float32)
+        try:
+            mapper.MapDepthFrameToColorSpace(ctypes.c_uint(count), depth.ctypes.data_as(ctypes.POINTER(ctypes.c_ushort)),
+                                             ctypes.c_uint(count), points.ctypes.data_as(ctypes.POINTER(PyKinectV2._ColorSpacePoint)))
+        except (AttributeError, TypeError, ValueError, OSError, ctypes.ArgumentError):
+            return None
+        samples.append(points.reshape(height, width, 2))
+    (near, far), (zNear, zFar) = samples, SAMPLE_DEPTHS
+    if not numpy.isfinite(near).any():
+        # the mapper is empty until the sensor is running
+        return None
+    with numpy.errstate(invalid='ignore'):
+        parallax = (near - far) / (1.0 / zNear - 1.0 / zFar)
+        origin = near - parallax / zNear
+    colorTable = numpy.stack([origin[:, :, 0], parallax[:, :, 0], origin[:, :, 1], parallax[:, :, 1]], axis=-1)
+    # pixels the mapper cannot map are moved outside of the color frame
+    colorTable[~numpy.isfinite(colorTable).all(axis=-1)] = (-1e6, 0.0, -1e6, 0.0)
+    
+    return colorTable.astype(numpy.float32)
+
+
+# ~~~~~~~~ color table of a sensor ~~~~~~~~
+def colorTable(sensor=None, table=None, cacheDir=CACHE_DIR):
+    # tables of real sensors are derived from the SDK coordinate mapper and
+    # cached next to the ray table, so that recordings registered offline use
+    # them as well; stand-in sensors and machines without a cached table use
+    # the nominal color camera model
+    if table is None:
+        table = rayTable(sensor, cacheDir)
+    height, width = table.shape[:2]
+    if sensor is not None and hasattr(sensor, 'COLOR_INTRINSICS'):
+        return intrinsicsColorTable(table, sensor.COLOR_INTRINSICS, getattr(sensor, 'COLOR_BASELINE', COLOR_BASELINE))
+    path = os.path.join(cacheDir, 'colortable_{}x{}.npy'.format(width, height)) if cacheDir else None
+    colors = sdkColorTable(sensor, width, height) if sensor is not None else None
+    if colors is not None:
+        if path is not None:
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            numpy.save(path, colors)
+        return colors
+    if path is not None and os.path.exists(path):
+        colors = numpy.load(path)
+        if colors.shape == (height, width, 4):
+            return colors
+    
+    return intrinsicsColorTable(table)
+
+
+# Registration class
+class Registration(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, sensor=None, colorSize=(1920, 1080), table=None, intrinsics=None, baseline=None):
+        # depth pixel rays and depth to color mapping (see colorTable); given
+        # intrinsics or baseline select the nominal camera model
+        if table is None:
+            table = rayTable(sensor)
+        if intrinsics is None and baseline is None:
+            colors = colorTable(sensor, table)
+        else:
+            colors = intrinsicsColorTable(table, intrinsics or COLOR_INTRINSICS, COLOR_BASELINE if baseline is None else baseline)
+        if sensor is not None:
+            colorSize = (sensor.color_frame_desc.Width, sensor.color_frame_desc.Height)
+        self.height, self.width = table.shape[:2]
+        self.colorW, self.colorH = colorSize
+        
+        # only the parallax terms depend on the frame; rows are looked up once
+        # when they do not (nominal model)
+        self._u0 = numpy.ascontiguousarray(colors[:, :, 0])
+        self._uParallax = numpy.ascontiguousarray(colors[:, :, 1])
+        self._v0 = numpy.ascontiguousarray(colors[:, :, 2])
+        self._vParallax = numpy.ascontiguousarray(colors[:, :, 3]) if colors[:, :, 3].any() else None
+        self._v = numpy.clip(self._v0, -1, self.colorH).astype(numpy.int32)
+        self._vInside = (self._v >= 0) & (self._v < self.colorH)
+        self._rowStart = numpy.clip(self._v, 0, self.colorH - 1) * self.colorW
+        
+        return
+    
+    # ~~~~~~~~ reshape flat or 2D frames to (..., height, width) ~~~~~~~~
+    def _frames(self, frames):
+        frames = numpy.asarray(frames)
+        if frames.shape[-2:] != (self.height, self.width):
+            frames = frames.reshape(frames.shape[:-1] + (self.height, self.width))
+        
+        return frames
+    
+    # ~~~~~~~~ map depth pixels to color pixels ~~~~~~~~
+    def depthToColor(self, depth):
+        # depth is (..., height, width) in millimeters; returns flat color
+        # pixel indices and a mask of depth pixels which map inside the color frame
+        depth = self._frames(depth)
+        inverse = 1.0 / numpy.maximum(depth, 1).astype(numpy.float32)
+        u = numpy.clip(self._u0 + self._uParallax * inverse, -1, self.colorW).astype(numpy.int32)
+        if self._vParallax is None:
+            vInside, rowStart = self._vInside, self._rowStart
+        else:
+            v = numpy.clip(self._v0 + self._vParallax * inverse, -1, self.colorH).astype(numpy.int32)
+            vInside = (v >= 0) & (v < self.colorH)
+            rowStart = numpy.clip(v, 0, self.colorH - 1) * self.colorW
+        valid = (depth > 0) & vInside & (u >= 0) & (u < self.colorW)
+        index = rowStart + numpy.clip(u, 0, self.colorW - 1)
+        
+        return index, valid
+    
+    # ~~~~~~~~ color frame resampled at depth resolution ~~~~~~~~
+    def registerColor(self, depth, color):
+        # color is (..., colorH * colorW * 4) or (..., colorH, colorW, 4) BGRA;
+        # returns (..., height, width, 4) with unmapped pixels set to zero
+        index, valid = self.depthToColor(depth)
+        batch = index.shape[:-2]
+        pixels = numpy.asarray(color).view(numpy.uint32).reshape(batch + (-1,))
+        registered = numpy.take_along_axis(pixels, index.reshape(batch + (-1,)), axis=-1).reshape(index.shape)
+        registered *= valid
+        
+        return registered.view(numpy.uint8).reshape(index.shape + (4,))
+    
+    # ~~~~~~~~ body mask ~~~~~~~~
+    def bodyMask(self, bodyIndex, body=None):
+        # pixels of any body, or of one body when given
+        bodyIndex = self._frames(bodyIndex)
+        if body is None:
+            return bodyIndex != BACKGROUND
+        
+        return bodyIndex == body
+    
+    # ~~~~~~~~ depth of body pixels only ~~~~~~~~
+    def maskDepth(self, depth, bodyIndex, body=None):
+        mask = self.bodyMask(bodyIndex, body)
+        
+        return self._frames(depth) * mask
+    
+    # ~~~~~~~~ registered color of body pixels only ~~~~~~~~
+    def removeBackground(self, depth, color, bodyIndex, body=None):
+        foreground = self.registerColor(depth, color)
+        foreground *= self.bodyMask(bodyIndex, body)[..., None]
+        
+        return foreground
+    
+    # ~~~~~~~~ color crop of every body ~~~~~~~~
+    def bodyCrops(self, depth, color, bodyIndex, margin=16):
+        # returns {body: (x0, y0, crop)} cut from a single full resolution color frame
+        index, valid = self.depthToColor(depth)
+        bodyIndex = self._frames(bodyIndex)
+        color = numpy.asarray(color).reshape(self.colorH, self.colorW, 4)
+        crops = {}
+        for body in numpy.unique(bodyIndex[bodyIndex != BACKGROUND]):
+            pixels = index[(bodyIndex == body) & valid]
+            if len(pixels) == 0:
+                continue
+            rows, cols = pixels // self.colorW, pixels % self.colorW
+            x0, y0 = max(cols.min() - margin, 0), max(rows.min() - margin, 0)
+            x1, y1 = min(cols.max() + margin + 1, self.colorW), min(rows.max() + margin + 1, self.colorH)
+            crops[int(body)] = (int(x0), int(y0), color[y0:y1, x0:x1])
+        
+        return crops
+
+
+# registration and stream readers cached per worker process
+_worker = {}
+
+
+# ~~~~~~~~ register a range of recorded frames in a worker process ~~~~~~~~
+def _register_range(base, start, stop, intrinsics, baseline):
+    from rgbd import StreamReader
+    if _worker.get('base') != base:
+        for reader in _worker.get('readers', {}).values():
+            reader.close()
+        readers = {}
+        for stream in ('depth', 'color', 'bodyidx'):
+            path = '{}.{}.kstream'.format(base, stream)
+            if os.path.exists(path):
+                readers[stream] = StreamReader(path)
+        _worker.update(base=base, readers=readers, registration=None)
+    readers = _worker['readers']
+    depthReader = readers['depth']
+    colorReader = readers.get('color')
+    indexReader = readers.get('bodyidx')
+    colorTimes = colorReader.timestamps() if colorReader is not None else None
+    
+    # body index frames recorded within the range are paired with depth frames
+    # by nearest recorded time; depth frames without one are all background
+    sync = None
+    if indexReader is not None:
+        indexTimes = indexReader.timestamps()
+        sync = FrameSynchronizer()
+        first, last = depthReader.index[start][1], depthReader.index[stop-1][1]
+        lo = int(numpy.searchsorted(indexTimes, first - sync.tolerance))
+        hi = int(numpy.searchsorted(indexTimes, last + sync.tolerance, side='right'))
+        sync.capacity = max(hi - lo, 1)
+        for j in range(lo, hi):
+            sync.add('bodyidx', j, indexTimes[j])
+    
+    depths, colors, masks = [], [], []
+    for i in range(start, stop):
+        _, timestamp, depth = depthReader.read(i)
+        if _worker['registration'] is None:
+            _worker['registration'] = Registration(table=rayTable(None), intrinsics=intrinsics, baseline=baseline)
+        depths.append(depth)
+        if colorReader is not None:
+            # nearest color frame as color may have been dropped under load
+            j = int(numpy.clip(numpy.searchsorted(colorTimes, timestamp), 0, len(colorTimes) - 1))
+            if j > 0 and abs(colorTimes[j-1] - timestamp) < abs(colorTimes[j] - timestamp):
+                j -= 1
+            colors.append(colorReader.read(j)[2])
+        j = sync.nearest('bodyidx', timestamp)[0] if sync is not None else None
+        if j is not None:
+            masks.append(indexReader.read(j)[2])
+        else:
+            masks.append(numpy.full(depth.shape, BACKGROUND, dtype=numpy.uint8))
+    registration = _worker['registration']
+    depths, masks = numpy.stack(depths), numpy.stack(masks)
+    maskedDepth = registration.maskDepth(depths, masks) if indexReader is not None else depths
+    foreground = None
+    if colors:
+        colors = numpy.stack(colors)
+        if indexReader is not None:
+            foreground = registration.removeBackground(depths, colors, masks)
+        else:
+            foreground = registration.registerColor(depths, colors)
+    
+    return start, maskedDepth, foreground
+
+
+# ~~~~~~~~ register a whole recording offline ~~~~~~~~
+def registerRecording(path, workers=None, batchSize=32, intrinsics=None, baseline=None):
+    # reads <base>.depth/.color/.bodyidx.kstream and writes memory mapped
+    # <base>.masked.npy (frames, h, w) depth of body pixels and <base>.foreground.npy
+    # (frames, h, w, 4) registered BGRA color of body pixels; the color table
+    # cached for the sensor is used unless intrinsics or baseline are given
+    from rgbd import StreamReader
+    base = os.path.splitext(path)[0]
+    for suffix in ('.depth', '.color', '.bodyidx'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    depthReader = StreamReader(base + '.depth.kstream')
+    count = len(depthReader)
+    if count == 0:
+        depthReader.close()
+        raise ValueError('No depth frames recorded: {}'.format(base + '.depth.kstream'))
+    h, w = depthReader.read(0)[2].shape
+    depthReader.close()
+    hasColor = os.path.exists(base + '.color.kstream')
+    masked = numpy.lib.format.open_memmap(base + '.masked.npy', mode='w+', dtype=numpy.uint16, shape=(count, h, w))
+    foreground = None
+    if hasColor:
+        foreground = numpy.lib.format.open_memmap(base + '.foreground.npy', mode='w+', dtype=numpy.uint8, shape=(count, h, w, 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_register_range, base, start, min(start + batchSize, count), intrinsics, baseline)
+                   for start in range(0, count, batchSize)]
+        for future in futures:
+            start, maskedDepth, registered = future.result()
+            masked[start:start+len(maskedDepth)] = maskedDepth
+            if foreground is not None and registered is not None:
+                foreground[start:start+len(registered)] = registered
+    masked.flush()
+    if foreground is not None:
+        foreground.flush()
+    
+    return base + '.masked.npy', base + '.foreground.npy' if hasColor else None
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Raw RGB-D stream recording for Kinect depth, infrared and color frames.
+Depth and infrared are compressed losslessly (row delta + zlib) and color
+optionally as JPEG/PNG on a process pool so that acquisition never waits
+on encoding.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import io
+import numpy
+import os
+import struct
+import threading
+import time
+import zlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+# chunk layout: frame index, host timestamp, width, height, payload size
+CHUNK = struct.Struct('<QdHHI')
+
+# chunk layout of timed streams: frame index, host timestamp of frame arrival,
+# SDK relative sensor time in seconds (NaN when unknown), width, height, payload size
+TIMED_CHUNK = struct.Struct('<QddHHI')
+
+# stream header layout: signature (timed or original chunks), stream name, payload format
+STREAM_MAGIC = b'KTBS'
+TIMED_STREAM_MAGIC = b'KTBT'
+STREAM_HEADER = struct.Struct('<4s8s8s')
+
+# frame source of every recorded stream
+STREAM_SOURCES = {'depth': 'depth', 'color': 'color', 'bodyidx': 'bodyindex', 'infrared': 'infrared',
+                  'irlong': 'longexposureinfrared'}
+
+# pending depth encodes above which color frames are shed
+DEPTH_BACKLOG = 2
+
+
+# ~~~~~~~~ encode depth frame ~~~~~~~~
+def encodeDepth(frame, level=1):
+    # horizontal delta coding with uint16 wrap around followed by zlib
+    delta = numpy.empty_like(frame)
+    delta[:, 0] = frame[:, 0]
+    numpy.subtract(frame[:, 1:], frame[:, :-1], out=delta[:, 1:])
+    
+    return zlib.compress(delta.tobytes(), level)
+
+
+# ~~~~~~~~ decode depth frame ~~~~~~~~
+def decodeDepth(payload, width, height):
+    delta = numpy.frombuffer(zlib.decompress(payload), dtype=numpy.uint16).reshape(height, width)
+    
+    return numpy.cumsum(delta, axis=1, dtype=numpy.uint16)
+
+
+# ~~~~~~~~ encode body index frame ~~~~~~~~
+def encodeBodyIndex(frame, level=1):
+    # body index frames are long runs of a few values and compress well as is
+    return zlib.compress(numpy.ascontiguousarray(frame, dtype=numpy.uint8).tobytes(), level)
+
+
+# ~~~~~~~~ decode body index frame ~~~~~~~~
+def decodeBodyIndex(payload, width, height):
+    return numpy.frombuffer(zlib.decompress(payload), dtype=numpy.uint8).reshape(height, width)
+
+
+# ~~~~~~~~ encode color frame ~~~~~~~~
+def encodeColor(frame, width, height, fmt='jpeg'):
+    # frame is a flat or (height, width, 4) BGRA array
+    if fmt == 'raw':
+        return zlib.compress(numpy.ascontiguousarray(frame).tobytes(), 1)
+    import pygame
+    surface = pygame.image.frombuffer(numpy.ascontiguousarray(frame), (width, height), 'BGRA')
+    buffer = io.BytesIO()
+    pygame.image.save(surface, buffer, 'frame.{}'.format('jpg' if fmt == 'jpeg' else fmt))
+    
+    return buffer.getvalue()
+
+
+# ~~~~~~~~ decode color frame ~~~~~~~~
+def decodeColor(payload, width, height, fmt='jpeg'):
+    # returns a (height, width, 4) BGRA array
+    if fmt == 'raw':
+        return numpy.frombuffer(zlib.decompress(payload), dtype=numpy.uint8).reshape(height, width, 4)
+    import pygame
+    surface = pygame.image.load(io.BytesIO(payload))
+    rgb = pygame.surfarray.pixels3d(surface).transpose(1, 0, 2)
+    frame = numpy.empty((height, width, 4), dtype=numpy.uint8)
+    frame[:, :, :3] = rgb[:, :, ::-1]
+    frame[:, :, 3] = 255
+    
+    return frame
+
+
+# 16-bit streams stored like depth
+WORD_STREAMS = ('depth', 'infrared', 'irlong')
+
+
+# ~~~~~~~~ encode task run in a worker process ~~~~~~~~
+def _encode(stream, frame, width, height, fmt):
+    if stream in WORD_STREAMS:
+        return encodeDepth(frame.reshape(height, width))
+    if stream == 'bodyidx':
+        return encodeBodyIndex(frame)
+    
+    return encodeColor(frame, width, height, fmt)
+
+
+# StreamReader class
+class StreamReader(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        magic, stream, fmt = STREAM_HEADER.unpack(self._file.read(STREAM_HEADER.size))
+        if magic not in (STREAM_MAGIC, TIMED_STREAM_MAGIC):
+            raise ValueError('Not a Kinect Toolbox stream: {}'.format(path))
+        chunk = TIMED_CHUNK if magic == TIMED_STREAM_MAGIC else CHUNK
+        self.stream = stream.rstrip(b'\0').decode('ascii')
+        self.format = fmt.rstrip(b'\0').decode('ascii')
+        
+        # index chunk headers once; chunks are stored in completion order
+        self.index = []
+        offset = self._file.tell()
+        size = os.path.getsize(path)
+        while offset + chunk.size <= size:
+            fields = chunk.unpack(self._file.read(chunk.size))
+            if chunk is TIMED_CHUNK:
+                frameIndex, timestamp, sensorTime, width, height, length = fields
+            else:
+                (frameIndex, timestamp, width, height, length), sensorTime = fields, float('nan')
+            if offset + chunk.size + length > size:
+                break
+            self.index.append((frameIndex, timestamp, width, height, offset + chunk.size, length, sensorTime))
+            offset += chunk.size + length
+            self._file.seek(offset)
+        self.index.sort()
+        
+        return
+    
+    # ~~~~~~~~ number of frames ~~~~~~~~
+    def __len__(self):
+        return len(self.index)
+    
+    # ~~~~~~~~ frame timestamps ~~~~~~~~
+    def timestamps(self):
+        # host time of frame arrival (time of submission in original streams)
+        return numpy.array([entry[1] for entry in self.index])
+    
+    # ~~~~~~~~ frame sensor times ~~~~~~~~
+    def sensorTimes(self):
+        # SDK relative times in seconds, NaN where unknown or not recorded
+        return numpy.array([entry[6] for entry in self.index])
+    
+    # ~~~~~~~~ read frame ~~~~~~~~
+    def read(self, i):
+        frameIndex, timestamp, width, height, offset, length, sensorTime = self.index[i]
+        self._file.seek(offset)
+        payload = self._file.read(length)
+        if self.stream == 'color':
+            frame = decodeColor(payload, width, height, self.format)
+        elif self.stream == 'bodyidx':
+            frame = decodeBodyIndex(payload, width, height)
+        else:
+            # depth and infrared
+            frame = decodeDepth(payload, width, height)
+        
+        return frameIndex, timestamp, frame
+    
+    # ~~~~~~~~ close ~~~~~~~~
+    def close(self):
+        self._file.close()
+        
+        return
+
+
+# RGBDRecorder class
+class RGBDRecorder(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, path, color='jpeg', workers=2, maxPending=8, bodyIndex=False, infrared=False, longExposure=False):
+        # output stream files derived from base path
+        base = os.path.splitext(path)[0]
+        self.paths = {'depth': base + '.depth.kstream'}
+        if color:
+            self.paths['color'] = base + '.color.kstream'
+        if bodyIndex:
+            # stream names fit the 8 byte header field
+            self.paths['bodyidx'] = base + '.bodyidx.kstream'
+        if infrared:
+            self.paths['infrared'] = base + '.infrared.kstream'
+        if longExposure:
+            self.paths['irlong'] = base + '.irlong.kstream'
+        self.color = color
+        
+        # color workers; every other stream gets its own single worker so it never queues behind slow color encodes
+        self.workers = workers
+        
+        # backpressure: all streams share one budget of pending encodes; color
+        # may use half of it and is shed as soon as depth falls behind, the
+        # other streams are dropped only when the whole budget is used
+        self.maxPending = maxPending
+        
+        # statistics per stream
+        self.stats = {stream: {'frames': 0, 'dropped': 0, 'rawBytes': 0, 'encodedBytes': 0}
+                      for stream in self.paths}
+        
+        self._pools = {}
+        self._files = {}
+        self._pending = {stream: 0 for stream in self.paths}
+        self._pendingTotal = 0
+        self._lock = threading.Lock()
+        self._frameIndex = 0
+        self._start = 0.0
+        self._elapsed = 0.0
+        
+        return
+    
+    # ~~~~~~~~ start recording ~~~~~~~~
+    def start(self):
+        for stream, path in self.paths.items():
+            fmt = self.color if stream == 'color' else 'zlib'
+            self._files[stream] = open(path, 'wb')
+            self._files[stream].write(STREAM_HEADER.pack(TIMED_STREAM_MAGIC, stream.encode('ascii'), fmt.encode('ascii')))
+            self._pools[stream] = ProcessPoolExecutor(max_workers=self.workers if stream == 'color' else 1)
+        self._start = time.time()
+        
+        return
+    
+    # ~~~~~~~~ write encoded chunk ~~~~~~~~
+    def _done(self, stream, frameIndex, timestamp, sensorTime, width, height, future):
+        with self._lock:
+            self._pending[stream] -= 1
+            self._pendingTotal -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.stats[stream]['dropped'] += 1
+                return
+            payload = future.result()
+            self._files[stream].write(TIMED_CHUNK.pack(frameIndex, timestamp, sensorTime, width, height, len(payload)))
+            self._files[stream].write(payload)
+            self.stats[stream]['frames'] += 1
+            self.stats[stream]['encodedBytes'] += len(payload)
+        
+        return
+    
+    # ~~~~~~~~ submit frame for encoding ~~~~~~~~
+    def _submit(self, stream, frame, width, height, frameIndex, timestamp, sensorTime):
+        # pools are detached by stop() which may run on another thread
+        pool = self._pools.get(stream)
+        if pool is None:
+            return False
+        with self._lock:
+            if stream == 'color':
+                full = self._pendingTotal >= max(1, self.maxPending // 2) or self._pending.get('depth', 0) >= DEPTH_BACKLOG
+            else:
+                full = self._pendingTotal >= self.maxPending
+            if full:
+                self.stats[stream]['dropped'] += 1
+                return False
+            self._pending[stream] += 1
+            self._pendingTotal += 1
+            self.stats[stream]['rawBytes'] += frame.nbytes
+        fmt = self.color if stream == 'color' else None
+        try:
+            future = pool.submit(_encode, stream, frame, width, height, fmt)
+        except RuntimeError:
+            # pool was shut down after the check above
+            with self._lock:
+                self._pending[stream] -= 1
+                self._pendingTotal -= 1
+            return False
+        future.add_done_callback(lambda f: self._done(stream, frameIndex, timestamp, sensorTime, width, height, f))
+        
+        return True
+    
+    # ~~~~~~~~ queue depth, color, body index and infrared frames ~~~~~~~~
+    def write(self, depth=None, color=None, depthSize=(512, 424), colorSize=(1920, 1080), timestamp=None, bodyIndex=None,
+              infrared=None, longExposure=None, times=None):
+        # infrared frames have the depth frame size; times are the runtime frame
+        # times {frame source: (sensor seconds or None, time.perf_counter arrival)}
+        # stored per chunk, with timestamp (default now) for streams without one
+        if not self._pools:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        times = times or {}
+        clockOffset = time.time() - time.perf_counter()
+        frames = (('depth', depth, depthSize), ('color', color, colorSize), ('bodyidx', bodyIndex, depthSize),
+                  ('infrared', infrared, depthSize), ('irlong', longExposure, depthSize))
+        for stream, frame, size in frames:
+            if frame is None or stream not in self.paths:
+                continue
+            sensorTime, hostTime = times.get(STREAM_SOURCES[stream], (None, None))
+            self._submit(stream, frame, size[0], size[1], self._frameIndex,
+                         timestamp if hostTime is None else hostTime + clockOffset,
+                         float('nan') if sensorTime is None else sensorTime)
+        self._frameIndex += 1
+        
+        return
+    
+    # ~~~~~~~~ session report ~~~~~~~~
+    def report(self):
+        elapsed = self._elapsed or (time.time() - self._start)
+        report = {'seconds': elapsed}
+        for stream, stats in self.stats.items():
+            report[stream] = dict(stats)
+            report[stream]['fps'] = stats['frames'] / elapsed if elapsed > 0 else 0.0
+            report[stream]['throughputMBps'] = stats['rawBytes'] / elapsed / 1e6 if elapsed > 0 else 0.0
+            report[stream]['compressionRatio'] = stats['rawBytes'] / stats['encodedBytes'] if stats['encodedBytes'] else 0.0
+        
+        return report
+    
+    # ~~~~~~~~ stop recording and wait for pending frames ~~~~~~~~
+    def stop(self):
+        if not self._pools:
+            return self.report()
+        pools = self._pools
+        self._pools = {}
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+        self._elapsed = time.time() - self._start
+        with self._lock:
+            for file in self._files.values():
+                file.close()
+            self._files = {}
+        
+        return self.report()
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process capture over shared memory.
+A KinectRuntime runs in a dedicated capture process and publishes preview
+frames and joint data into a shared memory ring buffer with sequence numbers.
+GUI and recorder processes attach read-only and never block the capture loop.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import numpy
+import queue
+import time
+
+from multiprocessing import shared_memory
+
+
+# control block fields (int64)
+COUNT, CAPACITY, MAX_WIDTH, MAX_HEIGHT, BODY_COUNT, JOINT_COUNT, REQUEST_WIDTH, REQUEST_HEIGHT, REQUEST_PREVIEW = range(9)
+CONTROL_SIZE = 16
+
+# slot header of every published frame
+SLOT_HEADER = numpy.dtype([('seq', '<i8'), ('index', '<i8'), ('timestamp', '<f8'), ('bodyTime', '<f8'),
+                           ('captureTime', '<f8'), ('width', '<i4'), ('height', '<i4'), ('bodies', '<i4'), ('pad', '<i4')])
+
+
+# ~~~~~~~~ round up to a cache line ~~~~~~~~
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+# SharedFrame class
+class SharedFrame(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, ring, slot, seq):
+        header = ring._headers[slot]
+        self._ring = ring
+        self._slot = slot
+        self.seq = seq
+        
+        # same fields as KinectFrame; arrays are views into shared memory
+        self.index = int(header['index'])
+        self.timestamp = float(header['timestamp'])
+        self.bodyTime = float(header['bodyTime'])
+        self.captureTime = float(header['captureTime'])
+        h, w, n = int(header['height']), int(header['width']), int(header['bodies'])
+        self.image = ring._images[slot, :h*w*4].reshape(h, w, 4) if h and w else None
+        self.bodies = ring._joints[slot, :n]
+        self.ids = ring._ids[slot, :n]
+        self.states = ring._states[slot, :n]
+        self.slots = ring._slots[slot, :n]
+        
+        return
+    
+    # ~~~~~~~~ frame not overwritten since it was read ~~~~~~~~
+    def valid(self):
+        # check after consuming the views; a False result means the capture
+        # process reused the slot meanwhile and the data may be torn
+        return int(self._ring._headers[self._slot]['seq']) == self.seq
+
+
+# SharedFrameRing class
+class SharedFrameRing(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, name=None, capacity=8, maxSize=(1280, 720), bodyCount=6, jointCount=25):
+        # creates a new ring when no name is given, attaches to an existing one otherwise
+        self.owner = name is None
+        if self.owner:
+            maxW, maxH = maxSize
+            size = self._layout(capacity, maxW, maxH, bodyCount, jointCount)
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+            control = numpy.ndarray((CONTROL_SIZE,), dtype='<i8', buffer=self._memory.buf)
+            capacity, maxW, maxH = int(control[CAPACITY]), int(control[MAX_WIDTH]), int(control[MAX_HEIGHT])
+            bodyCount, jointCount = int(control[BODY_COUNT]), int(control[JOINT_COUNT])
+            del control
+            self._layout(capacity, maxW, maxH, bodyCount, jointCount)
+        self.name = self._memory.name
+        self.capacity = capacity
+        self.maxSize = (maxW, maxH)
+        
+        # views into the shared block
+        buffer = self._memory.buf
+        self._control = numpy.ndarray((CONTROL_SIZE,), dtype='<i8', buffer=buffer)
+        self._headers = numpy.ndarray((capacity,), dtype=SLOT_HEADER, buffer=buffer, offset=self._offsets['headers'])
+        # images are stored contiguously at their own size at the start of each slot
+        self._images = numpy.ndarray((capacity, maxH * maxW * 4), dtype=numpy.uint8, buffer=buffer, offset=self._offsets['images'])
+        self._joints = numpy.ndarray((capacity, bodyCount, jointCount * 3), dtype='<i4', buffer=buffer, offset=self._offsets['joints'])
+        self._ids = numpy.ndarray((capacity, bodyCount), dtype='<u8', buffer=buffer, offset=self._offsets['ids'])
+        self._states = numpy.ndarray((capacity, bodyCount, jointCount), dtype=numpy.uint8, buffer=buffer, offset=self._offsets['states'])
+        self._slots = numpy.ndarray((capacity, bodyCount), dtype='<i4', buffer=buffer, offset=self._offsets['slots'])
+        if self.owner:
+            self._control[:] = 0
+            self._control[CAPACITY] = capacity
+            self._control[MAX_WIDTH], self._control[MAX_HEIGHT] = maxW, maxH
+            self._control[BODY_COUNT], self._control[JOINT_COUNT] = bodyCount, jointCount
+            self._headers['seq'] = -1
+        
+        return
+    
+    # ~~~~~~~~ offsets of the shared block regions ~~~~~~~~
+    def _layout(self, capacity, maxW, maxH, bodyCount, jointCount):
+        sizes = [('headers', capacity * SLOT_HEADER.itemsize),
+                 ('images', capacity * maxH * maxW * 4),
+                 ('joints', capacity * bodyCount * jointCount * 3 * 4),
+                 ('ids', capacity * bodyCount * 8),
+                 ('states', capacity * bodyCount * jointCount),
+                 ('slots', capacity * bodyCount * 4)]
+        self._offsets = {}
+        offset = _align(CONTROL_SIZE * 8)
+        for region, size in sizes:
+            self._offsets[region] = offset
+            offset = _align(offset + size)
+        
+        return offset
+    
+    # ~~~~~~~~ number of published frames ~~~~~~~~
+    def count(self):
+        return int(self._control[COUNT])
+    
+    # ~~~~~~~~ publish frame (capture process only) ~~~~~~~~
+    def publish(self, image, bodies, ids, states, index, bodyTime, captureTime=0.0, slots=None):
+        # seqlock: the slot sequence number is invalidated while the slot is
+        # written so that readers holding views can detect reuse; the writer
+        # never waits for readers. slots are the sensor body slots (the first
+        # slots when not given)
+        count = int(self._control[COUNT])
+        slot = count % self.capacity
+        header = self._headers[slot:slot+1]
+        header['seq'] = -1
+        if image is None:
+            header['width'], header['height'] = 0, 0
+        else:
+            # frames larger than the slot are cropped
+            h, w = min(image.shape[0], self.maxSize[1]), min(image.shape[1], self.maxSize[0])
+            self._images[slot, :h*w*4].reshape(h, w, 4)[:] = image[:h, :w]
+            header['width'], header['height'] = w, h
+        n = min(len(bodies), self._joints.shape[1])
+        self._joints[slot, :n] = bodies[:n]
+        self._ids[slot, :n] = ids[:n]
+        self._states[slot, :n] = states[:n]
+        self._slots[slot, :n] = slots[:n] if slots is not None else numpy.arange(n)
+        header['bodies'] = n
+        header['index'] = index
+        header['bodyTime'] = bodyTime
+        header['captureTime'] = captureTime
+        header['timestamp'] = time.time()
+        header['seq'] = count
+        self._control[COUNT] = count + 1
+        
+        return count
+    
+    # ~~~~~~~~ newest frame ~~~~~~~~
+    def latest(self):
+        count = self.count()
+        if count == 0:
+            return None
+        slot = (count - 1) % self.capacity
+        frame = SharedFrame(self, slot, count - 1)
+        
+        return frame if frame.valid() else None
+    
+    # ~~~~~~~~ read every frame since cursor ~~~~~~~~
+    def read(self, cursor):
+        # returns frames published since cursor, the new cursor and the number
+        # of frames overwritten before they could be read; never blocks
+        count = self.count()
+        first = max(cursor, count - self.capacity + 1)
+        frames = [SharedFrame(self, i % self.capacity, i) for i in range(first, count)]
+        frames = [frame for frame in frames if frame.valid()]
+        
+        return frames, count, count - cursor - len(frames)
+    
+    # ~~~~~~~~ request preview frame size from the capture process ~~~~~~~~
+    def setFrameSize(self, size=(None, None)):
+        width, height = size
+        self._control[REQUEST_WIDTH] = width or 0
+        self._control[REQUEST_HEIGHT] = height or 0
+        
+        return
+    
+    # ~~~~~~~~ requested preview frame size ~~~~~~~~
+    def requestedSize(self):
+        width, height = int(self._control[REQUEST_WIDTH]), int(self._control[REQUEST_HEIGHT])
+        
+        return (min(width, self.maxSize[0]) or None, min(height, self.maxSize[1]) or None)
+    
+    # ~~~~~~~~ request preview source from the capture process ~~~~~~~~
+    def setPreviewSource(self, index):
+        # index into kinect.PREVIEW_SOURCES; -1 selects the default source
+        self._control[REQUEST_PREVIEW] = index + 1
+        
+        return
+    
+    # ~~~~~~~~ requested preview source ~~~~~~~~
+    def requestedPreview(self):
+        return int(self._control[REQUEST_PREVIEW]) - 1
+    
+    # ~~~~~~~~ time since the capture process last published ~~~~~~~~
+    def age(self):
+        count = self.count()
+        if count == 0:
+            return None
+        
+        return time.time() - float(self._headers[(count - 1) % self.capacity]['timestamp'])
+    
+    # ~~~~~~~~ detach (and free when owner) ~~~~~~~~
+    def close(self):
+        self._control = self._headers = self._images = self._joints = self._ids = self._states = self._slots = None
+        try:
+            self._memory.close()
+        except BufferError:
+            # frames still referenced by the caller keep the mapping alive until collected
+            pass
+        if self.owner:
+            self._memory.unlink()
+        
+        return
+
+
+# ~~~~~~~~ capture loop run in the capture process ~~~~~~~~
+def _capture(ringName, runtimeClass, options, stopEvent):
+    from kinect import PREVIEW_SOURCES
+    ring = SharedFrameRing(ringName)
+    runtime = None
+    try:
+        runtime = runtimeClass(**options)
+        size = None
+        preview = -1
+        lastIndex = runtime.frameIndex()
+        while not stopEvent.is_set():
+            requested = ring.requestedSize()
+            if requested != size:
+                size = requested
+                runtime.setFrameSize(size)
+            requested = ring.requestedPreview()
+            if requested != preview:
+                preview = requested
+                runtime.setPreviewSource(PREVIEW_SOURCES[preview] if preview >= 0 else None)
+            image = runtime.getFrame()
+            index = runtime.frameIndex()
+            if index == lastIndex:
+                continue
+            lastIndex = index
+            # recorder processes read the ring, so it carries unfiltered joints
+            ring.publish(image, runtime.rawBodyData(), runtime.bodyIds(), runtime.bodyStates(), index, runtime.bodyTime(),
+                         runtime.captureTime(), runtime.bodySlots())
+    finally:
+        if runtime is not None:
+            runtime.clear()
+        ring.close()
+    
+    return
+
+
+# ~~~~~~~~ skeleton recording loop run in the recorder process ~~~~~~~~
+def _record(ringName, path, options, stopEvent, reports):
+    from recorder import SkeletonRecorder
+    ring = SharedFrameRing(ringName)
+    recorder = SkeletonRecorder(path, **options)
+    recorder.start()
+    cursor = ring.count()
+    lastBodyTime = None
+    skipped = 0
+    
+    # rows are copied out of the ring into buffers reused for every frame
+    coords, ids = numpy.empty_like(ring._joints[0]), numpy.empty_like(ring._ids[0])
+    states, slots = numpy.empty_like(ring._states[0]), numpy.empty_like(ring._slots[0])
+    try:
+        while not stopEvent.is_set():
+            frames, cursor, dropped = ring.read(cursor)
+            skipped += dropped
+            for frame in frames:
+                if frame.bodyTime == lastBodyTime or len(frame.bodies) == 0:
+                    continue
+                # rows are copied out of the slot and kept only if it was not reused
+                # meanwhile; bodies keep their sensor slots as in in-process recordings
+                n = len(frame.bodies)
+                numpy.copyto(coords[:n], frame.bodies)
+                numpy.copyto(ids[:n], frame.ids)
+                numpy.copyto(states[:n], frame.states)
+                numpy.copyto(slots[:n], frame.slots)
+                if not frame.valid():
+                    skipped += 1
+                    continue
+                lastBodyTime = frame.bodyTime
+                recorder.writeFrame(coords[:n], ids[:n], states[:n], frame.bodyTime, slots[:n])
+            if not frames:
+                time.sleep(0.005)
+    finally:
+        recorder.stop()
+        ring.close()
+        reports.put({'frames': recorder.frames, 'dropped': recorder.dropped, 'ringDropped': skipped, 'files': recorder.files})
+    
+    return
+
+
+# CaptureProcess class
+class CaptureProcess(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, runtimeClass, options=None, capacity=8, maxSize=(1280, 720), bodyCount=6):
+        # runtimeClass (KinectRuntime or PlaybackRuntime) is created with options
+        # inside the capture process; the ring is owned by this process
+        self.ring = SharedFrameRing(capacity=capacity, maxSize=maxSize, bodyCount=bodyCount)
+        self._stopEvent = multiprocessing.Event()
+        self._process = multiprocessing.Process(target=_capture, args=(self.ring.name, runtimeClass, options or {}, self._stopEvent))
+        self._process.daemon = True
+        self._recorder = None
+        
+        return
+    
+    # ~~~~~~~~ start capture process ~~~~~~~~
+    def start(self):
+        self._process.start()
+        
+        return
+    
+    # ~~~~~~~~ capture process running ~~~~~~~~
+    def is_alive(self):
+        return self._process.is_alive()
+    
+    # ~~~~~~~~ exit code of capture process ~~~~~~~~
+    def exitcode(self):
+        return self._process.exitcode
+    
+    # ~~~~~~~~ newest frame ~~~~~~~~
+    def latest(self):
+        return self.ring.latest()
+    
+    # ~~~~~~~~ request preview frame size ~~~~~~~~
+    def setFrameSize(self, size=(None, None)):
+        self.ring.setFrameSize(size)
+        
+        return
+    
+    # ~~~~~~~~ request preview source ~~~~~~~~
+    def setPreviewSource(self, source=None):
+        # applied by the capture process with its next frame
+        from kinect import PREVIEW_SOURCES
+        self.ring.setPreviewSource(PREVIEW_SOURCES.index(source) if source is not None else -1)
+        
+        return
+    
+    # ~~~~~~~~ start skeleton recording in a recorder process ~~~~~~~~
+    def startRecording(self, path, **options):
+        self.stopRecording()
+        stopEvent = multiprocessing.Event()
+        reports = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_record, args=(self.ring.name, path, options, stopEvent, reports))
+        process.daemon = True
+        process.start()
+        self._recorder = (process, stopEvent, reports)
+        
+        return process
+    
+    # ~~~~~~~~ stop skeleton recording ~~~~~~~~
+    def stopRecording(self, timeout=10.0):
+        # returns the recorder report or None
+        if self._recorder is None:
+            return None
+        process, stopEvent, reports = self._recorder
+        self._recorder = None
+        stopEvent.set()
+        try:
+            report = reports.get(timeout=timeout)
+        except queue.Empty:
+            report = None
+        process.join(timeout)
+        
+        return report
+    
+    # ~~~~~~~~ stop all processes and free shared memory ~~~~~~~~
+    def clear(self, timeout=5.0):
+        self.stopRecording()
+        self._stopEvent.set()
+        if self._process.pid is not None:
+            self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self.ring.close()
+        
+        return
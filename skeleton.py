@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Skeleton topology of Kinect body joints.
+Bone index pairs shared by the live overlay and the 3D plot.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+try:
+    from pykinect2 import PyKinectV2
+except ImportError:
+    import kinectv2 as PyKinectV2
+
+
+# joint connections for Kinect v1
+BONES_V1 = [[PyKinectV2.JointType_Head, PyKinectV2.JointType_Neck],
+            [PyKinectV2.JointType_Neck, PyKinectV2.JointType_SpineMid],
+            [PyKinectV2.JointType_SpineMid, PyKinectV2.JointType_SpineBase],
+            [PyKinectV2.JointType_Neck, PyKinectV2.JointType_ShoulderLeft],
+            [PyKinectV2.JointType_Neck, PyKinectV2.JointType_ShoulderRight],
+            [PyKinectV2.JointType_SpineBase, PyKinectV2.JointType_HipLeft],
+            [PyKinectV2.JointType_SpineBase, PyKinectV2.JointType_HipRight],
+            [PyKinectV2.JointType_ShoulderLeft, PyKinectV2.JointType_ElbowLeft],
+            [PyKinectV2.JointType_ElbowLeft, PyKinectV2.JointType_WristLeft],
+            [PyKinectV2.JointType_WristLeft, PyKinectV2.JointType_HandLeft],
+            [PyKinectV2.JointType_ShoulderRight, PyKinectV2.JointType_ElbowRight],
+            [PyKinectV2.JointType_ElbowRight, PyKinectV2.JointType_WristRight],
+            [PyKinectV2.JointType_WristRight, PyKinectV2.JointType_HandRight],
+            [PyKinectV2.JointType_HipLeft, PyKinectV2.JointType_KneeLeft],
+            [PyKinectV2.JointType_KneeLeft, PyKinectV2.JointType_AnkleLeft],
+            [PyKinectV2.JointType_AnkleLeft, PyKinectV2.JointType_FootLeft],
+            [PyKinectV2.JointType_HipRight, PyKinectV2.JointType_KneeRight],
+            [PyKinectV2.JointType_KneeRight, PyKinectV2.JointType_AnkleRight],
+            [PyKinectV2.JointType_AnkleRight, PyKinectV2.JointType_FootRight]]
+
+# joint connections for Kinect v2
+BONES = [[PyKinectV2.JointType_Head, PyKinectV2.JointType_Neck],
+         [PyKinectV2.JointType_Neck, PyKinectV2.JointType_SpineShoulder],
+         [PyKinectV2.JointType_SpineShoulder, PyKinectV2.JointType_SpineMid],
+         [PyKinectV2.JointType_SpineMid, PyKinectV2.JointType_SpineBase],
+         [PyKinectV2.JointType_SpineShoulder, PyKinectV2.JointType_ShoulderLeft],
+         [PyKinectV2.JointType_SpineShoulder, PyKinectV2.JointType_ShoulderRight],
+         [PyKinectV2.JointType_SpineBase, PyKinectV2.JointType_HipLeft],
+         [PyKinectV2.JointType_SpineBase, PyKinectV2.JointType_HipRight],
+         [PyKinectV2.JointType_ShoulderLeft, PyKinectV2.JointType_ElbowLeft],
+         [PyKinectV2.JointType_ElbowLeft, PyKinectV2.JointType_WristLeft],
+         [PyKinectV2.JointType_WristLeft, PyKinectV2.JointType_HandLeft],
+         [PyKinectV2.JointType_HandLeft, PyKinectV2.JointType_HandTipLeft],
+         [PyKinectV2.JointType_WristLeft, PyKinectV2.JointType_ThumbLeft],
+         [PyKinectV2.JointType_ShoulderRight, PyKinectV2.JointType_ElbowRight],
+         [PyKinectV2.JointType_ElbowRight, PyKinectV2.JointType_WristRight],
+         [PyKinectV2.JointType_WristRight, PyKinectV2.JointType_HandRight],
+         [PyKinectV2.JointType_HandRight, PyKinectV2.JointType_HandTipRight],
+         [PyKinectV2.JointType_WristRight, PyKinectV2.JointType_ThumbRight],
+         [PyKinectV2.JointType_HipLeft, PyKinectV2.JointType_KneeLeft],
+         [PyKinectV2.JointType_KneeLeft, PyKinectV2.JointType_AnkleLeft],
+         [PyKinectV2.JointType_AnkleLeft, PyKinectV2.JointType_FootLeft],
+         [PyKinectV2.JointType_HipRight, PyKinectV2.JointType_KneeRight],
+         [PyKinectV2.JointType_KneeRight, PyKinectV2.JointType_AnkleRight],
+         [PyKinectV2.JointType_AnkleRight, PyKinectV2.JointType_FootRight]]
+
+
+# ~~~~~~~~ bone topology for a joint count ~~~~~~~~
+def bones(jointCount):
+    if jointCount == 20:
+        return BONES_V1
+    if jointCount == 25:
+        return BONES
+    
+    return []
+
+
+# ~~~~~~~~ decompose bones into polylines ~~~~~~~~
+def chains(bones):
+    # greedily extends each chain with the next unused bone starting at its
+    # last joint so that every bone is drawn exactly once
+    unused = [list(bone) for bone in bones]
+    result = []
+    while unused:
+        chain = unused.pop(0)
+        extended = True
+        while extended:
+            extended = False
+            for bone in unused:
+                if bone[0] == chain[-1]:
+                    chain.append(bone[1])
+                    unused.remove(bone)
+                    extended = True
+                    break
+        result.append(chain)
+    
+    return result
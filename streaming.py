@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+"""
+Local network streaming of Kinect skeleton and depth frames.
+An asyncio server fans compact binary packets out to TCP and UDP clients
+with a bounded queue per client, so a slow client only loses its own frames
+and never stalls capture. A blocking client decodes packets into numpy arrays.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import asyncio
+import json
+import numpy
+import socket
+import struct
+import threading
+import time
+
+from instrumentation import Stage
+from recording import recordType
+from rgbd import decodeDepth, encodeDepth
+
+
+# default ports
+PORT = 8765
+UDP_PORT = 8766
+
+# packet header: magic, kind, flags, joint count, sequence, capture timestamp, payload length
+MAGIC = b'KTBP'
+PACKET = struct.Struct('<4sBBHQdI')
+
+# packet kinds; a subscription is a bit mask of kinds
+SKELETON = 1
+DEPTH = 2
+
+# depth payload prefix: width, height
+DEPTH_SIZE = struct.Struct('<HH')
+
+# udp subscriptions expire without a keep alive
+UDP_TIMEOUT = 5.0
+
+# socket send buffer of tcp clients in bytes
+SEND_BUFFER = 256 * 1024
+
+
+# ~~~~~~~~ encode skeleton packet ~~~~~~~~
+def encodeSkeleton(seq, timestamp, coords, ids, states, jointCount=25):
+    # coords is (bodies, joints * 3), ids (bodies,) and states (bodies, joints);
+    # the payload is the .kbin record layout with int16 coordinates
+    records = numpy.zeros(len(coords), dtype=recordType(jointCount))
+    records['timestamp'] = timestamp
+    records['body'] = ids
+    records['state'] = states
+    records['coords'] = numpy.reshape(coords, (len(coords), jointCount, 3))
+    payload = records.tobytes()
+    
+    return PACKET.pack(MAGIC, SKELETON, 0, jointCount, seq, timestamp, len(payload)) + payload
+
+
+# ~~~~~~~~ encode depth packet ~~~~~~~~
+def encodeDepthPacket(seq, timestamp, depth):
+    # horizontal delta coding and zlib as in raw depth stream recordings
+    h, w = depth.shape
+    payload = DEPTH_SIZE.pack(w, h) + encodeDepth(depth)
+    
+    return PACKET.pack(MAGIC, DEPTH, 0, 0, seq, timestamp, len(payload)) + payload
+
+
+# ~~~~~~~~ decode packet ~~~~~~~~
+def decodePacket(header, payload):
+    # returns (kind, sequence, capture timestamp, data) where data is a record
+    # array for skeleton packets and a (height, width) uint16 array for depth
+    magic, kind, flags, jointCount, seq, timestamp, length = PACKET.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('Not a Kinect Toolbox stream packet')
+    if kind == SKELETON:
+        data = numpy.frombuffer(payload, dtype=recordType(jointCount))
+    elif kind == DEPTH:
+        w, h = DEPTH_SIZE.unpack_from(payload)
+        data = decodeDepth(payload[DEPTH_SIZE.size:], w, h)
+    else:
+        raise ValueError('Unknown packet kind {}'.format(kind))
+    
+    return kind, seq, timestamp, data
+
+
+# ClientState class
+class ClientState(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, address, protocol, subscription, queueSize):
+        self.address = address
+        self.protocol = protocol
+        self.subscription = subscription
+        self.queue = asyncio.Queue(queueSize) if protocol == 'tcp' else None
+        self.lastSeen = time.time()
+        
+        # statistics; latency is capture to socket write
+        self.start = time.time()
+        self.packets = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.latency = Stage(256)
+        
+        return
+    
+    # ~~~~~~~~ queue packet, dropping the oldest one when full ~~~~~~~~
+    def offer(self, packet, timestamp):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((packet, timestamp))
+        
+        return
+    
+    # ~~~~~~~~ account a sent packet ~~~~~~~~
+    def sent(self, packet, timestamp):
+        self.packets += 1
+        self.bytes += len(packet)
+        self.latency.add(max(time.time() - timestamp, 0.0))
+        
+        return
+    
+    # ~~~~~~~~ statistics ~~~~~~~~
+    def report(self):
+        elapsed = time.time() - self.start
+        latency = self.latency.summary()
+        
+        return {'address': '{}:{}'.format(*self.address[:2]),
+                'protocol': self.protocol,
+                'seconds': elapsed,
+                'packets': self.packets,
+                'dropped': self.dropped,
+                'packetsPerSecond': self.packets / elapsed if elapsed > 0 else 0.0,
+                'throughputMBps': self.bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+                'latencyP50ms': latency.get('p50_ms'),
+                'latencyP99ms': latency.get('p99_ms')}
+
+
+# UdpProtocol class
+class UdpProtocol(asyncio.DatagramProtocol):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        
+        return
+    
+    # ~~~~~~~~ endpoint ready ~~~~~~~~
+    def connection_made(self, transport):
+        self.transport = transport
+        
+        return
+    
+    # ~~~~~~~~ subscription or keep alive ~~~~~~~~
+    def datagram_received(self, data, address):
+        self.server._subscribe_udp(address, data[0] if data else SKELETON)
+        
+        return
+
+
+# StreamServer class
+class StreamServer(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, host='127.0.0.1', port=PORT, udpPort=None, queueSize=4, jointCount=25):
+        # port 0 binds an ephemeral port; bound ports are set once started
+        self.host = host
+        self.port = port
+        self.udpPort = udpPort
+        self.queueSize = queueSize
+        self.jointCount = jointCount
+        
+        # clients are only touched on the event loop thread
+        self._clients = {}
+        self._depthClients = 0
+        self._udp = None
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._started = threading.Event()
+        
+        # sequence numbers per packet kind and last published runtime frames
+        self._seq = {SKELETON: 0, DEPTH: 0}
+        self._lastBodyTime = None
+        self._lastDepth = None
+        
+        # depth frames are encoded off the capture thread, one at a time on an
+        # executor of the event loop; a frame waiting meanwhile is replaced by newer ones
+        self._encoding = None
+        self._pendingDepth = None
+        
+        return
+    
+    # ~~~~~~~~ start event loop thread ~~~~~~~~
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        self._started.wait()
+        
+        return
+    
+    # ~~~~~~~~ event loop ~~~~~~~~
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.udpPort is not None:
+            transport, self._udp = self._loop.run_until_complete(
+                self._loop.create_datagram_endpoint(lambda: UdpProtocol(self), local_addr=(self.host, self.udpPort)))
+            self.udpPort = transport.get_extra_info('sockname')[1]
+        self._started.set()
+        self._loop.run_forever()
+        
+        # disconnect clients and finish encoding before closing the loop
+        self._server.close()
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._pendingDepth = None
+        if self._encoding is not None:
+            self._loop.run_until_complete(asyncio.gather(self._encoding, return_exceptions=True))
+        self._loop.run_until_complete(self._server.wait_closed())
+        if self._udp is not None:
+            self._udp.transport.close()
+        self._loop.close()
+        
+        return
+    
+    # ~~~~~~~~ serve one tcp client ~~~~~~~~
+    async def _handle(self, reader, writer):
+        # the first byte sent by the client is its subscription mask
+        try:
+            subscription = (await reader.readexactly(1))[0]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        # a small send buffer moves back pressure of slow clients into their queue
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        writer.transport.set_write_buffer_limits(SEND_BUFFER)
+        client = ClientState(writer.get_extra_info('peername'), 'tcp', subscription, self.queueSize)
+        self._add_client(client)
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            while True:
+                get = asyncio.ensure_future(client.queue.get())
+                done, pending = await asyncio.wait([get, closed], return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    get.cancel()
+                    break
+                packet, timestamp = get.result()
+                writer.write(packet)
+                await writer.drain()
+                client.sent(packet, timestamp)
+        except (ConnectionError, asyncio.CancelledError):
+            # client gone or server stopping
+            pass
+        finally:
+            closed.cancel()
+            self._remove_client(client)
+            writer.close()
+        
+        return
+    
+    # ~~~~~~~~ register client ~~~~~~~~
+    def _add_client(self, client):
+        self._clients[(client.protocol,) + tuple(client.address[:2])] = client
+        self._depthClients += bool(client.subscription & DEPTH)
+        
+        return
+    
+    # ~~~~~~~~ unregister client ~~~~~~~~
+    def _remove_client(self, client):
+        if self._clients.pop((client.protocol,) + tuple(client.address[:2]), None) is not None:
+            self._depthClients -= bool(client.subscription & DEPTH)
+        
+        return
+    
+    # ~~~~~~~~ udp subscription or keep alive ~~~~~~~~
+    def _subscribe_udp(self, address, subscription):
+        # depth frames do not fit into datagrams, udp clients receive skeletons only
+        client = self._clients.get(('udp',) + tuple(address[:2]))
+        if client is None:
+            client = ClientState(address, 'udp', subscription & SKELETON, 0)
+            self._add_client(client)
+        client.lastSeen = time.time()
+        
+        return
+    
+    # ~~~~~~~~ send packet to every subscribed client ~~~~~~~~
+    def _broadcast(self, kind, packet, timestamp):
+        now = time.time()
+        for client in list(self._clients.values()):
+            if not client.subscription & kind:
+                continue
+            if client.protocol == 'tcp':
+                client.offer(packet, timestamp)
+            elif now - client.lastSeen > UDP_TIMEOUT:
+                self._remove_client(client)
+            elif self._udp.transport.get_write_buffer_size() > len(packet) * self.queueSize:
+                client.dropped += 1
+            else:
+                self._udp.transport.sendto(packet, client.address)
+                client.sent(packet, timestamp)
+        
+        return
+    
+    # ~~~~~~~~ publish packet from any thread ~~~~~~~~
+    def _publish(self, kind, packet, timestamp):
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._broadcast, kind, packet, timestamp)
+        except RuntimeError:
+            # loop stopped meanwhile
+            pass
+        
+        return
+    
+    # ~~~~~~~~ publish joint data of tracked bodies ~~~~~~~~
+    def publishBodies(self, coords, ids, states, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self._seq[SKELETON] += 1
+        self._publish(SKELETON, encodeSkeleton(self._seq[SKELETON], timestamp, coords, ids, states, self.jointCount), timestamp)
+        
+        return
+    
+    # ~~~~~~~~ publish depth frame ~~~~~~~~
+    def publishDepth(self, depth, timestamp=None):
+        # depth is only handed over while a client subscribes to it and is
+        # encoded on the event loop, so the frame must not be modified later
+        # (runtime depth frames are replaced, not overwritten)
+        if not self._depthClients or self._loop is None or self._loop.is_closed():
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        self._seq[DEPTH] += 1
+        try:
+            self._loop.call_soon_threadsafe(self._queue_depth, self._seq[DEPTH], timestamp, depth)
+        except RuntimeError:
+            # loop stopped meanwhile
+            pass
+        
+        return
+    
+    # ~~~~~~~~ queue depth frame for encoding on the event loop ~~~~~~~~
+    def _queue_depth(self, seq, timestamp, depth):
+        self._pendingDepth = (seq, timestamp, depth)
+        if self._encoding is None:
+            self._encode_depth()
+        
+        return
+    
+    # ~~~~~~~~ encode pending depth frame in the executor ~~~~~~~~
+    def _encode_depth(self):
+        pending, self._pendingDepth = self._pendingDepth, None
+        if pending is None or not self._depthClients:
+            self._encoding = None
+            return
+        seq, timestamp, depth = pending
+        self._encoding = self._loop.run_in_executor(None, encodeDepthPacket, seq, timestamp, depth)
+        self._encoding.add_done_callback(lambda future: self._depth_encoded(future, timestamp))
+        
+        return
+    
+    # ~~~~~~~~ broadcast encoded depth frame and encode the next one ~~~~~~~~
+    def _depth_encoded(self, future, timestamp):
+        if not future.cancelled() and future.exception() is None:
+            self._broadcast(DEPTH, future.result(), timestamp)
+        self._encode_depth()
+        
+        return
+    
+    # ~~~~~~~~ publish new frames of a runtime after getFrame ~~~~~~~~
+    def publishRuntime(self, runtime):
+        bodyTime = runtime.bodyTime()
+        if bodyTime != self._lastBodyTime:
+            self._lastBodyTime = bodyTime
+            self.publishBodies(runtime.bodyData(), runtime.bodyIds(), runtime.bodyStates(), bodyTime)
+        depth = runtime.depthFrame()
+        if depth is not None and depth is not self._lastDepth:
+            self._lastDepth = depth
+            self.publishDepth(depth)
+        
+        return
+    
+    # ~~~~~~~~ per client statistics ~~~~~~~~
+    def report(self):
+        if self._loop is None or self._loop.is_closed():
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._report(), self._loop)
+        
+        return future.result()
+    
+    # ~~~~~~~~ per client statistics on the event loop ~~~~~~~~
+    async def _report(self):
+        return [client.report() for client in self._clients.values()]
+    
+    # ~~~~~~~~ stop server ~~~~~~~~
+    def stop(self, timeout=5.0):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop = None
+        
+        return
+
+
+# StreamClient class
+class StreamClient(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, host='127.0.0.1', port=PORT, depth=False, udp=False, timeout=5.0):
+        # udp clients connect to the server udp port and receive skeletons only
+        self.host = host
+        self.port = port
+        self.udp = udp
+        self.subscription = SKELETON | (DEPTH if depth and not udp else 0)
+        self.timeout = timeout
+        self._socket = None
+        self._lastHello = 0.0
+        
+        # statistics; latency is capture to decode and lost counts sequence gaps
+        self.start = 0.0
+        self.packets = 0
+        self.bytes = 0
+        self.lost = 0
+        self.latency = Stage(256)
+        self._seq = {}
+        
+        return
+    
+    # ~~~~~~~~ connect and subscribe ~~~~~~~~
+    def connect(self):
+        if self.udp:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.settimeout(self.timeout)
+            self._hello()
+        else:
+            self._socket = socket.create_connection((self.host, self.port), self.timeout)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._socket.sendall(bytes([self.subscription]))
+        self.start = time.time()
+        
+        return self
+    
+    # ~~~~~~~~ udp subscription and keep alive ~~~~~~~~
+    def _hello(self):
+        self._socket.sendto(bytes([self.subscription]), (self.host, self.port))
+        self._lastHello = time.time()
+        
+        return
+    
+    # ~~~~~~~~ read exactly n bytes ~~~~~~~~
+    def _read(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self._socket.recv(n - len(data))
+            if not chunk:
+                raise EOFError('Stream closed by server')
+            data += chunk
+        
+        return bytes(data)
+    
+    # ~~~~~~~~ receive next packet ~~~~~~~~
+    def receive(self):
+        # returns (kind, sequence, capture timestamp, data); see decodePacket
+        if self.udp:
+            if time.time() - self._lastHello > UDP_TIMEOUT / 5:
+                self._hello()
+            datagram = self._socket.recv(65536)
+            header, payload = datagram[:PACKET.size], datagram[PACKET.size:]
+        else:
+            header = self._read(PACKET.size)
+            payload = self._read(PACKET.unpack(header)[-1])
+        kind, seq, timestamp, data = decodePacket(header, payload)
+        last = self._seq.get(kind)
+        if last is not None and seq > last + 1:
+            self.lost += seq - last - 1
+        self._seq[kind] = seq
+        self.packets += 1
+        self.bytes += len(header) + len(payload)
+        self.latency.add(max(time.time() - timestamp, 0.0))
+        
+        return kind, seq, timestamp, data
+    
+    # ~~~~~~~~ statistics ~~~~~~~~
+    def report(self):
+        elapsed = time.time() - self.start
+        latency = self.latency.summary()
+        
+        return {'seconds': elapsed,
+                'packets': self.packets,
+                'lost': self.lost,
+                'packetsPerSecond': self.packets / elapsed if elapsed > 0 else 0.0,
+                'throughputMBps': self.bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+                'latencyP50ms': latency.get('p50_ms'),
+                'latencyP99ms': latency.get('p99_ms')}
+    
+    # ~~~~~~~~ close ~~~~~~~~
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        
+        return
+
+
+# ~~~~~~~~ serve a runtime until interrupted ~~~~~~~~
+def serve(args):
+    from kinect import KinectRuntime
+    sensor = None
+    if args.synthetic is not None:
+        from synthetic import SyntheticRuntime
+        sensor = SyntheticRuntime(body_count=args.synthetic)
+    jointFilter = None
+    if args.filter is not None:
+        from filters import createFilter
+        jointFilter = createFilter(args.filter)
+    runtime = KinectRuntime(sensor=sensor, sources=args.sources, overlay=False, headless=True, jointFilter=jointFilter)
+    server = StreamServer(args.host, args.port, args.udp_port, args.queue)
+    server.start()
+    print('Streaming on tcp {}:{}{}'.format(args.host, server.port, '' if args.udp_port is None else ' udp {}'.format(server.udpPort)))
+    start = lastReport = time.time()
+    try:
+        while args.duration is None or time.time() - start < args.duration:
+            runtime.getFrame()
+            server.publishRuntime(runtime)
+            if time.time() - lastReport >= args.status:
+                lastReport = time.time()
+                print(json.dumps(server.report()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        runtime.clear()
+    
+    return
+
+
+# ~~~~~~~~ receive from a server and print statistics ~~~~~~~~
+def receive(args):
+    client = StreamClient(args.host, args.port, depth=args.depth, udp=args.udp).connect()
+    lastReport = time.time()
+    try:
+        while True:
+            client.receive()
+            if time.time() - lastReport >= args.status:
+                lastReport = time.time()
+                print(json.dumps(client.report()))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        client.close()
+    
+    return
+
+
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Kinect skeleton and depth streaming.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    server = commands.add_parser('serve', help='stream frames of the sensor')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=PORT)
+    server.add_argument('--udp-port', type=int, default=None, help='also stream skeletons over udp on this port')
+    server.add_argument('--sources', default='depth,body')
+    server.add_argument('--queue', type=int, default=4, help='packets queued per client before dropping')
+    server.add_argument('--filter', default=None, choices=['ema', 'holt', 'oneeuro'], help='smooth joints with this temporal filter')
+    server.add_argument('--synthetic', type=int, default=None, metavar='BODIES',
+                        help='stream a synthetic sensor with this many bodies')
+    server.add_argument('--duration', type=float, default=None)
+    server.add_argument('--status', type=float, default=5.0)
+    client = commands.add_parser('receive', help='receive frames and print statistics')
+    client.add_argument('--host', default='127.0.0.1')
+    client.add_argument('--port', type=int, default=PORT)
+    client.add_argument('--depth', action='store_true', help='also receive depth frames (tcp only)')
+    client.add_argument('--udp', action='store_true', help='receive skeletons over udp from this port')
+    client.add_argument('--status', type=float, default=5.0)
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args)
+    else:
+        receive(args)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Timestamp based pairing of Kinect color, depth and body streams.
+Keeps the last few frames of every stream with their sensor (SDK relative)
+and host monotonic times and pairs a frame of one stream with the frame of
+another stream which is nearest in time within a tolerance.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+
+from instrumentation import FRAME_PERIOD, Instrumentation
+
+
+# FrameSynchronizer class
+class FrameSynchronizer(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, tolerance=FRAME_PERIOD / 2, capacity=4, profile=None):
+        # frames further apart than the tolerance (seconds) are not paired
+        self.tolerance = tolerance
+        self.capacity = capacity
+        
+        # per stream ring of frames and their (sensor, host) times; unknown
+        # sensor times are NaN and such frames are paired by host time
+        self._frames = {}
+        self._times = {}
+        self._count = {}
+        
+        # pairing statistics; skew of paired frames is recorded as sync_<stream>
+        self.matched = {}
+        self.unmatched = {}
+        self.profile = profile if profile is not None else Instrumentation(enabled=False)
+        
+        return
+    
+    # ~~~~~~~~ add frame of a stream ~~~~~~~~
+    def add(self, stream, frame, sensorTime=None, hostTime=None):
+        if stream not in self._frames:
+            self._frames[stream] = [None] * self.capacity
+            self._times[stream] = numpy.full((self.capacity, 2), numpy.nan)
+            self._count[stream] = 0
+        i = self._count[stream] % self.capacity
+        self._frames[stream][i] = frame
+        self._times[stream][i] = (numpy.nan if sensorTime is None else sensorTime,
+                                  numpy.nan if hostTime is None else hostTime)
+        self._count[stream] += 1
+        
+        return
+    
+    # ~~~~~~~~ latest frame of a stream ~~~~~~~~
+    def latest(self, stream):
+        count = self._count.get(stream, 0)
+        if count == 0:
+            return None
+        
+        return self._frames[stream][(count - 1) % self.capacity]
+    
+    # ~~~~~~~~ frame of a stream nearest to a time ~~~~~~~~
+    def nearest(self, stream, sensorTime=None, hostTime=None):
+        # returns (frame, signed skew in seconds) of the nearest frame within
+        # the tolerance or (None, None); sensor times are compared where both
+        # frames have one, host times otherwise
+        count = min(self._count.get(stream, 0), self.capacity)
+        if count == 0:
+            return None, None
+        times = self._times[stream][:count]
+        if sensorTime is not None:
+            skew = numpy.where(numpy.isnan(times[:, 0]), times[:, 1] - (numpy.nan if hostTime is None else hostTime),
+                               times[:, 0] - sensorTime)
+        elif hostTime is not None:
+            skew = times[:, 1] - hostTime
+        else:
+            return None, None
+        distance = numpy.abs(skew)
+        if numpy.isnan(distance).all():
+            return None, None
+        i = int(numpy.nanargmin(distance))
+        if distance[i] > self.tolerance:
+            self.unmatched[stream] = self.unmatched.get(stream, 0) + 1
+            return None, float(skew[i])
+        self.matched[stream] = self.matched.get(stream, 0) + 1
+        self.profile.record('sync_' + stream, distance[i])
+        
+        return self._frames[stream][i], float(skew[i])
+    
+    # ~~~~~~~~ pairing statistics ~~~~~~~~
+    def report(self):
+        return {'tolerance': self.tolerance,
+                'matched': dict(self.matched),
+                'unmatched': dict(self.unmatched)}
+    
+    # ~~~~~~~~ forget buffered frames ~~~~~~~~
+    def clear(self):
+        self._frames = {}
+        self._times = {}
+        self._count = {}
+        
+        return
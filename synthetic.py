@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Software stand-in for the Kinect sensor runtime.
+Mimics the subset of PyKinectRuntime used by the toolbox so that the full
+acquisition pipeline can run headless without a physical sensor.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+from __future__ import division
+from __future__ import print_function
+
+import ctypes
+import math
+import numpy
+import time
+
+import kinectv2
+from audio import SyntheticAudioSource
+
+
+# frame description
+class FrameDescription(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, width, height):
+        self.Width = width
+        self.Height = height
+        
+        return
+
+
+# synthetic body
+class SyntheticBody(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self):
+        self.is_tracked = False
+        self.tracking_id = 0
+        self.joints = (kinectv2._Joint * kinectv2.JointType_Count)()
+        
+        return
+
+
+# synthetic body frame
+class SyntheticBodyFrame(object):
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, max_body_count):
+        self.bodies = [SyntheticBody() for _ in range(max_body_count)]
+        self.relative_time = 0
+        
+        return
+
+
+# SyntheticRuntime class
+class SyntheticRuntime(object):
+    
+    # standing pose in camera space (meters) relative to body origin
+    POSE = {kinectv2.JointType_SpineBase: (0.00, 0.00, 0.00),
+            kinectv2.JointType_SpineMid: (0.00, 0.30, 0.00),
+            kinectv2.JointType_Neck: (0.00, 0.58, 0.00),
+            kinectv2.JointType_Head: (0.00, 0.72, 0.00),
+            kinectv2.JointType_ShoulderLeft: (-0.18, 0.52, 0.00),
+            kinectv2.JointType_ElbowLeft: (-0.25, 0.26, 0.00),
+            kinectv2.JointType_WristLeft: (-0.28, 0.02, 0.00),
+            kinectv2.JointType_HandLeft: (-0.29, -0.06, 0.00),
+            kinectv2.JointType_ShoulderRight: (0.18, 0.52, 0.00),
+            kinectv2.JointType_ElbowRight: (0.25, 0.26, 0.00),
+            kinectv2.JointType_WristRight: (0.28, 0.02, 0.00),
+            kinectv2.JointType_HandRight: (0.29, -0.06, 0.00),
+            kinectv2.JointType_HipLeft: (-0.09, -0.05, 0.00),
+            kinectv2.JointType_KneeLeft: (-0.10, -0.45, 0.00),
+            kinectv2.JointType_AnkleLeft: (-0.10, -0.85, 0.00),
+            kinectv2.JointType_FootLeft: (-0.10, -0.90, -0.10),
+            kinectv2.JointType_HipRight: (0.09, -0.05, 0.00),
+            kinectv2.JointType_KneeRight: (0.10, -0.45, 0.00),
+            kinectv2.JointType_AnkleRight: (0.10, -0.85, 0.00),
+            kinectv2.JointType_FootRight: (0.10, -0.90, -0.10),
+            kinectv2.JointType_SpineShoulder: (0.00, 0.52, 0.00),
+            kinectv2.JointType_HandTipLeft: (-0.30, -0.14, 0.00),
+            kinectv2.JointType_ThumbLeft: (-0.26, -0.08, -0.03),
+            kinectv2.JointType_HandTipRight: (0.30, -0.14, 0.00),
+            kinectv2.JointType_ThumbRight: (0.26, -0.08, -0.03)}
+    
+    # approximate Kinect v2 intrinsics
+    DEPTH_INTRINSICS = (365.5, 365.5, 256.0, 212.0)
+    COLOR_INTRINSICS = (1063.0, 1063.0, 960.0, 540.0)
+    COLOR_BASELINE = 0.052
+    
+    # ~~~~~~~~ constructor ~~~~~~~~
+    def __init__(self, frame_source_types=0xff, body_count=1, fps=30, seed=0):
+        # frame sources
+        self._sources = frame_source_types
+        
+        # frame descriptions
+        self.color_frame_desc = FrameDescription(1920, 1080)
+        self.depth_frame_desc = FrameDescription(512, 424)
+        self.infrared_frame_desc = FrameDescription(512, 424)
+        self.body_index_frame_desc = FrameDescription(512, 424)
+        self.max_body_count = kinectv2.BODY_COUNT
+        
+        # simulated bodies and frame rate
+        self._body_count = min(body_count, self.max_body_count)
+        self._period = 1.0 / fps
+        self._random = numpy.random.RandomState(seed)
+        
+        # static frame content
+        h, w = self.color_frame_desc.Height, self.color_frame_desc.Width
+        self._color = numpy.zeros((h, w, 4), dtype=numpy.uint8)
+        self._color[:, :, 0] = numpy.linspace(40, 120, w, dtype=numpy.uint8)[None, :]
+        self._color[:, :, 1] = numpy.linspace(40, 90, h, dtype=numpy.uint8)[:, None]
+        self._color[:, :, 2] = 60
+        self._color[:, :, 3] = 255
+        self._color = self._color.ravel()
+        h, w = self.depth_frame_desc.Height, self.depth_frame_desc.Width
+        self._depth = numpy.empty((h, w), dtype=numpy.uint16)
+        self._depth[:] = numpy.linspace(3500, 4500, h, dtype=numpy.uint16)[:, None]
+        self._depth = self._depth.ravel()
+        
+        # infrared falls off with the square of depth; long exposure is brighter
+        self._infrared = (4e10 / self._depth.astype(numpy.float64) ** 2).astype(numpy.uint16)
+        self._longExposure = numpy.minimum(self._infrared.astype(numpy.uint32) * 3, 65535).astype(numpy.uint16)
+        
+        # frame timing
+        self._start = time.time()
+        self._last_color_frame_access = -1
+        self._last_depth_frame_access = -1
+        self._last_body_frame_access = -1
+        self._last_body_index_frame_access = -1
+        self._last_infrared_frame_access = -1
+        self._last_long_exposure_infrared_frame_access = -1
+        
+        # relative time of the last frame of every stream in 100 ns units like
+        # the SDK RelativeTime of a frame
+        self.relative_times = {}
+        
+        # body frame
+        self._bodyFrame = SyntheticBodyFrame(self.max_body_count)
+        
+        return
+    
+    # ~~~~~~~~ current frame number ~~~~~~~~
+    def _frame_number(self):
+        return int((time.time() - self._start) / self._period)
+    
+    # ~~~~~~~~ new color frame ~~~~~~~~
+    def has_new_color_frame(self):
+        return bool(self._sources & kinectv2.FrameSourceTypes_Color) and \
+               self._frame_number() > self._last_color_frame_access
+    
+    # ~~~~~~~~ new depth frame ~~~~~~~~
+    def has_new_depth_frame(self):
+        return bool(self._sources & kinectv2.FrameSourceTypes_Depth) and \
+               self._frame_number() > self._last_depth_frame_access
+    
+    # ~~~~~~~~ new body frame ~~~~~~~~
+    def has_new_body_frame(self):
+        return bool(self._sources & kinectv2.FrameSourceTypes_Body) and \
+               self._frame_number() > self._last_body_frame_access
+    
+    # ~~~~~~~~ new body index frame ~~~~~~~~
+    def has_new_body_index_frame(self):
+        return bool(self._sources & kinectv2.FrameSourceTypes_BodyIndex) and \
+               self._frame_number() > self._last_body_index_frame_access
+    
+    # ~~~~~~~~ new infrared frame ~~~~~~~~
+    def has_new_infrared_frame(self):
+        return bool(self._sources & kinectv2.FrameSourceTypes_Infrared) and \
+               self._frame_number() > self._last_infrared_frame_access
+    
+    # ~~~~~~~~ new long exposure infrared frame ~~~~~~~~
+    def has_new_long_exposure_infrared_frame(self):
+        return bool(self._sources & kinectv2.FrameSourceTypes_LongExposureInfrared) and \
+               self._frame_number() > self._last_long_exposure_infrared_frame_access
+    
+    # ~~~~~~~~ last color frame ~~~~~~~~
+    def get_last_color_frame(self):
+        self._last_color_frame_access = self._frame_number()
+        self.relative_times['color'] = int(self._last_color_frame_access * self._period * 1e7)
+        
+        return self._color.copy()
+    
+    # ~~~~~~~~ last depth frame ~~~~~~~~
+    def get_last_depth_frame(self):
+        self._last_depth_frame_access = self._frame_number()
+        self.relative_times['depth'] = int(self._last_depth_frame_access * self._period * 1e7)
+        
+        return self._depth.copy()
+    
+    # ~~~~~~~~ last infrared frame ~~~~~~~~
+    def get_last_infrared_frame(self):
+        self._last_infrared_frame_access = self._frame_number()
+        self.relative_times['infrared'] = int(self._last_infrared_frame_access * self._period * 1e7)
+        
+        return self._infrared.copy()
+    
+    # ~~~~~~~~ last long exposure infrared frame ~~~~~~~~
+    def get_last_long_exposure_infrared_frame(self):
+        self._last_long_exposure_infrared_frame_access = self._frame_number()
+        self.relative_times['longexposureinfrared'] = int(self._last_long_exposure_infrared_frame_access * self._period * 1e7)
+        
+        return self._longExposure.copy()
+    
+    # ~~~~~~~~ last body index frame ~~~~~~~~
+    def get_last_body_index_frame(self):
+        # depth space bounding box of each tracked body filled with its index;
+        # pixels of no body are 255 as reported by the sensor
+        self._last_body_index_frame_access = self._frame_number()
+        self.relative_times['bodyindex'] = int(self._last_body_index_frame_access * self._period * 1e7)
+        w, h = self.body_index_frame_desc.Width, self.body_index_frame_desc.Height
+        frame = numpy.full((h, w), 255, dtype=numpy.uint8)
+        fx, fy, cx, cy = self.DEPTH_INTRINSICS
+        for i, body in enumerate(self._bodyFrame.bodies):
+            if not body.is_tracked:
+                continue
+            positions = numpy.array([(joint.Position.x, joint.Position.y, joint.Position.z) for joint in body.joints])
+            z = numpy.maximum(positions[:, 2], 0.1)
+            x = cx + fx * positions[:, 0] / z
+            y = cy - fy * positions[:, 1] / z
+            x0, x1 = int(numpy.clip(x.min() - 8, 0, w)), int(numpy.clip(x.max() + 8, 0, w))
+            y0, y1 = int(numpy.clip(y.min() - 8, 0, h)), int(numpy.clip(y.max() + 8, 0, h))
+            frame[y0:y1, x0:x1] = i
+        
+        return frame.ravel()
+    
+    # ~~~~~~~~ last body frame ~~~~~~~~
+    def get_last_body_frame(self):
+        n = self._frame_number()
+        self._last_body_frame_access = n
+        t = n * self._period
+        for i, body in enumerate(self._bodyFrame.bodies):
+            body.is_tracked = i < self._body_count
+            body.tracking_id = 72057594037927936 + i if body.is_tracked else 0
+            if not body.is_tracked:
+                continue
+            ox = (i - (self._body_count - 1) / 2.0) * 0.5 + 0.1 * math.sin(t + i)
+            oz = 3.0 + 0.3 * math.cos(0.5 * t + i)
+            swing = 0.1 * math.sin(2.0 * t + i)
+            for j in range(kinectv2.JointType_Count):
+                x, y, z = self.POSE[j]
+                if j in (kinectv2.JointType_WristLeft, kinectv2.JointType_HandLeft,
+                         kinectv2.JointType_HandTipLeft, kinectv2.JointType_ThumbLeft):
+                    z -= swing
+                elif j in (kinectv2.JointType_WristRight, kinectv2.JointType_HandRight,
+                           kinectv2.JointType_HandTipRight, kinectv2.JointType_ThumbRight):
+                    z += swing
+                joint = body.joints[j]
+                joint.JointType = j
+                joint.Position.x = ox + x + self._random.normal(0, 0.003)
+                joint.Position.y = y + self._random.normal(0, 0.003)
+                joint.Position.z = oz + z + self._random.normal(0, 0.003)
+                joint.TrackingState = kinectv2.TrackingState_Tracked
+        self._bodyFrame.relative_time = int(t * 1e7)
+        
+        return self._bodyFrame
+    
+    # ~~~~~~~~ project joints ~~~~~~~~
+    def _project(self, joints, intrinsics, baseline, pointType):
+        fx, fy, cx, cy = intrinsics
+        points = (pointType * kinectv2.JointType_Count)()
+        for j in range(kinectv2.JointType_Count):
+            position = joints[j].Position
+            z = max(position.z, 1e-3)
+            points[j].x = cx + fx * (position.x + baseline) / z
+            points[j].y = cy - fy * position.y / z
+        
+        return points
+    
+    # ~~~~~~~~ map joints to color space ~~~~~~~~
+    def body_joints_to_color_space(self, joints):
+        return self._project(joints, self.COLOR_INTRINSICS, self.COLOR_BASELINE, kinectv2._ColorSpacePoint)
+    
+    # ~~~~~~~~ map joints to depth space ~~~~~~~~
+    def body_joints_to_depth_space(self, joints):
+        return self._project(joints, self.DEPTH_INTRINSICS, 0.0, kinectv2._DepthSpacePoint)
+    
+    # ~~~~~~~~ audio beam source ~~~~~~~~
+    def open_audio_source(self):
+        # sub-frame times are relative to the same start as frame times
+        return SyntheticAudioSource(start=self._start)
+    
+    # ~~~~~~~~ surface buffer ~~~~~~~~
+    def surface_as_array(self, surface_buffer_interface):
+        return (ctypes.c_byte * surface_buffer_interface.length).from_buffer(surface_buffer_interface)
+    
+    # ~~~~~~~~ close ~~~~~~~~
+    def close(self):
+        return
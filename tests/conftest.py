@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+Shared test setup for Kinect Toolbox.
+Tests run against the synthetic sensor without a display or a Kinect.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+import os
+import sys
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the audio sub-frame ring.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+import numpy
+
+from audio import AudioRing
+
+
+# ~~~~~~~~ push n numbered sub-frames ~~~~~~~~
+def push(ring, first, n):
+    samples = numpy.arange(first, first + n, dtype=numpy.float32)[:, None].repeat(ring.samples.shape[1], axis=1)
+    times = numpy.arange(first, first + n, dtype=numpy.float64)
+    
+    return ring.push(samples, times, times + 0.5, numpy.zeros(n), numpy.ones(n))
+
+
+# ~~~~~~~~ numbers of waiting sub-frames in ring order ~~~~~~~~
+def pending(ring):
+    views = ring.peek()
+    samples = [samples[:, 0] for samples, log in views]
+    times = [log['sensorTime'] for samples, log in views]
+    
+    return views, numpy.concatenate(samples), numpy.concatenate(times)
+
+
+# ~~~~~~~~ reads in order across the end of the ring ~~~~~~~~
+def test_wrap_around():
+    ring = AudioRing(capacity=8, subframeSamples=4)
+    assert push(ring, 0, 6) == 6
+    ring.release(5)
+    assert push(ring, 6, 6) == 6
+    views, samples, times = pending(ring)
+    assert len(views) == 2
+    assert (samples == numpy.arange(5, 12)).all()
+    assert (times == numpy.arange(5, 12)).all()
+    ring.release(ring.pending())
+    assert ring.pending() == 0
+    assert ring.peek() == []
+    
+    return
+
+
+# ~~~~~~~~ a full ring drops new sub-frames ~~~~~~~~
+def test_full_ring_drops():
+    ring = AudioRing(capacity=8, subframeSamples=4)
+    push(ring, 0, 3)
+    ring.release(3)
+    assert push(ring, 3, 10) == 8
+    assert ring.dropped == 2
+    views, samples, times = pending(ring)
+    assert (samples == numpy.arange(3, 11)).all()
+    ring.release(4)
+    assert push(ring, 20, 4) == 4
+    views, samples, times = pending(ring)
+    assert (samples == numpy.concatenate([numpy.arange(7, 11), numpy.arange(20, 24)])).all()
+    
+    return
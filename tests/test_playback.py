@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of recording playback and background acquisition.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+import numpy
+import pytest
+import time
+
+from acquisition import AcquisitionWorker
+from kinect import KinectRuntime
+from playback import PlaybackRuntime
+from recording import BODY_COUNT, BinaryWriter
+from synthetic import SyntheticRuntime
+
+
+# ~~~~~~~~ short recording of one body ~~~~~~~~
+@pytest.fixture
+def recordingPath(tmp_path):
+    path = str(tmp_path / 'playback.kbin')
+    writer = BinaryWriter(path, bodyCount=BODY_COUNT)
+    for i in range(30):
+        coords = numpy.full((1, 75), i, dtype=numpy.int16)
+        writer.writeFrame(coords, [1], numpy.full((1, 25), 2), i / 30)
+    writer.close()
+    
+    return path
+
+
+# ~~~~~~~~ poll a runtime until playback finished ~~~~~~~~
+def playToEnd(runtime, polls):
+    for _ in range(polls):
+        runtime.getFrame()
+        if runtime.finished():
+            return True
+    
+    return False
+
+
+# ~~~~~~~~ fast playback finishes with and without a body source ~~~~~~~~
+@pytest.mark.parametrize('sources', ['depth,body', 'body', 'depth'])
+def test_fast_playback_finishes(recordingPath, sources):
+    runtime = PlaybackRuntime(recordingPath, realtime=False, loop=False, sources=sources, overlay=False, headless=True)
+    try:
+        assert runtime._kinect.frameCount() == 30
+        assert playToEnd(runtime, 200)
+    finally:
+        runtime.clear()
+    
+    return
+
+
+# ~~~~~~~~ fast playback replays every recorded body frame ~~~~~~~~
+def test_fast_playback_bodies(recordingPath):
+    runtime = PlaybackRuntime(recordingPath, realtime=False, loop=False, sources='body', overlay=False, headless=True)
+    seen = set()
+    try:
+        for _ in range(200):
+            runtime.getFrame()
+            bodies = runtime.bodyData()
+            if len(bodies):
+                seen.add(int(bodies[0][0]))
+            if runtime.finished():
+                break
+    finally:
+        runtime.clear()
+    assert seen == set(range(30))
+    
+    return
+
+
+# ~~~~~~~~ published frames stay valid until refilled ~~~~~~~~
+def test_acquisition_frames():
+    runtime = KinectRuntime(sensor=SyntheticRuntime(body_count=2), sources='depth,body', overlay=False, headless=True)
+    worker = AcquisitionWorker(runtime, capacity=4)
+    worker.start()
+    try:
+        deadline = time.time() + 5.0
+        while worker.buffer.count() < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        frame = worker.buffer.latest()
+        assert frame is not None and frame.valid()
+        assert frame.bodies.shape[0] == 2
+        while worker.buffer.count() < frame.seq + 8 and time.time() < deadline:
+            time.sleep(0.01)
+        assert not frame.valid()
+        frames, cursor, dropped = worker.buffer.read(0, timeout=0)
+        assert frames and all(f.valid() for f in frames)
+    finally:
+        worker.stop()
+        runtime.clear()
+    
+    return
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of binary skeleton recordings.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+import numpy
+import time
+
+from recorder import SkeletonRecorder
+from recording import BODY_COUNT, loadBinary, selectBody, trackedBodies
+
+
+# ~~~~~~~~ frames of two bodies, the second one leaving halfway ~~~~~~~~
+def bodyFrames(count, jointCount=25):
+    frames = []
+    for i in range(count):
+        ids = [7, 9] if i < count // 2 else [7]
+        coords = numpy.array([numpy.full(jointCount * 3, 10 * i + body) for body in ids], dtype=numpy.int16)
+        states = numpy.full((len(ids), jointCount), 2, dtype=numpy.uint8)
+        slots = numpy.array([4, 1][:len(ids)], dtype=numpy.int32)
+        frames.append((coords, ids, states, 100.0 + i / 30, slots))
+    
+    return frames
+
+
+# ~~~~~~~~ write, load and select bodies ~~~~~~~~
+def test_kbin_round_trip(tmp_path):
+    path = str(tmp_path / 'skeleton.kbin')
+    frames = bodyFrames(40)
+    recorder = SkeletonRecorder(path)
+    recorder.start()
+    for coords, ids, states, timestamp, slots in frames:
+        assert recorder.writeFrame(coords, ids, states, timestamp, slots)
+    recorder.stop()
+    assert recorder.dropped == 0
+    
+    records = loadBinary(path)
+    assert len(records) == len(frames)
+    assert records['coords'].shape[1:] == (BODY_COUNT, 25, 3)
+    assert trackedBodies(records) == [7, 9]
+    
+    coords, timestamps = selectBody(records, 7)
+    assert len(coords) == len(frames)
+    assert numpy.allclose(timestamps, [frame[3] for frame in frames])
+    assert (coords[:, 0, 0] == 10 * numpy.arange(len(frames)) + 7).all()
+    
+    coords, timestamps = selectBody(records, 9)
+    assert len(coords) == len(frames) // 2
+    assert (coords[:, 0, 0] == 10 * numpy.arange(len(frames) // 2) + 9).all()
+    
+    coords, timestamps = selectBody(records)
+    assert (coords[:, 0, 0] % 10 == 7).all()
+    
+    return
+
+
+# ~~~~~~~~ partial blocks are written without new frames ~~~~~~~~
+def test_partial_block_flush(tmp_path):
+    path = str(tmp_path / 'partial.kbin')
+    recorder = SkeletonRecorder(path, blockFrames=64, flushInterval=0.05)
+    recorder.start()
+    coords, ids, states, timestamp, slots = bodyFrames(1)[0]
+    recorder.writeFrame(coords, ids, states, timestamp, slots)
+    deadline = time.time() + 5.0
+    while recorder.frames == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    frames = recorder.frames
+    recorder.stop()
+    assert frames == 1
+    
+    return
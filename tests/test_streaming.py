@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of skeleton and depth streaming over localhost.
+GitHub: https://github.com/prasunroy/kinect-toolbox
+
+"""
+
+
+# imports
+import numpy
+import threading
+
+from streaming import DEPTH, SKELETON, StreamClient, StreamServer
+
+
+# ~~~~~~~~ skeleton and depth packets reach a tcp client ~~~~~~~~
+def test_tcp_round_trip():
+    server = StreamServer('127.0.0.1', 0)
+    server.start()
+    client = StreamClient('127.0.0.1', server.port, depth=True).connect()
+    coords = numpy.arange(2 * 75, dtype=numpy.int16).reshape(2, 75)
+    ids = numpy.array([3, 5])
+    states = numpy.full((2, 25), 2, dtype=numpy.uint8)
+    depth = (numpy.arange(424 * 512) % 4500).astype(numpy.uint16).reshape(424, 512)
+    
+    # the client is registered once the server has read its subscription
+    stop = threading.Event()
+    def publish():
+        while not stop.wait(0.02):
+            server.publishBodies(coords, ids, states, 12.5)
+            server.publishDepth(depth, 12.5)
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    try:
+        received = {}
+        while len(received) < 2:
+            kind, seq, timestamp, data = client.receive()
+            received[kind] = (timestamp, data)
+    finally:
+        stop.set()
+        publisher.join()
+        client.close()
+        server.stop()
+    
+    timestamp, records = received[SKELETON]
+    assert timestamp == 12.5
+    assert (records['body'] == ids).all()
+    assert (records['state'] == states).all()
+    assert (records['coords'].reshape(2, 75) == coords).all()
+    timestamp, frame = received[DEPTH]
+    assert frame.dtype == numpy.uint16
+    assert (frame == depth).all()
+    
+    return